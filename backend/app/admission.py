@@ -0,0 +1,297 @@
+"""
+===================================================================
+  admission.py — Per-model admission control for generation calls
+===================================================================
+
+This module sits in front of each model client so that traffic spikes
+queue inside the backend instead of turning into upstream 429s and
+retries. Its responsibilities include:
+
+1. Bounding concurrent generations per model.
+2. Enforcing a per-model token-rate budget (token bucket refilled at
+   tokens-per-minute / 60 per second), charged with an estimate up
+   front and settled against the provider's reported usage afterwards.
+3. Queueing waiting requests fairly: one FIFO per user (email), served
+   round-robin, so one heavy user cannot starve the others.
+4. Rejecting immediately with a Retry-After estimate when a user's
+   queue or the model's queue is full (surfaced by the router as HTTP
+   503). A full model queue first sheds the newest waiter of the
+   longest user queue, so a burst from one user cannot crowd out the
+   others' requests.
+5. Reporting queue depth, in-flight calls, wait times and rejections.
+
+===================================================================
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from metrics import REGISTRY
+
+ADMISSION_WAIT = REGISTRY.histogram(
+    "promptlink_admission_wait_seconds", "Time generation requests waited for admission.", ("model",))
+ADMISSION_REJECTED = REGISTRY.counter(
+    "promptlink_admission_rejected_total", "Generation requests rejected because the queue was full.", ("model",))
+
+# Characters per token used to estimate prompt size before the call
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str, max_output_tokens: int) -> int:
+    return len(text) // CHARS_PER_TOKEN + max_output_tokens
+
+# ------------------------------------------------------------------------------
+# Overloaded
+# Raised when a model's queue is full. `retry_after` is a whole number of
+# seconds after which the caller is likely to be admitted.
+# ------------------------------------------------------------------------------
+class Overloaded(Exception):
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"{model} is overloaded, retry after {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+# One admitted call; `settle` corrects the token charge once usage is known
+class Ticket:
+    def __init__(self, scheduler: "ModelScheduler", tokens: int):
+        self.scheduler = scheduler
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: int | None):
+        if actual_tokens is not None:
+            self.scheduler._refund(self.tokens - actual_tokens)
+            self.tokens = actual_tokens
+
+# ======================== Scheduler ========================
+
+# ------------------------------------------------------------------------------
+# ModelScheduler
+#
+# Admission control for one model.
+#   - max_concurrency: generations in flight at once
+#   - tokens_per_minute: token budget (None disables the rate limit)
+#   - max_queue: waiting requests, across all users, before new ones are
+#     rejected or the longest user queue is shed
+#   - max_user_queue: waiting requests per user
+# Runs on the event loop only, so plain attributes need no locking.
+# ------------------------------------------------------------------------------
+class ModelScheduler:
+    def __init__(self, model: str, max_concurrency: int, tokens_per_minute: int | None = None,
+                 max_queue: int = 64, max_user_queue: int = 16):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+
+        self.in_flight = 0
+        self._queues = OrderedDict()     # user -> deque of (future, tokens), in round-robin order
+        self._waiting = 0
+        self._tokens = float(tokens_per_minute or 0)
+        self._refilled_at = time.monotonic()
+        self._timer = None
+        self._service_time = 1.0         # EMA of seconds a slot is held, for Retry-After
+
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+    # ---- Token bucket ----
+
+    def _refill(self):
+        if self.tokens_per_minute is None:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.tokens_per_minute,
+                           self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60)
+        self._refilled_at = now
+
+    def _has_tokens(self, tokens: int) -> bool:
+        if self.tokens_per_minute is None:
+            return True
+        self._refill()
+        # A request larger than the whole budget is admitted once the bucket is full
+        return self._tokens >= min(tokens, self.tokens_per_minute)
+
+    def _refund(self, tokens: int):
+        if self.tokens_per_minute is not None:
+            self._refill()
+            self._tokens = min(self.tokens_per_minute, self._tokens + tokens)
+            self._dispatch()
+
+    # ---- Queue ----
+
+    def _admit(self, tokens: int):
+        self.in_flight += 1
+        self.admitted += 1
+        if self.tokens_per_minute is not None:
+            self._tokens -= tokens
+
+    def _next_waiter(self):
+        # Head of the user queue whose turn it is (round-robin over users)
+        for user, waiters in self._queues.items():
+            while waiters and waiters[0][0].cancelled():
+                waiters.popleft()
+                self._waiting -= 1
+            if waiters:
+                return user, waiters
+        return None, None
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            user, waiters = self._next_waiter()
+            if waiters is None:
+                self._queues.clear()
+                return
+            future, tokens = waiters[0]
+            if not self._has_tokens(tokens):
+                self._schedule_refill(tokens)
+                return
+            waiters.popleft()
+            self._waiting -= 1
+            # Move the user to the back so the next grant goes to someone else
+            self._queues.move_to_end(user)
+            if not waiters:
+                del self._queues[user]
+            self._admit(tokens)
+            future.set_result(None)
+
+    def _schedule_refill(self, tokens: int):
+        if self._timer is not None:
+            return
+        deficit = min(tokens, self.tokens_per_minute) - self._tokens
+        delay = max(0.01, deficit * 60 / self.tokens_per_minute)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_refill)
+
+    def _on_refill(self):
+        self._timer = None
+        self._dispatch()
+
+    def _reject(self) -> Overloaded:
+        self.rejected += 1
+        ADMISSION_REJECTED.inc(model=self.model)
+        return Overloaded(self.model, self.retry_after())
+
+    def _shed_for(self, user: str) -> bool:
+        # Full model queue: drop the newest waiter of the longest user queue,
+        # unless the caller's own queue would then be as long
+        longest_user, longest = max(self._queues.items(), key=lambda item: len(item[1]))
+        if longest_user == user or len(longest) <= len(self._queues.get(user, ())) + 1:
+            return False
+        future, _ = longest.pop()
+        self._waiting -= 1
+        if not longest:
+            del self._queues[longest_user]
+        if not future.cancelled():
+            self.shed += 1
+            future.set_exception(self._reject())
+        return True
+
+    def retry_after(self) -> int:
+        waves = (self._waiting + self.in_flight) / max(1, self.max_concurrency)
+        return max(1, math.ceil(waves * self._service_time))
+
+    # --------------------------------------------------------------------------
+    # acquire(user, tokens) -> Ticket
+    # Waits for a slot and token budget; raises Overloaded if the user's or
+    # the model's queue is full, or if the request is shed while waiting.
+    # --------------------------------------------------------------------------
+    async def acquire(self, user: str, tokens: int) -> Ticket:
+        if not self._queues and self.in_flight < self.max_concurrency and self._has_tokens(tokens):
+            self._admit(tokens)
+            ADMISSION_WAIT.observe(0.0, model=self.model)
+            return Ticket(self, tokens)
+
+        if len(self._queues.get(user, ())) >= self.max_user_queue:
+            raise self._reject()
+        if self._waiting >= self.max_queue and not self._shed_for(user):
+            raise self._reject()
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._queues.setdefault(user, deque())
+        waiters.append((future, tokens))
+        self._waiting += 1
+        self._dispatch()
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if (future, tokens) in waiters:
+                    waiters.remove((future, tokens))
+                    self._waiting -= 1
+                if not waiters and self._queues.get(user) is waiters:
+                    del self._queues[user]
+            else:
+                self.release(Ticket(self, tokens), 0.0)   # granted just as the caller gave up
+            raise
+        ADMISSION_WAIT.observe(time.perf_counter() - start, model=self.model)
+        return Ticket(self, tokens)
+
+    def release(self, ticket: Ticket, held_seconds: float):
+        self.in_flight -= 1
+        self._service_time = 0.9 * self._service_time + 0.1 * held_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user: str | None, tokens: int):
+        ticket = await self.acquire(user or "anonymous", tokens)
+        start = time.perf_counter()
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self._waiting,
+            "queued_users": len(self._queues),
+            "tokens_available": None if self.tokens_per_minute is None else int(self._tokens),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+        }
+
+# ======================== Registry ========================
+
+# ------------------------------------------------------------------------------
+# parse_limits(spec) -> dict
+# Parses "model=concurrency:tokens_per_minute,..." (tokens optional), e.g.
+# "gpt-4o=8:30000,gpt-3.5-turbo=32:90000,gemini-2.0-flash=16".
+# ------------------------------------------------------------------------------
+def parse_limits(spec: str) -> dict:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = item.partition("=")
+        concurrency, _, tpm = values.partition(":")
+        limits[model.strip()] = (int(concurrency), int(tpm) if tpm else None)
+    return limits
+
+# ------------------------------------------------------------------------------
+# AdmissionController
+# One ModelScheduler per configured model; models without limits are
+# passed through unthrottled.
+# ------------------------------------------------------------------------------
+class AdmissionController:
+    def __init__(self, limits: dict, max_queue: int = 64, max_output_tokens: int = 500,
+                 max_user_queue: int = 16):
+        self.max_output_tokens = max_output_tokens
+        self.schedulers = {
+            model: ModelScheduler(model, concurrency, tpm, max_queue, max_user_queue)
+            for model, (concurrency, tpm) in limits.items()
+        }
+
+    @asynccontextmanager
+    async def slot(self, model: str, user: str | None, prompt: str):
+        scheduler = self.schedulers.get(model)
+        if scheduler is None:
+            yield None
+            return
+        async with scheduler.slot(user, estimate_tokens(prompt, self.max_output_tokens)) as ticket:
+            yield ticket
+
+    def stats(self) -> dict:
+        return {model: scheduler.stats() for model, scheduler in self.schedulers.items()}
@@ -0,0 +1,359 @@
+"""
+===================================================================
+  analytics.py — Precomputed analytics over the interaction graph
+===================================================================
+
+Dashboard questions such as "average score per model per intent per
+day" would otherwise scan every Response node. This module keeps the
+answers as small aggregate nodes instead, so a dashboard reads a few
+rows no matter how large the graph grows. Its responsibilities include:
+
+1. Folding each batch the Neo4j writer flushes into per-key deltas
+   (new responses, late score corrections, cache hits), applied with
+   one UNWIND MERGE per aggregate kind:
+     (:DailyStat {key})  per model, intent and UTC day
+     (:UserStat {email}) per user, all time
+   Each holds the response count, score sum, an 11-bin score histogram
+   (0, 10, ..., 100), latency sum/count and cache hits.
+2. Reading the aggregates back for the analytics API: daily rows,
+   a per-model / per-intent summary over a window and one user's totals.
+3. Rebuilding the response-derived fields from the Response nodes,
+   for backfilling history or after a bulk re-score (rescoring.py).
+   Cache hits are not stored as nodes, so they are kept as they are.
+4. Backfilling the user's email onto Response nodes logged before it
+   was stored there, from (:User)-[:ASKED]->(:Prompt)-[:GOT_RESPONSE]->,
+   so per-user rebuilds cover the whole history. Responses to a prompt
+   asked by several users cannot be attributed and stay anonymous. This
+   runs as part of a full --rebuild, never at server start-up.
+
+Usage (from backend/app/):
+    python analytics.py --rebuild             # every day and every user
+    python analytics.py --rebuild --days 7    # daily rows of the last week
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+# Score histogram bins: scores are rounded to the nearest 10 (0..100)
+SCORE_BINS = 11
+
+STAT_FIELDS = """
+    s.responses = s.responses + row.responses,
+    s.score_sum = s.score_sum + row.score_sum,
+    s.score_hist = [k IN range(0, size(s.score_hist) - 1) | s.score_hist[k] + row.score_hist[k]],
+    s.latency_sum = s.latency_sum + row.latency_sum,
+    s.latency_n = s.latency_n + row.latency_n,
+    s.cache_hits = s.cache_hits + row.cache_hits,
+    s.updated_at = datetime()
+"""
+
+EMPTY_FIELDS = """
+    s.responses = 0, s.score_sum = 0.0, s.score_hist = [k IN range(1, $bins) | 0],
+    s.latency_sum = 0.0, s.latency_n = 0
+"""
+
+DAILY_ROLLUP_QUERY = f"""
+UNWIND $rows AS row
+MERGE (s:DailyStat {{key: row.key}})
+  ON CREATE SET s.day = row.day, s.model = row.model, s.intent = row.intent, s.cache_hits = 0,{EMPTY_FIELDS}
+SET {STAT_FIELDS}
+"""
+
+USER_ROLLUP_QUERY = f"""
+UNWIND $rows AS row
+MERGE (s:UserStat {{email: row.email}})
+  ON CREATE SET s.first_seen = row.first_seen, s.cache_hits = 0,{EMPTY_FIELDS}
+SET {STAT_FIELDS},
+    s.first_seen = CASE WHEN row.first_seen < s.first_seen THEN row.first_seen ELSE s.first_seen END,
+    s.last_seen = CASE WHEN s.last_seen IS NULL OR row.last_seen > s.last_seen THEN row.last_seen ELSE s.last_seen END
+"""
+
+DAILY_QUERY = """
+MATCH (s:DailyStat)
+WHERE s.day >= $since
+  AND ($model IS NULL OR s.model = $model)
+  AND ($intent IS NULL OR s.intent = $intent)
+RETURN s.day AS day, s.model AS model, s.intent AS intent, s.responses AS responses,
+       s.score_sum AS score_sum, s.score_hist AS score_hist, s.latency_sum AS latency_sum,
+       s.latency_n AS latency_n, s.cache_hits AS cache_hits
+ORDER BY s.day, s.model, s.intent
+"""
+
+USER_QUERY = """
+MATCH (s:UserStat {email: $email})
+RETURN s.email AS email, s.responses AS responses, s.score_sum AS score_sum,
+       s.score_hist AS score_hist, s.latency_sum AS latency_sum, s.latency_n AS latency_n,
+       s.cache_hits AS cache_hits, s.first_seen AS first_seen, s.last_seen AS last_seen
+"""
+
+# Roll-up from the Response nodes, grouped down to the histogram bin
+REBUILD_DAILY_QUERY = """
+MATCH (i:Intent)-[:TRIGGERED]->(r:Response)<-[:GENERATED]-(m:Model)
+WHERE r.timestamp >= datetime($since)
+RETURN toString(date(r.timestamp)) AS day, m.name AS model, i.type AS intent,
+       toInteger(round(coalesce(r.score, 0) / 10.0)) AS bin, count(r) AS responses,
+       sum(coalesce(r.score, 0)) AS score_sum, sum(r.latency_ms) AS latency_sum,
+       count(r.latency_ms) AS latency_n
+"""
+
+REBUILD_USERS_QUERY = """
+MATCH (r:Response) WHERE r.email IS NOT NULL
+RETURN r.email AS email, toInteger(round(coalesce(r.score, 0) / 10.0)) AS bin, count(r) AS responses,
+       sum(coalesce(r.score, 0)) AS score_sum, sum(r.latency_ms) AS latency_sum,
+       count(r.latency_ms) AS latency_n, toString(min(r.timestamp)) AS first_seen,
+       toString(max(r.timestamp)) AS last_seen
+"""
+
+# One page of prompts, keyset on the uniquely indexed Prompt.key so each page
+# is an index range seek: their responses without an email get the asking
+# user's, when exactly one user asked the prompt
+BACKFILL_EMAIL_QUERY = """
+MATCH (p:Prompt) WHERE p.key > $after
+WITH p ORDER BY p.key LIMIT $limit
+OPTIONAL MATCH (u:User)-[:ASKED]->(p)
+WITH p, collect(DISTINCT u.email) AS emails
+OPTIONAL MATCH (p)-[:GOT_RESPONSE]->(r:Response)
+WHERE r.email IS NULL AND size(emails) = 1
+SET r.email = emails[0]
+RETURN max(p.key) AS last, count(r) AS updated
+"""
+
+# One-off data migrations: the page cursor is saved as they go, so an
+# interrupted run resumes, and completion is recorded
+MIGRATION_STATE_QUERY = """
+MATCH (m:Migration {name: $name})
+RETURN m.completed_at IS NOT NULL AS done, m.cursor AS cursor
+"""
+MIGRATION_CURSOR_QUERY = "MERGE (m:Migration {name: $name}) SET m.cursor = $cursor"
+MIGRATION_MARK_QUERY = "MERGE (m:Migration {name: $name}) SET m.completed_at = datetime()"
+
+RESET_DAILY_QUERY = f"MATCH (s:DailyStat) WHERE s.day >= $since SET {EMPTY_FIELDS}"
+RESET_USERS_QUERY = f"MATCH (s:UserStat) SET {EMPTY_FIELDS}"
+
+# ======================== Roll-up ========================
+
+def score_bin(score: float | None) -> int:
+    # Half-up like Cypher's round(), clamped to the histogram
+    return min(SCORE_BINS - 1, max(0, int((score or 0) / 10 + 0.5)))
+
+def daily_key(day: str, model: str, intent: str) -> str:
+    return f"{day}|{model}|{intent}"
+
+def empty_totals() -> dict:
+    return {"responses": 0, "score_sum": 0.0, "score_hist": [0] * SCORE_BINS,
+            "latency_sum": 0.0, "latency_n": 0, "cache_hits": 0}
+
+# ------------------------------------------------------------------------------
+# Rollup
+# Per-key deltas for one writer batch. `daily_rows()` and `user_rows()`
+# return the parameters for DAILY_ROLLUP_QUERY and USER_ROLLUP_QUERY.
+# ------------------------------------------------------------------------------
+class Rollup:
+    def __init__(self):
+        self.daily = {}
+        self.users = {}
+
+    def _totals(self, day: str, model: str, intent: str, email: str | None, timestamp: str) -> list:
+        key = daily_key(day, model, intent)
+        if key not in self.daily:
+            self.daily[key] = {"key": key, "day": day, "model": model, "intent": intent, **empty_totals()}
+        totals = [self.daily[key]]
+        if email is not None:
+            if email not in self.users:
+                self.users[email] = {"email": email, "first_seen": timestamp, "last_seen": timestamp,
+                                     **empty_totals()}
+            user = self.users[email]
+            user["first_seen"] = min(user["first_seen"], timestamp)
+            user["last_seen"] = max(user["last_seen"], timestamp)
+            totals.append(user)
+        return totals
+
+    # A new Response row as queued by Neo4jWriter.submit()
+    def add_response(self, row: dict):
+        bin_ = score_bin(row["score"])
+        for totals in self._totals(row["timestamp"][:10], row["model"], row["intent"], row["email"], row["timestamp"]):
+            totals["responses"] += 1
+            totals["score_sum"] += row["score"] or 0
+            totals["score_hist"][bin_] += 1
+            if row.get("latency_ms") is not None:
+                totals["latency_sum"] += row["latency_ms"]
+                totals["latency_n"] += 1
+
+    # A late score correction: moves the response between histogram bins
+    def rescore(self, record):
+        if record["previous"] == record["score"]:
+            return
+        for totals in self._totals(record["day"], record["model"], record["intent"], record["email"],
+                                   record["timestamp"]):
+            totals["score_sum"] += (record["score"] or 0) - (record["previous"] or 0)
+            totals["score_hist"][score_bin(record["previous"])] -= 1
+            totals["score_hist"][score_bin(record["score"])] += 1
+
+    # A request answered from the semantic cache (nothing else is logged for it)
+    def add_hit(self, row: dict):
+        for totals in self._totals(row["timestamp"][:10], row["model"], row["intent"], row["email"], row["timestamp"]):
+            totals["cache_hits"] += 1
+
+    def daily_rows(self) -> list:
+        return list(self.daily.values())
+
+    def user_rows(self) -> list:
+        return list(self.users.values())
+
+# ======================== Reads ========================
+
+# ------------------------------------------------------------------------------
+# summarize(totals) -> dict
+# Derived view of one aggregate: mean score and latency, the histogram
+# keyed by score and the share of requests answered from the cache.
+# ------------------------------------------------------------------------------
+def summarize(totals) -> dict:
+    responses, hits = totals["responses"], totals["cache_hits"]
+    return {
+        "responses": responses,
+        "cache_hits": hits,
+        "cache_hit_rate": round(hits / (responses + hits), 4) if responses + hits else None,
+        "mean_score": round(totals["score_sum"] / responses, 2) if responses else None,
+        "mean_latency_ms": round(totals["latency_sum"] / totals["latency_n"], 1) if totals["latency_n"] else None,
+        "score_histogram": {str(k * 10): n for k, n in enumerate(totals["score_hist"])},
+    }
+
+def merge_totals(into: dict, totals) -> dict:
+    for field in ("responses", "score_sum", "latency_sum", "latency_n", "cache_hits"):
+        into[field] += totals[field]
+    into["score_hist"] = [a + b for a, b in zip(into["score_hist"], totals["score_hist"])]
+    return into
+
+def since_day(days: int) -> str:
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+async def daily_stats(driver, days: int = 7, model: str | None = None, intent: str | None = None) -> list:
+    records, _, _ = await driver.execute_query(DAILY_QUERY, since=since_day(days), model=model, intent=intent)
+    return [{"day": r["day"], "model": r["model"], "intent": r["intent"], **summarize(r)} for r in records]
+
+# ------------------------------------------------------------------------------
+# summary(driver, days) -> dict
+# Totals over the last `days` days, overall and per model and intent,
+# folded from the daily rows (at most days x models x intents of them).
+# ------------------------------------------------------------------------------
+async def summary(driver, days: int = 7) -> dict:
+    records, _, _ = await driver.execute_query(DAILY_QUERY, since=since_day(days), model=None, intent=None)
+    total, by_model, by_intent = empty_totals(), {}, {}
+    for record in records:
+        merge_totals(total, record)
+        merge_totals(by_model.setdefault(record["model"], empty_totals()), record)
+        merge_totals(by_intent.setdefault(record["intent"], empty_totals()), record)
+    return {
+        "days": days,
+        "total": summarize(total),
+        "by_model": {model: summarize(totals) for model, totals in sorted(by_model.items())},
+        "by_intent": {intent: summarize(totals) for intent, totals in sorted(by_intent.items())},
+    }
+
+async def user_stats(driver, email: str) -> dict | None:
+    records, _, _ = await driver.execute_query(USER_QUERY, email=email)
+    if not records:
+        return None
+    record = records[0]
+    return {"email": record["email"], "first_seen": record["first_seen"], "last_seen": record["last_seen"],
+            **summarize(record)}
+
+# ======================== Rebuild ========================
+
+# ------------------------------------------------------------------------------
+# backfill_response_emails(driver, batch_size=1000) -> int
+# Sets `email` on Response nodes written before the writer stored it.
+# Runs once per graph (recorded as a Migration node) and resumes from the
+# last finished page if interrupted. Expects the schema (the Prompt.key
+# constraint) to exist. Returns the number of responses updated.
+# ------------------------------------------------------------------------------
+async def backfill_response_emails(driver, batch_size: int = 1000) -> int:
+    records, _, _ = await driver.execute_query(MIGRATION_STATE_QUERY, name="response_email")
+    if records and records[0]["done"]:
+        return 0
+    updated, after = 0, (records[0]["cursor"] if records else None) or ""
+    while True:
+        records, _, _ = await driver.execute_query(BACKFILL_EMAIL_QUERY, after=after, limit=batch_size)
+        if not records or records[0]["last"] is None:
+            break
+        updated += records[0]["updated"]
+        after = records[0]["last"]
+        await driver.execute_query(MIGRATION_CURSOR_QUERY, name="response_email", cursor=after)
+    await driver.execute_query(MIGRATION_MARK_QUERY, name="response_email")
+    return updated
+
+def fold_bins(records, key_fields: tuple) -> dict:
+    # REBUILD_* rows are split by histogram bin; fold them per key
+    groups = {}
+    for record in records:
+        key = tuple(record[field] for field in key_fields)
+        totals = groups.setdefault(key, {**{f: record[f] for f in key_fields}, **empty_totals()})
+        for field in ("responses", "score_sum", "latency_sum", "latency_n"):
+            totals[field] += record[field] or 0
+        totals["score_hist"][min(SCORE_BINS - 1, max(0, record["bin"]))] += record["responses"]
+        if "first_seen" in record.keys():
+            totals["first_seen"] = min(totals.get("first_seen") or record["first_seen"], record["first_seen"])
+            totals["last_seen"] = max(totals.get("last_seen") or record["last_seen"], record["last_seen"])
+    return groups
+
+# ------------------------------------------------------------------------------
+# rebuild_aggregates(driver, days=None) -> dict
+#
+# Recomputes the response-derived fields from the Response nodes: daily
+# rows of the last `days` days (all of them when None) and, on a full
+# rebuild, every user (after backfilling emails on old responses, see
+# backfill_response_emails). Live writes landing during a rebuild may be
+# counted twice, so run it while traffic is paused or re-run it after.
+# ------------------------------------------------------------------------------
+async def rebuild_aggregates(driver, days: int | None = None) -> dict:
+    start = time.perf_counter()
+    since = since_day(days) if days else "0001-01-01"
+
+    records, _, _ = await driver.execute_query(REBUILD_DAILY_QUERY, since=f"{since}T00:00:00Z")
+    daily = [{"key": daily_key(*key), **totals, "cache_hits": 0}
+             for key, totals in fold_bins(records, ("day", "model", "intent")).items()]
+    await driver.execute_query(RESET_DAILY_QUERY, since=since, bins=SCORE_BINS)
+    if daily:
+        await driver.execute_query(DAILY_ROLLUP_QUERY, rows=daily, bins=SCORE_BINS)
+
+    users = []
+    if days is None:
+        await backfill_response_emails(driver)
+        records, _, _ = await driver.execute_query(REBUILD_USERS_QUERY)
+        users = [{**totals, "cache_hits": 0} for totals in fold_bins(records, ("email",)).values()]
+        await driver.execute_query(RESET_USERS_QUERY, bins=SCORE_BINS)
+        if users:
+            await driver.execute_query(USER_ROLLUP_QUERY, rows=users, bins=SCORE_BINS)
+
+    return {"daily_rows": len(daily), "users": len(users), "seconds": round(time.perf_counter() - start, 2)}
+
+# ======================== Command Line ========================
+
+async def run(args):
+    import utils
+    from neo4j_writer import ensure_schema
+    await utils.ensure_clients()
+    try:
+        # The email backfill pages on the Prompt.key constraint
+        await ensure_schema(utils.driver)
+        summary_ = await rebuild_aggregates(utils.driver, args.days)
+    finally:
+        await utils.close_clients()
+    print(summary_)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the precomputed analytics aggregates.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute aggregates from the Response nodes")
+    parser.add_argument("--days", type=int, default=None, help="only rebuild daily rows of the last N days")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do (use --rebuild)")
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
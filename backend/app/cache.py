@@ -0,0 +1,333 @@
+"""
+===================================================================
+  cache.py — Vectorized semantic response cache
+===================================================================
+
+This module implements the semantic cache used by the prompt router
+to reuse responses for prompts that are near-duplicates of earlier
+ones. Its responsibilities include:
+
+1. Storing pre-normalized float32 embeddings in contiguous matrices,
+   partitioned by intent.
+2. Answering lookups with a single batched matrix-vector product
+   instead of a per-entry Python loop.
+3. Optionally switching large partitions to an IVF-style approximate
+   nearest-neighbour index so lookups only scan a few clusters.
+4. Evicting entries by true LRU order (hits refresh recency) and by
+   an optional time-to-live.
+5. Defining the CacheBackend interface shared with the on-disk backend
+   (disk_cache.py) and snapshotting the in-memory cache for warm starts.
+
+===================================================================
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+# ======================== Cache Entry ========================
+
+# Result of a successful cache lookup
+class CacheEntry(NamedTuple):
+    intent: str
+    response: str
+    model: str
+    similarity: float
+
+# ======================== Helpers ========================
+
+# ------------------------------------------------------------------------------
+# normalize(vec) -> np.ndarray
+# Converts an embedding into a unit-length float32 vector so cosine
+# similarity reduces to a dot product.
+# ------------------------------------------------------------------------------
+def normalize(vec) -> np.ndarray:
+    arr = np.asarray(vec, dtype=np.float32).ravel()
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm > 0 else arr
+
+# ------------------------------------------------------------------------------
+# kmeans(data, k, iterations) -> np.ndarray
+# Small spherical k-means used to train the IVF centroids of a partition.
+# Returns a (k, dim) matrix of unit-length centroids.
+# ------------------------------------------------------------------------------
+def kmeans(data: np.ndarray, k: int, iterations: int = 8) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = normalize(members.sum(axis=0))
+    return centroids
+
+# ======================== Intent Partition ========================
+
+# ------------------------------------------------------------------------------
+# _Partition
+#
+# Holds every cached vector for a single intent in one growable float32
+# matrix. Freed rows are recycled through a free list and masked out of
+# lookups. When ANN mode is enabled and the partition is large enough,
+# rows are also bucketed into inverted lists around k-means centroids.
+# ------------------------------------------------------------------------------
+class _Partition:
+    def __init__(self, dim: int, ann: bool, ann_min_size: int, n_probe: int):
+        self.matrix = np.zeros((16, dim), dtype=np.float32)
+        self.keys = [None] * 16
+        self.active = np.zeros(16, dtype=bool)
+        self.free = []
+        self.size = 0
+        self.high_water = 0
+
+        self.ann = ann
+        self.ann_min_size = ann_min_size
+        self.n_probe = n_probe
+        self.centroids = None
+        self.lists = []
+        self.slot_list = {}
+        self.trained_size = 0
+
+    def _grow(self):
+        new_rows = len(self.matrix) * 2
+        matrix = np.zeros((new_rows, self.matrix.shape[1]), dtype=np.float32)
+        matrix[:len(self.matrix)] = self.matrix
+        active = np.zeros(new_rows, dtype=bool)
+        active[:len(self.active)] = self.active
+        self.keys.extend([None] * (new_rows - len(self.keys)))
+        self.matrix, self.active = matrix, active
+
+    def add(self, key: int, vec: np.ndarray) -> int:
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.high_water == len(self.matrix):
+                self._grow()
+            slot = self.high_water
+            self.high_water += 1
+        self.matrix[slot] = vec
+        self.keys[slot] = key
+        self.active[slot] = True
+        self.size += 1
+
+        if self.centroids is not None:
+            self._assign(slot)
+        if self.ann and self.size >= self.ann_min_size and self.size >= 2 * self.trained_size:
+            self._train()
+        return slot
+
+    def remove(self, slot: int):
+        self.active[slot] = False
+        self.keys[slot] = None
+        self.free.append(slot)
+        self.size -= 1
+        list_id = self.slot_list.pop(slot, None)
+        if list_id is not None:
+            self.lists[list_id].discard(slot)
+
+    def _assign(self, slot: int):
+        list_id = int(np.argmax(self.centroids @ self.matrix[slot]))
+        self.lists[list_id].add(slot)
+        self.slot_list[slot] = list_id
+
+    def _train(self):
+        slots = np.flatnonzero(self.active[:self.high_water])
+        k = max(1, int(np.sqrt(len(slots))))
+        self.centroids = kmeans(self.matrix[slots], k)
+        self.lists = [set() for _ in range(k)]
+        self.slot_list = {}
+        for slot in slots:
+            self._assign(int(slot))
+        self.trained_size = len(slots)
+
+    def search(self, query: np.ndarray):
+        if self.size == 0:
+            return None, -1.0
+
+        if self.centroids is not None:
+            # Probe only the closest inverted lists
+            probe = np.argsort(self.centroids @ query)[::-1][:self.n_probe]
+            candidates = np.fromiter(
+                (slot for list_id in probe for slot in self.lists[list_id]), dtype=np.int64
+            )
+            if len(candidates) == 0:
+                return None, -1.0
+            sims = self.matrix[candidates] @ query
+            best = int(np.argmax(sims))
+            return int(candidates[best]), float(sims[best])
+
+        # Exact search: one matrix-vector product over the used rows
+        sims = self.matrix[:self.high_water] @ query
+        sims[~self.active[:self.high_water]] = -1.0
+        best = int(np.argmax(sims))
+        return best, float(sims[best])
+
+# ======================== Backend Interface ========================
+
+# ------------------------------------------------------------------------------
+# CacheBackend
+#
+# Interface used by route_prompt/enhance_prompt. Implementations:
+#   - SemanticCache: per-process, in-memory (this module)
+#   - DiskCache: memory-mapped storage shared across workers (disk_cache.py)
+# ------------------------------------------------------------------------------
+class CacheBackend:
+    def lookup(self, vec, intent: str | None, threshold: float) -> CacheEntry | None:
+        raise NotImplementedError
+
+    def add(self, vec, intent: str, response: str, model: str):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # Persist the current entries so a new process can warm-start from them
+    def snapshot(self):
+        pass
+
+# ======================== Semantic Cache ========================
+
+# ------------------------------------------------------------------------------
+# SemanticCache
+#
+# Similarity-based response cache with LRU and TTL eviction.
+#   - capacity: maximum number of entries across all intents
+#   - ttl: seconds an entry stays valid (None disables expiry)
+#   - ann: enable IVF approximate search for large partitions
+#   - ann_min_size: partition size at which the IVF index is trained
+#   - n_probe: number of inverted lists scanned per ANN lookup
+#   - snapshot_path: optional .npz file loaded on creation and written
+#     by snapshot(), so restarts keep the cache warm
+# ------------------------------------------------------------------------------
+class SemanticCache(CacheBackend):
+    def __init__(self, capacity: int = 100, ttl: float | None = None,
+                 ann: bool = False, ann_min_size: int = 1024, n_probe: int = 4,
+                 snapshot_path: str | None = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.ann = ann
+        self.ann_min_size = ann_min_size
+        self.n_probe = n_probe
+        self.snapshot_path = snapshot_path
+
+        self._partitions = {}
+        self._entries = OrderedDict()     # key -> [intent, slot, response, model, created_at], in LRU order
+        self._created = OrderedDict()     # key -> created_at, in insertion (= expiry) order
+        self._next_key = 0
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._partitions.clear()
+        self._entries.clear()
+        self._created.clear()
+
+    def _partition(self, intent: str, dim: int) -> _Partition:
+        partition = self._partitions.get(intent)
+        if partition is None:
+            partition = _Partition(dim, self.ann, self.ann_min_size, self.n_probe)
+            self._partitions[intent] = partition
+        return partition
+
+    def _evict(self, key: int):
+        intent, slot = self._entries.pop(key)[:2]
+        self._created.pop(key, None)
+        self._partitions[intent].remove(slot)
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        while self._created:
+            key, created_at = next(iter(self._created.items()))
+            if created_at > cutoff:
+                break
+            self._evict(key)
+
+    # --------------------------------------------------------------------------
+    # lookup(vec, intent, threshold) -> CacheEntry | None
+    # Returns the most similar cached entry for the intent if its cosine
+    # similarity exceeds the threshold. Passing intent=None searches every
+    # partition and returns the best match across intents. A hit refreshes
+    # the entry's recency.
+    # --------------------------------------------------------------------------
+    def lookup(self, vec, intent: str | None, threshold: float) -> CacheEntry | None:
+        self._expire()
+        if intent is None:
+            partitions = list(self._partitions.values())
+        else:
+            partitions = [self._partitions[intent]] if intent in self._partitions else []
+
+        query = normalize(vec)
+        best_partition, best_slot, best_similarity = None, None, threshold
+        for partition in partitions:
+            slot, similarity = partition.search(query)
+            if slot is not None and similarity > best_similarity:
+                best_partition, best_slot, best_similarity = partition, slot, similarity
+        if best_partition is None:
+            return None
+
+        key = best_partition.keys[best_slot]
+        self._entries.move_to_end(key)
+        entry_intent, _, response, model, _ = self._entries[key]
+        return CacheEntry(entry_intent, response, model, best_similarity)
+
+    # --------------------------------------------------------------------------
+    # add(vec, intent, response, model, created_at=None)
+    # Inserts a new entry, evicting the least recently used one when full.
+    # `created_at` (epoch seconds) is only passed when replaying stored entries.
+    # --------------------------------------------------------------------------
+    def add(self, vec, intent: str, response: str, model: str, created_at: float | None = None):
+        self._expire()
+        while len(self._entries) >= self.capacity:
+            self._evict(next(iter(self._entries)))
+
+        query = normalize(vec)
+        key = self._next_key
+        self._next_key += 1
+        slot = self._partition(intent, len(query)).add(key, query)
+
+        created_at = created_at or time.time()
+        self._entries[key] = [intent, slot, response, model, created_at]
+        self._created[key] = created_at
+
+    # --------------------------------------------------------------------------
+    # save(path) / load(path)
+    # Writes the live entries (in insertion order) to an .npz file holding a
+    # float32 vector matrix plus JSON metadata, and replays such a file.
+    # --------------------------------------------------------------------------
+    def save(self, path: str):
+        self._expire()
+        keys = list(self._created)
+        if not keys:
+            return
+        vectors = np.stack([self._partitions[self._entries[k][0]].matrix[self._entries[k][1]] for k in keys])
+        meta = [
+            {"intent": intent, "response": response, "model": model, "created_at": created_at}
+            for intent, _, response, model, created_at in (self._entries[k] for k in keys)
+        ]
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, vectors=vectors, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        data = np.load(path)
+        for vec, item in zip(data["vectors"], json.loads(str(data["meta"]))):
+            self.add(vec, item["intent"], item["response"], item["model"], item["created_at"])
+        self._expire()
+
+    def snapshot(self):
+        if self.snapshot_path:
+            self.save(self.snapshot_path)
@@ -0,0 +1,177 @@
+"""
+===================================================================
+  cot_scoring.py — Tiered chain-of-thought scoring
+===================================================================
+
+Rating a response's reasoning with an LLM is the most expensive part of
+scoring. This module puts cheaper tiers in front of that judge. Its
+responsibilities include:
+
+1. A local structural scorer (0-10) over step markers, list items,
+   causal connectives and length. Responses it rates clearly low or
+   clearly high are settled without any upstream call.
+2. Batching the borderline responses: concurrent requests' responses
+   are collected for a short window and rated in one LLM call.
+3. Choosing the mode: "llm" (one judge call per response, the previous
+   behaviour), "tiered" (the default) or "local" (no LLM at all).
+4. Reporting how many responses each tier settled and how far the
+   local scores were from the judge's on borderline cases.
+
+===================================================================
+"""
+
+import asyncio
+import re
+
+from metrics import REGISTRY
+
+COT_DECISIONS = REGISTRY.counter(
+    "promptlink_cot_decisions_total", "Chain-of-thought scores, by the tier that settled them.", ("tier",))
+
+# ======================== Structural Scorer ========================
+
+STEP_RE = re.compile(r"\b(step\s*\d+|first(?:ly)?|second(?:ly)?|third(?:ly)?|next|then|finally|lastly)\b", re.I)
+LIST_ITEM_RE = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+", re.M)
+CONNECTIVE_RE = re.compile(
+    r"\b(because|therefore|thus|hence|consequently|as a result|since|which means|this means|so that|for example)\b",
+    re.I)
+
+# ------------------------------------------------------------------------------
+# structural_cot_score(text) -> int
+# 0-10 rating of how visibly step-by-step a response is:
+#   - up to 3 points for distinct step markers ("first", "then", "step 2")
+#   - up to 2 points for list items (numbered or bulleted lines)
+#   - up to 3 points for causal connectives ("because", "therefore")
+#   - up to 2 points for length (60+ / 150+ words)
+# ------------------------------------------------------------------------------
+def structural_cot_score(text: str) -> int:
+    steps = len({match.lower() for match in STEP_RE.findall(text)})
+    items = len(LIST_ITEM_RE.findall(text))
+    connectives = len(CONNECTIVE_RE.findall(text))
+    words = len(text.split())
+    return (min(3, steps)
+            + (2 if items >= 3 else 1 if items else 0)
+            + min(3, connectives)
+            + (2 if words >= 150 else 1 if words >= 60 else 0))
+
+# ======================== Batched Judge ========================
+
+# ------------------------------------------------------------------------------
+# BatchJudge
+#
+# Collects responses for up to `batch_window` seconds (or `max_batch`
+# responses) and rates them with one call to `rate_batch`, an async
+# list[str] -> list[float] function.
+# ------------------------------------------------------------------------------
+class BatchJudge:
+    def __init__(self, rate_batch, max_batch: int = 8, batch_window: float = 0.02):
+        self.rate_batch = rate_batch
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._pending = []
+        self._flush_handle = None
+        self.calls = 0
+
+    async def rate(self, response: str) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((response, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._rate(batch))
+
+    async def _rate(self, batch: list):
+        self.calls += 1
+        try:
+            scores = await self.rate_batch([response for response, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(score)
+
+# ======================== Tiered Scorer ========================
+
+# ------------------------------------------------------------------------------
+# TieredCoTScorer
+#
+#   - judge: async response -> 0-10 (one LLM call), used in "llm" mode
+#   - batch_judge: BatchJudge for borderline responses in "tiered" mode
+#   - low / high: local scores at or below / at or above which the
+#     structural score is final
+#   - mode: "llm", "tiered" or "local"
+# `score(response, ctx)` counts the upstream calls it makes on the
+# request's EvaluationContext.
+# ------------------------------------------------------------------------------
+class TieredCoTScorer:
+    def __init__(self, judge, batch_judge: BatchJudge, low: int = 3, high: int = 7, mode: str = "tiered"):
+        self.judge = judge
+        self.batch_judge = batch_judge
+        self.low = low
+        self.high = high
+        self.mode = mode
+        self.counts = {"local": 0, "batched": 0, "llm": 0}
+        self._gap_sum = 0.0
+
+    def _count(self, tier: str):
+        self.counts[tier] += 1
+        COT_DECISIONS.inc(tier=tier)
+
+    def borderline(self, local: float) -> bool:
+        return self.mode == "tiered" and self.low < local < self.high
+
+    async def score(self, response: str, ctx=None) -> float:
+        if self.mode == "llm":
+            if ctx is not None:
+                ctx.count("llm")
+            self._count("llm")
+            return await self.judge(response)
+
+        local = structural_cot_score(response)
+        if not self.borderline(local):
+            self._count("local")
+            return local
+        return await self.escalate(response, local, ctx)
+
+    # --------------------------------------------------------------------------
+    # escalate(response, local, ctx=None) -> float
+    # Rates a borderline response with the batched judge; keeps the local
+    # score if the judge call fails.
+    # --------------------------------------------------------------------------
+    async def escalate(self, response: str, local: float, ctx=None) -> float:
+        if ctx is not None:
+            ctx.count("llm")
+        self._count("batched")
+        try:
+            rated = await self.batch_judge.rate(response)
+        except Exception:
+            return local
+        self._gap_sum += abs(rated - local)
+        return rated
+
+    # Local score only; used on the response path when judging is deferred
+    async def provisional(self, response: str, ctx=None) -> float:
+        return structural_cot_score(response)
+
+    def stats(self) -> dict:
+        total = max(1, sum(self.counts.values()))
+        return {
+            "mode": self.mode,
+            **self.counts,
+            "local_rate": round(self.counts["local"] / total, 4),
+            "judge_calls": self.batch_judge.calls,
+            "mean_local_gap": round(self._gap_sum / self.counts["batched"], 2) if self.counts["batched"] else None,
+        }
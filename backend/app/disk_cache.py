@@ -0,0 +1,209 @@
+"""
+===================================================================
+  disk_cache.py — Shared, persistent semantic cache backend
+===================================================================
+
+This module implements a CacheBackend whose contents live on disk so
+every uvicorn/gunicorn worker on a host shares one cache and the cache
+survives restarts. Its responsibilities include:
+
+1. Storing pre-normalized embeddings in a memory-mapped float32 ring
+   buffer (vectors.f32) sized capacity x dim.
+2. Recording entry metadata in an append-only JSON-lines log
+   (entries.jsonl); the sequence number of each line selects its
+   vector slot (seq % capacity).
+3. Letting several processes read and write concurrently: writers hold
+   an exclusive flock while writing a vector and appending its line,
+   readers hold a shared flock while tailing the log.
+4. Replaying the log into a local SemanticCache index on start-up
+   (warm start) and incrementally on every lookup, so entries added by
+   other workers become hits without a restart.
+5. Compacting the log to the most recent `capacity` lines once it grows
+   past a multiple of the capacity.
+
+Directory layout:
+    header.json    {"dim": ..., "capacity": ...}
+    vectors.f32    float32 memmap, shape (capacity, dim)
+    entries.jsonl  {"seq", "intent", "response", "model", "created_at"}
+    lock           flock target
+
+===================================================================
+"""
+
+import fcntl
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from cache import CacheBackend, CacheEntry, SemanticCache, normalize
+
+# Rewrite the log once it holds this many times `capacity` lines
+COMPACT_FACTOR = 4
+
+# ------------------------------------------------------------------------------
+# DiskCache
+#
+# Disk-backed CacheBackend.
+#   - directory: where the files above are kept (created if missing)
+#   - capacity: ring size shared by every process using the directory
+#   - ttl, ann, ann_min_size, n_probe: passed to the local SemanticCache
+# Eviction on disk is by insertion order (the ring wraps); the local index
+# additionally applies LRU/TTL for lookups.
+# ------------------------------------------------------------------------------
+class DiskCache(CacheBackend):
+    def __init__(self, directory: str, capacity: int = 10000, ttl: float | None = None,
+                 ann: bool = False, ann_min_size: int = 1024, n_probe: int = 4):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.capacity = capacity
+        self.index = SemanticCache(capacity=capacity, ttl=ttl, ann=ann,
+                                   ann_min_size=ann_min_size, n_probe=n_probe)
+
+        self._header_path = os.path.join(directory, "header.json")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._log_path = os.path.join(directory, "entries.jsonl")
+        self._lock_file = open(os.path.join(directory, "lock"), "a+")
+
+        self._vectors = None
+        self._log = None
+        self._log_inode = None
+        self._offset = 0
+        self._last_seq = -1
+        self._log_lines = 0
+        self._recent = deque(maxlen=capacity)   # raw lines kept for compaction
+
+        # Warm start: replay whatever the log already holds
+        with self._locked(fcntl.LOCK_SH):
+            self._sync()
+
+    # ======================== Locking & Files ========================
+
+    @contextmanager
+    def _locked(self, mode: int):
+        fcntl.flock(self._lock_file, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_vectors(self, dim: int | None = None) -> bool:
+        if self._vectors is not None:
+            return True
+        if not os.path.exists(self._header_path):
+            if dim is None:
+                return False
+            with open(self._header_path, "w") as f:
+                json.dump({"dim": dim, "capacity": self.capacity}, f)
+        with open(self._header_path) as f:
+            header = json.load(f)
+        if header["capacity"] != self.capacity:
+            raise ValueError(f"cache at {self.directory} has capacity {header['capacity']}, not {self.capacity}")
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode,
+                                  shape=(self.capacity, header["dim"]))
+        return True
+
+    def _open_log(self):
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._log_path, "a+", encoding="utf-8")
+        self._log.seek(0)
+        self._log_inode = os.fstat(self._log.fileno()).st_ino
+        self._offset = 0
+        self._log_lines = 0
+
+    # ======================== Replay ========================
+
+    # --------------------------------------------------------------------------
+    # _sync()
+    # Reads log lines appended since the last call (by any process) and adds
+    # them to the local index. Lines whose ring slot has since been reused
+    # are skipped. Must be called while holding the lock.
+    # --------------------------------------------------------------------------
+    def _sync(self):
+        if self._log is None or os.stat(self._log_path).st_ino != self._log_inode:
+            self._open_log()   # first call, or another process compacted the log
+        if os.fstat(self._log.fileno()).st_size == self._offset:
+            return
+
+        self._log.seek(self._offset)
+        lines = self._log.readlines()
+        self._offset = self._log.tell()
+        self._log_lines += len(lines)
+
+        records = [json.loads(line) for line in lines]
+        newest = max((r["seq"] for r in records), default=self._last_seq)
+        if not self._open_vectors():
+            return
+        for line, record in zip(lines, records):
+            seq = record["seq"]
+            self._recent.append(line)
+            if seq <= self._last_seq or seq <= newest - self.capacity:
+                continue
+            self.index.add(self._vectors[seq % self.capacity], record["intent"], record["response"],
+                           record["model"], record["created_at"])
+        self._last_seq = max(self._last_seq, newest)
+
+    def _compact(self):
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(self._recent)
+        os.replace(tmp_path, self._log_path)
+        self._open_log()
+        self._offset = os.path.getsize(self._log_path)
+        self._log_lines = len(self._recent)
+
+    # ======================== CacheBackend API ========================
+
+    def lookup(self, vec, intent: str | None, threshold: float) -> CacheEntry | None:
+        with self._locked(fcntl.LOCK_SH):
+            self._sync()
+        return self.index.lookup(vec, intent, threshold)
+
+    def add(self, vec, intent: str, response: str, model: str):
+        query = normalize(vec)
+        created_at = time.time()
+        with self._locked(fcntl.LOCK_EX):
+            self._sync()
+            self._open_vectors(len(query))
+            seq = self._last_seq + 1
+            self._vectors[seq % self.capacity] = query
+            self._vectors.flush()
+
+            line = json.dumps({"seq": seq, "intent": intent, "response": response,
+                               "model": model, "created_at": created_at}) + "\n"
+            self._log.seek(0, os.SEEK_END)
+            self._log.write(line)
+            self._log.flush()
+            self._offset = self._log.tell()
+            self._log_lines += 1
+            self._recent.append(line)
+            self._last_seq = seq
+
+            if self._log_lines > COMPACT_FACTOR * self.capacity:
+                self._compact()
+        self.index.add(query, intent, response, model, created_at)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def clear(self):
+        with self._locked(fcntl.LOCK_EX):
+            for path in (self._log_path, self._header_path, self._vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._vectors = None
+            self._recent.clear()
+            self._last_seq = -1
+            self._open_log()
+        self.index.clear()
+
+    # The log already persists every entry; compacting keeps warm starts short
+    def snapshot(self):
+        with self._locked(fcntl.LOCK_EX):
+            self._sync()
+            self._compact()
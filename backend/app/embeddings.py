@@ -0,0 +1,238 @@
+"""
+===================================================================
+  embeddings.py — Content-addressed memo layer for embeddings
+===================================================================
+
+This module wraps the embedding client so the same text is never sent
+to the embedding API twice. Its responsibilities include:
+
+1. Keying vectors by a SHA-256 hash of the model name and the text.
+2. Keeping recently used vectors in a bounded in-memory LRU tier.
+3. Optionally persisting vectors as compact float32 blobs in a local
+   SQLite file so they survive restarts. On the async path the file is
+   read and written in a worker thread, never on the event loop.
+4. Collecting misses that arrive within a short window (and identical
+   in-flight misses) into one embed_documents call. Callers share the
+   miss futures, so one cancelled caller never fails the others.
+5. Reporting hit-rate statistics per tier.
+
+===================================================================
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# CachedEmbeddings
+#
+# Drop-in replacement for the LangChain embedding client used by utils.py.
+#   - base: the wrapped client (needs aembed_documents / embed_documents)
+#   - model_name: part of the cache key, so switching models never reuses vectors
+#   - capacity: entries kept in the in-memory LRU tier
+#   - disk_path: optional SQLite file for the on-disk tier
+#   - batch_window: seconds to wait for more misses before calling the API
+#   - max_batch: maximum texts per embed_documents call
+# The SQLite connection is shared by worker threads under `_db_lock`.
+# ------------------------------------------------------------------------------
+class CachedEmbeddings:
+    def __init__(self, base, model_name: str, capacity: int = 10000, disk_path: str | None = None,
+                 batch_window: float = 0.005, max_batch: int = 256):
+        self.base = base
+        self.model_name = model_name
+        self.capacity = capacity
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._pending = []
+        self._flush_handle = None
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+            self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self.disk_errors = 0
+
+    # ======================== Tiers ========================
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _from_memory(self, key: str) -> np.ndarray | None:
+        vec = self._memory.get(key)
+        if vec is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        return vec
+
+    # Blocking SQLite reads and writes; the async path runs them in a thread
+    def _read_disk(self, keys: list) -> dict:
+        found = {}
+        with self._db_lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def _write_disk(self, keys: list, vectors: list):
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(key, vec.tobytes()) for key, vec in zip(keys, vectors)],
+            )
+            self._db.commit()
+
+    # --------------------------------------------------------------------------
+    # _lookup(keys, disk) -> list
+    # Vectors for `keys` (None for misses) from the memory tier, then the
+    # disk tier; disk hits are promoted to memory.
+    # --------------------------------------------------------------------------
+    def _lookup(self, keys: list, disk: dict) -> list:
+        results = []
+        for key in keys:
+            vec = self._from_memory(key)
+            if vec is None and key in disk:
+                vec = disk[key]
+                self._remember(key, vec)
+                self.disk_hits += 1
+            results.append(vec)
+        return results
+
+    def _disk_candidates(self, keys: list) -> list:
+        if self._db is None:
+            return []
+        return [key for key in dict.fromkeys(keys) if key not in self._memory]
+
+    # ======================== Miss Batching ========================
+
+    # --------------------------------------------------------------------------
+    # _miss(key, text) -> asyncio.Future
+    # Registers a miss. Identical in-flight texts share one future; distinct
+    # misses are flushed together after `batch_window` or at `max_batch`.
+    # --------------------------------------------------------------------------
+    def _miss(self, key: str, text: str) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = self._inflight[key] = loop.create_future()
+        self._pending.append((key, text))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._embed_batch(batch))
+
+    def _fail(self, keys: list, error: Exception):
+        for key in keys:
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    async def _embed_batch(self, batch: list):
+        keys = [key for key, _ in batch]
+        try:
+            self.upstream_calls += 1
+            raw = await self.base.aembed_documents([text for _, text in batch])
+            vectors = [np.asarray(vec, dtype=np.float32) for vec in raw]
+        except Exception as e:
+            self._fail(keys, e)
+            return
+
+        for key, vec in zip(keys, vectors):
+            self._remember(key, vec)
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(vec)
+        if len(vectors) < len(keys):
+            self._fail(keys[len(vectors):], RuntimeError(
+                f"embedding API returned {len(vectors)} vectors for {len(keys)} texts"))
+
+        # Persist after the waiters have their vectors; a failed write only
+        # costs a future disk hit
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._write_disk, keys, vectors)
+            except Exception:
+                self.disk_errors += 1
+
+    # ======================== Embeddings API ========================
+
+    async def aembed_documents(self, texts: list) -> list:
+        keys = [self.key(text) for text in texts]
+        candidates = self._disk_candidates(keys)
+        disk = await asyncio.to_thread(self._read_disk, candidates) if candidates else {}
+        results = self._lookup(keys, disk)
+        futures = {i: self._miss(keys[i], texts[i]) for i, vec in enumerate(results) if vec is None}
+        if futures:
+            # Miss futures are shared with other callers; shield them so a
+            # cancelled caller does not cancel everyone else's wait
+            vectors = await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))
+            for i, vec in zip(futures, vectors):
+                results[i] = vec
+        return [vec.tolist() for vec in results]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [self.key(text) for text in texts]
+        candidates = self._disk_candidates(keys)
+        results = self._lookup(keys, self._read_disk(candidates) if candidates else {})
+        missing = [i for i, vec in enumerate(results) if vec is None]
+        if missing:
+            self.misses += len(missing)
+            self.upstream_calls += 1
+            vectors = [np.asarray(v, dtype=np.float32) for v in self.base.embed_documents([texts[i] for i in missing])]
+            for i, vec in zip(missing, vectors):
+                self._remember(keys[i], vec)
+                results[i] = vec
+            if self._db is not None:
+                self._write_disk([keys[i] for i in missing], vectors)
+        return [vec.tolist() for vec in results]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "upstream_calls": self.upstream_calls,
+            "disk_errors": self.disk_errors,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "memory_entries": len(self._memory),
+        }
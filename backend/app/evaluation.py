@@ -0,0 +1,152 @@
+"""
+===================================================================
+  evaluation.py — Per-request evaluation context
+===================================================================
+
+This module holds the artifacts computed while handling one prompt so
+that scoring, logging and caching can share them instead of recomputing
+them. Its responsibilities include:
+
+1. Computing the prompt vector, response vector and chain-of-thought
+   score at most once per request (concurrent callers share the same
+   in-flight call).
+2. Extracting the lexical features used by the heuristic scorers once.
+3. Counting every external call (LLM, embedding, Neo4j) made for the
+   request and aggregating those counts across requests.
+
+===================================================================
+"""
+
+import asyncio
+import re
+from collections import Counter
+from typing import NamedTuple
+
+# ======================== Lexical Features ========================
+
+WORD_RE = re.compile(r'\w+')
+SENTENCE_END_RE = re.compile(r'[.!?]')
+
+# Lexical statistics shared by the heuristic scoring functions
+class LexicalFeatures(NamedTuple):
+    prompt_words: set
+    response_words: set
+    word_count: int
+    avg_sentence_length: float
+
+# ------------------------------------------------------------------------------
+# lexical_features(prompt, response) -> LexicalFeatures
+# Tokenizes the prompt and response once for overlap, length and
+# readability scoring.
+# ------------------------------------------------------------------------------
+def lexical_features(prompt: str, response: str) -> LexicalFeatures:
+    sentences = SENTENCE_END_RE.split(response)
+    avg_len = sum(len(s.split()) for s in sentences if s.strip()) / max(1, len(SENTENCE_END_RE.findall(response)))
+    return LexicalFeatures(
+        prompt_words=set(WORD_RE.findall(prompt.lower())),
+        response_words=set(WORD_RE.findall(response.lower())),
+        word_count=len(response.split()),
+        avg_sentence_length=avg_len,
+    )
+
+# ======================== Call Statistics ========================
+
+# ------------------------------------------------------------------------------
+# CallStats
+#
+# Aggregates the external calls made per request, broken down by kind
+# ("llm", "embed", "neo4j"), so redundant upstream work is visible.
+# ------------------------------------------------------------------------------
+class CallStats:
+    def __init__(self):
+        self.requests = 0
+        self.totals = Counter()
+
+    def record(self, calls: Counter, requests: int = 1):
+        self.requests += requests
+        self.totals.update(calls)
+
+    def summary(self) -> dict:
+        per_request = {kind: round(n / max(1, self.requests), 3) for kind, n in sorted(self.totals.items())}
+        return {
+            "requests": self.requests,
+            "calls_per_request": per_request,
+            "total_per_request": round(sum(self.totals.values()) / max(1, self.requests), 3),
+        }
+
+# Process-wide aggregate shared by every request
+CALL_STATS = CallStats()
+
+# ======================== Evaluation Context ========================
+
+# ------------------------------------------------------------------------------
+# EvaluationContext
+#
+# Created once per request. `embed` is an async text -> vector function
+# and `judge` an async (response, ctx) -> CoT score function that counts
+# the upstream calls it makes on ctx; both are supplied by the caller so
+# the context stays independent of the concrete clients.
+# Each artifact is memoized as a future, so it is computed exactly once
+# even when several stages ask for it at the same time.
+# ------------------------------------------------------------------------------
+class EvaluationContext:
+    def __init__(self, prompt: str, embed, judge):
+        self.prompt = prompt
+        self.response = None
+        self.calls = Counter()
+        self._embed = embed
+        self._judge = judge
+        self._futures = {}
+        self._features = None
+        self.deferred = None   # task settling the final score later, if scoring was deferred
+
+    def set_prompt_vector(self, vector):
+        # Seeds a vector computed elsewhere (e.g. one batched embedding call)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(vector)
+        self._futures["prompt_vector"] = future
+
+    def set_cot_score(self, score: float):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(score)
+        self._futures["cot_score"] = future
+
+    def set_response(self, response: str):
+        self.response = response
+        self._features = None
+        self._futures.pop("response_vector", None)
+        self._futures.pop("cot_score", None)
+
+    def count(self, kind: str):
+        self.calls[kind] += 1
+
+    async def track(self, kind: str, awaitable):
+        self.count(kind)
+        return await awaitable
+
+    async def _once(self, name: str, kind: str, factory):
+        future = self._futures.get(name)
+        if future is None:
+            if kind is not None:
+                self.calls[kind] += 1
+            future = self._futures[name] = asyncio.ensure_future(factory())
+        return await future
+
+    async def prompt_vector(self):
+        return await self._once("prompt_vector", "embed", lambda: self._embed(self.prompt))
+
+    async def response_vector(self):
+        return await self._once("response_vector", "embed", lambda: self._embed(self.response))
+
+    async def cot_score(self) -> float:
+        # The judge counts its own calls (local scoring tiers make none)
+        return await self._once("cot_score", None, lambda: self._judge(self.response, self))
+
+    def lexical(self) -> LexicalFeatures:
+        if self._features is None:
+            self._features = lexical_features(self.prompt, self.response)
+        return self._features
+
+    def finish(self, stats: CallStats = CALL_STATS, requests: int = 1) -> Counter:
+        stats.record(self.calls, requests)
+        return self.calls
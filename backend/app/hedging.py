@@ -0,0 +1,262 @@
+"""
+===================================================================
+  hedging.py — Deadlines and hedged generation across providers
+===================================================================
+
+This module bounds how long one slow upstream call can hold a request.
+Its responsibilities include:
+
+1. Tracking each model's time to first token over a rolling window.
+   Attempts cancelled (or cut off by the deadline) before their first
+   token add a censored sample, the time they had waited so far, so
+   slow tails are not dropped from the window. Only attempts that
+   waited at least their model's hedge delay count; a late-started
+   secondary's short wait says nothing about its latency.
+2. Hedging: when the primary model has not produced a first token
+   within a percentile of its own recent first-token latency, the same
+   prompt is issued to a secondary model (on the other provider), and
+   the first attempt to win is kept while the loser is cancelled.
+3. Falling back to the secondary model straight away when the primary
+   fails before producing output (error, overload, outage).
+4. Enforcing a per-request generation deadline (DeadlineExceeded,
+   surfaced by the router as HTTP 504).
+5. Reporting how often hedges fire and which attempt wins.
+
+An attempt is an async iterator of message chunks supplied by the
+caller, so admission slots and call counting stay in utils.py.
+
+===================================================================
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import REGISTRY
+
+HEDGES = REGISTRY.counter(
+    "promptlink_hedges_total", "Secondary generations started, by reason and winning attempt.",
+    ("primary", "reason", "winner"))
+DEADLINES = REGISTRY.counter(
+    "promptlink_deadline_exceeded_total", "Generations abandoned at the request deadline.", ("model",))
+
+# Ends an attempt's chunk queue
+_DONE = object()
+
+# ------------------------------------------------------------------------------
+# DeadlineExceeded
+# Raised when no attempt finished (or, for streams, started) before the
+# request deadline.
+# ------------------------------------------------------------------------------
+class DeadlineExceeded(Exception):
+    def __init__(self, model: str, deadline: float):
+        super().__init__(f"{model} did not answer within {deadline:g}s")
+        self.model = model
+        self.deadline = deadline
+
+# ------------------------------------------------------------------------------
+# Attempt
+# One generation running in its own task. Chunks are queued as they
+# arrive; `first_token` is set on the first non-empty chunk and `done`
+# when the stream ends (successfully or not).
+# ------------------------------------------------------------------------------
+class Attempt:
+    def __init__(self, model: str, chunks):
+        self.model = model
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.error = None
+        self.message = None
+        self.queue = asyncio.Queue()
+        self.first_token = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(chunks))
+
+    async def _pump(self, chunks):
+        try:
+            async for chunk in chunks:
+                if self.ttft is None and chunk.content:
+                    self.ttft = time.perf_counter() - self.started
+                    self.first_token.set()
+                self.message = chunk if self.message is None else self.message + chunk
+                self.queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.put_nowait(_DONE)
+            self.first_token.set()
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and self.error is not None
+
+    async def chunks(self):
+        while (chunk := await self.queue.get()) is not _DONE:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        self.task.cancel()
+
+# ======================== Hedger ========================
+
+# ------------------------------------------------------------------------------
+# Hedger
+#
+#   - secondaries: primary model -> model to hedge to (no entry = never hedge)
+#   - percentile: first-token latency percentile used as the hedge delay
+#   - min_delay / max_delay: clamp on the hedge delay, in seconds
+#   - default_delay: delay used until `min_samples` first tokens are seen
+#   - deadline: seconds a request may wait for its generation (0 = none)
+#   - window: first-token samples kept per model
+# ------------------------------------------------------------------------------
+class Hedger:
+    def __init__(self, secondaries: dict, percentile: float = 95, min_delay: float = 0.25,
+                 max_delay: float = 10.0, default_delay: float = 2.0, deadline: float = 60.0,
+                 window: int = 500, min_samples: int = 20, enabled: bool = True):
+        self.secondaries = secondaries
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.deadline = deadline
+        self.window = window
+        self.min_samples = min_samples
+        self.enabled = enabled
+
+        self._ttft = {}   # model -> deque of first-token seconds
+        self.counts = {"requests": 0, "hedged": 0, "fallbacks": 0, "secondary_wins": 0, "deadline_exceeded": 0,
+                       "censored_samples": 0}
+
+    def record(self, model: str, seconds: float):
+        samples = self._ttft.get(model)
+        if samples is None:
+            samples = self._ttft[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    # --------------------------------------------------------------------------
+    # sample(attempts)
+    # Records every attempt's first-token latency. One still waiting for its
+    # first token is recorded at the time elapsed so far (a lower bound on
+    # its real latency) if that is at least the model's hedge delay, so the
+    # sample can only raise the percentile; shorter waits and failed
+    # attempts are skipped.
+    # --------------------------------------------------------------------------
+    def sample(self, attempts: list):
+        now = time.perf_counter()
+        for attempt in attempts:
+            if attempt.ttft is not None:
+                self.record(attempt.model, attempt.ttft)
+            elif attempt.error is None:
+                waited = now - attempt.started
+                if waited >= self.delay(attempt.model):
+                    self.record(attempt.model, waited)
+                    self.counts["censored_samples"] += 1
+
+    def delay(self, model: str) -> float:
+        samples = self._ttft.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_delay
+        value = float(np.percentile(np.fromiter(samples, dtype=np.float64), self.percentile))
+        return min(self.max_delay, max(self.min_delay, value))
+
+    # --------------------------------------------------------------------------
+    # run(primary, start, until="done", hedge=True) -> (model, Attempt)
+    #
+    # Races `start(primary)` against `start(secondary)` once the hedge delay
+    # passes without a first token, or as soon as the primary fails.
+    # `start(model)` returns an async iterator of message chunks.
+    #   - until="done": the first attempt to finish successfully wins
+    #   - until="first_token": the first attempt to produce output wins
+    #     (streams commit to it; the deadline covers only this wait)
+    # With hedge=False the primary runs alone, under the deadline only.
+    # Losers are cancelled. Raises the primary's error if every attempt
+    # fails and DeadlineExceeded when the deadline passes first.
+    # --------------------------------------------------------------------------
+    async def run(self, primary: str, start, until: str = "done", hedge: bool = True):
+        self.counts["requests"] += 1
+        secondary = self.secondaries.get(primary) if self.enabled and hedge else None
+        attempts = [Attempt(primary, start(primary))]
+        reason = None
+
+        def won(attempt: Attempt) -> bool:
+            if attempt.error is not None:
+                return False
+            return attempt.task.done() or (until == "first_token" and attempt.ttft is not None)
+
+        def hedge(why: str):
+            nonlocal reason
+            reason = why
+            attempts.append(Attempt(secondary, start(secondary)))
+
+        try:
+            async with asyncio.timeout(self.deadline or None):
+                # Give the primary until the hedge delay to show progress
+                if secondary is not None:
+                    try:
+                        await asyncio.wait_for(attempts[0].first_token.wait(), self.delay(primary))
+                    except TimeoutError:
+                        hedge("slow")
+
+                while (winner := next((a for a in attempts if won(a)), None)) is None:
+                    live = [a for a in attempts if not a.task.done()]
+                    if not live:
+                        if secondary is not None and len(attempts) == 1:
+                            hedge("failed")
+                            continue
+                        raise attempts[0].error
+                    waiters = [asyncio.ensure_future(a.first_token.wait()) if until == "first_token" else a.task
+                               for a in live]
+                    try:
+                        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        if until == "first_token":
+                            for waiter in waiters:
+                                waiter.cancel()
+        except TimeoutError:
+            self.sample(attempts)
+            for attempt in attempts:
+                attempt.cancel()
+            self.counts["deadline_exceeded"] += 1
+            DEADLINES.inc(model=primary)
+            raise DeadlineExceeded(primary, self.deadline) from None
+        except BaseException:
+            for attempt in attempts:
+                attempt.cancel()
+            raise
+
+        self.sample(attempts)
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+        if reason is not None:
+            self.counts["hedged" if reason == "slow" else "fallbacks"] += 1
+            if winner is not attempts[0]:
+                self.counts["secondary_wins"] += 1
+            HEDGES.inc(primary=primary, reason=reason, winner="primary" if winner is attempts[0] else "secondary")
+        return winner.model, winner
+
+    def stats(self) -> dict:
+        requests = max(1, self.counts["requests"])
+        models = {}
+        for model, samples in sorted(self._ttft.items()):
+            p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 95, 99]) * 1000
+            models[model] = {
+                "samples": len(samples),
+                "ttft_p50_ms": round(p50, 1),
+                "ttft_p95_ms": round(p95, 1),
+                "ttft_p99_ms": round(p99, 1),
+                "hedge_delay_ms": round(self.delay(model) * 1000, 1),
+                "secondary": self.secondaries.get(model),
+            }
+        return {
+            **self.counts,
+            "hedge_rate": round(self.counts["hedged"] / requests, 4),
+            "deadline_seconds": self.deadline,
+            "enabled": self.enabled,
+            "models": models,
+        }
@@ -0,0 +1,186 @@
+"""
+===================================================================
+  intent_classifier.py — Local embedding-based intent classifier
+===================================================================
+
+This module replaces most LLM intent-classification calls with a
+nearest-centroid classifier over the prompt embeddings the pipeline
+already computes. Its responsibilities include:
+
+1. Training one unit-length centroid per intent from the labelled
+   prompts stored in Neo4j ((:Prompt)-[:HAS_INTENT]->(:Intent)).
+2. Predicting an intent plus a confidence so callers can fall back
+   to the LLM classifier when the local prediction is uncertain.
+3. Saving and loading the trained centroids as a compact .npz file.
+4. Providing an offline command to train the model and to benchmark
+   its accuracy against the LLM labels and the latency it saves.
+
+Usage (from backend/app/):
+    python intent_classifier.py train --out intent_centroids.npz
+    python intent_classifier.py eval --model intent_centroids.npz --llm-sample 20
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from text_store import TextStore
+
+# ======================== Classifier ========================
+
+# ------------------------------------------------------------------------------
+# NearestCentroidClassifier
+#
+# Cosine nearest-centroid model. `predict` returns the closest intent and
+# a softmax confidence over the centroid similarities; `temperature`
+# controls how sharply the similarity gap turns into confidence.
+# ------------------------------------------------------------------------------
+class NearestCentroidClassifier:
+    def __init__(self, labels: list, centroids: np.ndarray, temperature: float = 0.02):
+        self.labels = list(labels)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.temperature = temperature
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def fit(cls, vectors, labels: list, temperature: float = 0.02) -> "NearestCentroidClassifier":
+        data = cls._normalize(np.asarray(vectors, dtype=np.float32))
+        labels = np.asarray(labels)
+        classes = sorted(set(labels.tolist()))
+        centroids = np.stack([data[labels == label].mean(axis=0) for label in classes])
+        return cls(classes, cls._normalize(centroids), temperature)
+
+    def predict_batch(self, vectors):
+        sims = self._normalize(np.asarray(vectors, dtype=np.float32)) @ self.centroids.T
+        logits = (sims - sims.max(axis=1, keepdims=True)) / self.temperature
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = np.argmax(probs, axis=1)
+        return [(self.labels[i], float(probs[row, i])) for row, i in enumerate(best)]
+
+    def predict(self, vector) -> tuple:
+        return self.predict_batch([vector])[0]
+
+    def save(self, path: str):
+        np.savez(path, labels=np.asarray(self.labels), centroids=self.centroids,
+                 temperature=np.float32(self.temperature))
+
+    @classmethod
+    def load(cls, path: str) -> "NearestCentroidClassifier":
+        data = np.load(path)
+        return cls(data["labels"].tolist(), data["centroids"], float(data["temperature"]))
+
+# ======================== Training Data ========================
+
+# ------------------------------------------------------------------------------
+# fetch_labelled_prompts(driver, limit) -> list[tuple[str, str]]
+# Reads (prompt text, intent) pairs that the LLM classifier produced
+# and the pipeline logged to Neo4j; hashed prompt text is resolved lazily.
+# ------------------------------------------------------------------------------
+async def fetch_labelled_prompts(driver, limit: int | None = None) -> list:
+    query = (
+        "MATCH (p:Prompt)-[:HAS_INTENT]->(i:Intent) "
+        "RETURN p.text AS prompt, p.key AS prompt_hash, i.type AS intent"
+        + (" LIMIT $limit" if limit else "")
+    )
+    records, _, _ = await driver.execute_query(query, limit=limit)
+    records = await TextStore(driver).fill(records, {"prompt": "prompt_hash"})
+    return [(record["prompt"], record["intent"]) for record in records if record["prompt"]]
+
+# ------------------------------------------------------------------------------
+# embed_all(embeddings, texts, batch_size) -> np.ndarray
+# Embeds texts in large batches with a single embed_documents call each.
+# ------------------------------------------------------------------------------
+async def embed_all(embeddings, texts: list, batch_size: int = 256) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(await embeddings.aembed_documents(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+# ------------------------------------------------------------------------------
+# split(n, holdout, seed) -> (train_idx, test_idx)
+# Deterministic shuffled train/test split.
+# ------------------------------------------------------------------------------
+def split(n: int, holdout: float, seed: int = 0):
+    order = np.random.default_rng(seed).permutation(n)
+    cut = int(n * (1 - holdout))
+    return order[:cut], order[cut:]
+
+# ======================== Commands ========================
+
+async def train(args):
+    import utils
+    await utils.ensure_clients()
+
+    pairs = await fetch_labelled_prompts(utils.driver, args.limit)
+    prompts, labels = zip(*pairs)
+    vectors = await embed_all(utils.embedding_model, list(prompts))
+    model = NearestCentroidClassifier.fit(vectors, list(labels), args.temperature)
+    model.save(args.out)
+    print(f"Trained on {len(labels)} prompts across {len(model.labels)} intents -> {args.out}")
+
+async def evaluate(args):
+    import utils
+    await utils.ensure_clients()
+
+    pairs = await fetch_labelled_prompts(utils.driver, args.limit)
+    prompts, labels = zip(*pairs)
+    labels = np.asarray(labels)
+    vectors = await embed_all(utils.embedding_model, list(prompts))
+
+    # Fit on the training split and score against the LLM labels of the holdout
+    train_idx, test_idx = split(len(labels), args.holdout)
+    model = NearestCentroidClassifier.fit(vectors[train_idx], labels[train_idx].tolist(), args.temperature)
+
+    start = time.perf_counter()
+    predictions = model.predict_batch(vectors[test_idx])
+    local_ms = (time.perf_counter() - start) * 1000 / max(1, len(test_idx))
+
+    predicted = np.asarray([label for label, _ in predictions])
+    confidence = np.asarray([conf for _, conf in predictions])
+    truth = labels[test_idx]
+    confident = confidence >= args.threshold
+
+    print(f"holdout prompts:          {len(test_idx)}")
+    print(f"local accuracy (all):     {np.mean(predicted == truth):.3f}")
+    print(f"confident share:          {np.mean(confident):.3f} (threshold {args.threshold})")
+    if confident.any():
+        print(f"accuracy when confident:  {np.mean(predicted[confident] == truth[confident]):.3f}")
+    print(f"local latency per prompt: {local_ms:.3f} ms")
+
+    # Time the LLM classifier on a sample to estimate the latency saved
+    if args.llm_sample:
+        sample = [prompts[i] for i in test_idx[:args.llm_sample]]
+        start = time.perf_counter()
+        for prompt in sample:
+            await utils.detect_intent(prompt)
+        llm_ms = (time.perf_counter() - start) * 1000 / len(sample)
+        saved_ms = np.mean(confident) * (llm_ms - local_ms)
+        print(f"LLM latency per prompt:   {llm_ms:.1f} ms")
+        print(f"mean latency saved:       {saved_ms:.1f} ms per request")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local intent classifier.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("train", "eval"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--limit", type=int, default=None, help="max labelled prompts to read")
+        cmd.add_argument("--temperature", type=float, default=0.02)
+    sub.choices["train"].add_argument("--out", default="intent_centroids.npz")
+    sub.choices["eval"].add_argument("--holdout", type=float, default=0.2)
+    sub.choices["eval"].add_argument("--threshold", type=float, default=0.6)
+    sub.choices["eval"].add_argument("--llm-sample", type=int, default=0, help="prompts to time against the LLM")
+    args = parser.parse_args()
+
+    asyncio.run(train(args) if args.command == "train" else evaluate(args))
+
+if __name__ == "__main__":
+    main()
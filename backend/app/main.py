@@ -10,6 +10,13 @@ the following core tasks:
 2. Registers the main API router from the app's routing module.
 3. Enables CORS (Cross-Origin Resource Sharing) to allow communication
    between the frontend (e.g., React/Vite app) and this backend API.
+4. Manages startup/shutdown through a lifespan hook: starts the
+   background Neo4j writer and a warm-up task (building the upstream
+   clients and preparing the Neo4j schema) without holding up startup,
+   and on exit flushes the writer, snapshots the semantic cache for the
+   next warm start and closes the connection pools.
+5. Serves Prometheus-format metrics for the whole process (/metrics).
+6. Reports readiness once warm-up has finished (/ready).
 
 This is the central configuration file that ties together routing
 and middleware to start the backend server.
@@ -17,12 +24,51 @@ and middleware to start the backend server.
 ===================================================================
 """
 
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from router import router
+from metrics import REGISTRY
+import utils
+from utils import neo4j_writer, CACHE
+
+# Startup progress reported by GET /ready
+READINESS = {"ready": False, "checks": {}, "warmup_ms": None}
+
+async def run_warm_up(started: float):
+    checks = await utils.warm_up()
+    READINESS.update(ready=True, checks=checks, warmup_ms=round((time.perf_counter() - started) * 1000, 1))
+
+# ------------------------------------------------------------------------------
+# lifespan(app)
+# Startup: start the batch writer, the model router's history refresh and
+# the warm-up task; the server accepts
+# connections immediately and request paths wait for the clients themselves.
+# Shutdown: drop pending speculative enhancements, settle deferred scores,
+# flush queued interactions, snapshot the cache and close the Neo4j driver
+# and HTTP pool.
+# ------------------------------------------------------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up = asyncio.create_task(run_warm_up(time.perf_counter()))
+    router_refresh = asyncio.create_task(utils.refresh_model_router())
+    neo4j_writer.start()
+    yield
+    router_refresh.cancel()
+    utils.SPECULATOR.cancel_all()
+    if not warm_up.done():
+        warm_up.cancel()
+    await utils.drain_deferred_scores()
+    await neo4j_writer.stop()
+    CACHE.snapshot()
+    await utils.close_clients()
 
 # Instantiate the FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS (Cross-Origin Resource Sharing) middleware to the FastAPI app
 # This configuration allows requests from any origin and permits credentials, all methods, and all headers
@@ -37,3 +83,21 @@ app.add_middleware(
 
 # Include the API routes defined in the router module
 app.include_router(router)
+
+# ------------------------------------------------------------------------------
+# GET /metrics
+# Latency histograms, cache, scoring, upstream call, token and error metrics
+# in the Prometheus text exposition format.
+# ------------------------------------------------------------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# ------------------------------------------------------------------------------
+# GET /ready
+# 200 once warm-up has finished (with per-check status and its duration),
+# 503 before that, so load balancers only route to warmed-up workers.
+# ------------------------------------------------------------------------------
+@app.get("/ready")
+async def ready():
+    return JSONResponse(READINESS, status_code=200 if READINESS["ready"] else 503)
@@ -0,0 +1,237 @@
+"""
+===================================================================
+  metrics.py — In-process metrics registry with Prometheus export
+===================================================================
+
+This module collects the backend's operational metrics and renders them
+in the Prometheus text exposition format served by GET /metrics. Its
+responsibilities include:
+
+1. Providing labelled counters and histograms that the pipeline, cache,
+   scoring and Neo4j writer update on the hot path (plain dict updates,
+   no locks: everything runs on one event loop).
+2. Exposing existing in-process statistics (call counts, writer queue,
+   embedding memo) as callback metrics read at scrape time.
+3. Recording per-model LLM latency, token usage and errors through a
+   LangChain callback handler attached to each chat client.
+
+===================================================================
+"""
+
+import math
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Latency buckets in seconds, from sub-millisecond cache work to slow generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# ======================== Metric Types ========================
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ------------------------------------------------------------------------------
+# Metric
+#
+# Base class holding the name, help text and label names. Subclasses keep
+# one value per label combination and yield exposition lines in `render`.
+# ------------------------------------------------------------------------------
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+# Monotonic counter, e.g. requests served or errors raised
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        lines = super().render()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+# Cumulative-bucket histogram, e.g. stage latencies or similarity scores
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}   # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = super().render()
+        for key, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(float(series[-2]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+# ------------------------------------------------------------------------------
+# CallbackMetric
+#
+# Reads its samples at scrape time from `collect()`, which returns a dict
+# mapping label-value tuples to numbers. Used for statistics that other
+# modules already keep (queue depth, call totals, memo hits).
+# ------------------------------------------------------------------------------
+class CallbackMetric(Metric):
+    def __init__(self, name: str, help: str, collect, labels: tuple = (), kind: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> list:
+        lines = super().render()
+        for key, value in sorted(self.collect().items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+# ======================== Registry ========================
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, collect, labels: tuple = (), kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, collect, labels, kind))
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry rendered by GET /metrics
+REGISTRY = Registry()
+
+# ======================== Shared Metrics ========================
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "promptlink_stage_seconds", "Pipeline stage and end-to-end latency.", ("pipeline", "stage"))
+REQUESTS = REGISTRY.counter(
+    "promptlink_requests_total", "Pipeline runs by outcome.", ("pipeline", "outcome"))
+ERRORS = REGISTRY.counter(
+    "promptlink_errors_total", "Errors raised or swallowed, by component.", ("component",))
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "promptlink_cache_lookups_total", "Semantic cache lookups by path and result.", ("path", "result"))
+CACHE_SIMILARITY = REGISTRY.histogram(
+    "promptlink_cache_hit_similarity", "Cosine similarity of semantic cache hits.", ("path",),
+    buckets=(0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99, 0.995, 1.0))
+
+SCORE_COMPONENTS = REGISTRY.histogram(
+    "promptlink_score_component_points", "Points awarded by each scoring component.", ("component",),
+    buckets=(0, 5, 10, 15, 20))
+RESPONSE_SCORES = REGISTRY.histogram(
+    "promptlink_response_score", "Overall response scores.", ("intent",),
+    buckets=(0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100))
+
+LLM_SECONDS = REGISTRY.histogram(
+    "promptlink_llm_seconds", "Upstream LLM call latency by model.", ("model",))
+LLM_TOKENS = REGISTRY.counter(
+    "promptlink_llm_tokens_total", "Tokens reported by upstream LLMs.", ("model", "type"))
+
+NEO4J_FLUSH_SECONDS = REGISTRY.histogram(
+    "promptlink_neo4j_flush_seconds", "Latency of batched Neo4j writes.")
+
+# ======================== LLM Callback ========================
+
+# ------------------------------------------------------------------------------
+# LLMMetricsHandler
+#
+# LangChain callback attached to one chat client (`callbacks=[...]`).
+# Records call latency, prompt/completion tokens from the provider's
+# usage metadata, and errors, all labelled with `model`.
+# ------------------------------------------------------------------------------
+class LLMMetricsHandler(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=self.model)
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if input_tokens:
+            LLM_TOKENS.inc(input_tokens, model=self.model, type="input")
+        if output_tokens:
+            LLM_TOKENS.inc(output_tokens, model=self.model, type="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        ERRORS.inc(component=f"llm.{self.model}")
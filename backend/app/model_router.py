@@ -0,0 +1,190 @@
+"""
+===================================================================
+  model_router.py — Adaptive per-intent model selection
+===================================================================
+
+This module replaces the fixed intent -> model table with a bandit
+that learns which model answers each intent best. Its responsibilities
+include:
+
+1. Keeping per-(intent, model) reward statistics in memory, so a
+   routing decision is a few arithmetic operations.
+2. Scoring each choice as quality minus a configurable latency and cost
+   penalty:  reward = score / 100 - latency_weight * seconds
+                                    - cost_weight * cost
+3. Choosing with UCB1: the best mean reward plus an exploration bonus
+   that shrinks as a model gathers samples for that intent.
+4. Starting from the previous static table: each intent's default model
+   gets a higher prior reward, so routing matches the old behaviour
+   until real data says otherwise.
+5. Learning online from every routed response and refreshing from the
+   score / latency history logged to Neo4j (all workers' traffic) on an
+   interval.
+
+===================================================================
+"""
+
+import asyncio
+import logging
+import math
+
+from metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Aggregated history per intent and model; enhancement runs are excluded
+# because their forced instructions inflate scores
+HISTORY_QUERY = """
+MATCH (i:Intent)-[:TRIGGERED]->(r:Response)<-[:GENERATED]-(m:Model)
+WHERE r.timestamp >= datetime() - duration({days: $days})
+  AND NOT coalesce(r.pipeline, 'route') STARTS WITH 'enhance'
+RETURN i.type AS intent, m.name AS model, count(r) AS n,
+       avg(r.score) AS score, avg(r.latency_ms) AS latency_ms
+"""
+
+# ------------------------------------------------------------------------------
+# Arm
+# Running reward statistics for one (intent, model) pair. `prior_n`
+# pseudo-observations of `prior` seed the mean.
+# ------------------------------------------------------------------------------
+class Arm:
+    __slots__ = ("prior", "prior_n", "n", "reward_sum", "latency_sum", "latency_n")
+
+    def __init__(self, prior: float, prior_n: float):
+        self.prior = prior
+        self.prior_n = prior_n
+        self.n = 0
+        self.reward_sum = 0.0
+        self.latency_sum = 0.0
+        self.latency_n = 0
+
+    @property
+    def weight(self) -> float:
+        return self.prior_n + self.n
+
+    @property
+    def mean(self) -> float:
+        return (self.prior * self.prior_n + self.reward_sum) / self.weight
+
+    def add(self, reward: float, latency: float | None, n: int = 1):
+        self.n += n
+        self.reward_sum += reward * n
+        if latency is not None:
+            self.latency_sum += latency * n
+            self.latency_n += n
+
+# ======================== Router ========================
+
+# ------------------------------------------------------------------------------
+# ModelRouter
+#
+#   - models: candidate model names
+#   - defaults: intent -> model used before any data exists ("default" key
+#     covers unknown intents)
+#   - costs: model -> relative cost (e.g. USD per 1M tokens)
+#   - latency_weight: reward points (score / 100) lost per second of latency
+#   - cost_weight: reward points lost per unit of cost
+#   - exploration: UCB1 exploration constant (0 = always exploit)
+#   - prior_n: weight of the prior, in pseudo-observations
+#   - prior_margin: how much lower non-default models start
+# ------------------------------------------------------------------------------
+class ModelRouter:
+    def __init__(self, models: list, defaults: dict, costs: dict | None = None,
+                 latency_weight: float = 0.02, cost_weight: float = 0.0,
+                 exploration: float = 0.1, prior_n: float = 5.0, prior_margin: float = 0.05,
+                 prior_reward: float = 0.6):
+        self.models = list(models)
+        self.defaults = defaults
+        self.costs = costs or {}
+        self.latency_weight = latency_weight
+        self.cost_weight = cost_weight
+        self.exploration = exploration
+        self.prior_n = prior_n
+        self.prior_margin = prior_margin
+        self.prior_reward = prior_reward
+
+        self._history = {}   # intent -> {model: Arm}, rebuilt from Neo4j on refresh
+        self._online = {}    # intent -> {model: Arm}, observations since the last refresh
+        self.refreshed = 0
+
+    def default_model(self, intent: str) -> str:
+        return self.defaults.get(intent, self.defaults["default"])
+
+    def reward(self, model: str, score: float, latency: float | None) -> float:
+        return (score / 100.0
+                - self.latency_weight * (latency or 0.0)
+                - self.cost_weight * self.costs.get(model, 0.0))
+
+    def _arms(self, table: dict, intent: str) -> dict:
+        arms = table.get(intent)
+        if arms is None:
+            default = self.default_model(intent)
+            arms = table[intent] = {
+                model: Arm(self.prior_reward - (0 if model == default else self.prior_margin), self.prior_n)
+                for model in self.models
+            }
+        return arms
+
+    # --------------------------------------------------------------------------
+    # choose(intent) -> str
+    # UCB1 over history + online observations for this intent.
+    # --------------------------------------------------------------------------
+    def choose(self, intent: str) -> str:
+        history, online = self._arms(self._history, intent), self._arms(self._online, intent)
+        total = sum(history[m].n + online[m].n for m in self.models) + 1
+        best, best_value = None, -math.inf
+        for model in self.models:
+            h, o = history[model], online[model]
+            weight = h.weight + o.n
+            mean = (h.mean * h.weight + o.reward_sum) / weight
+            value = mean + self.exploration * math.sqrt(math.log(total) / weight)
+            if value > best_value:
+                best, best_value = model, value
+        return best
+
+    def observe(self, intent: str, model: str, score: float, latency: float | None):
+        if model in self.models:
+            self._arms(self._online, intent)[model].add(self.reward(model, score, latency), latency)
+
+    # --------------------------------------------------------------------------
+    # refresh(driver, days)
+    # Rebuilds the history from Neo4j aggregates. Online observations are
+    # dropped since the write-behind logger has stored them by now.
+    # --------------------------------------------------------------------------
+    async def refresh(self, driver, days: int = 30):
+        records, _, _ = await driver.execute_query(HISTORY_QUERY, days=days)
+        history = {}
+        for record in records:
+            model = record["model"]
+            if model not in self.models or record["score"] is None:
+                continue
+            latency = record["latency_ms"] / 1000 if record["latency_ms"] is not None else None
+            arm = self._arms(history, record["intent"])[model]
+            arm.add(self.reward(model, record["score"], latency), latency, record["n"])
+        self._history, self._online = history, {}
+        self.refreshed += 1
+
+    async def refresh_forever(self, get_driver, interval: float, days: int = 30):
+        while True:
+            try:
+                await self.refresh(get_driver(), days)
+            except Exception:
+                ERRORS.inc(component="model_router.refresh")
+                logger.exception("Model router refresh failed")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        out = {}
+        for intent in sorted(set(self._history) | set(self._online)):
+            history, online = self._arms(self._history, intent), self._arms(self._online, intent)
+            out[intent] = {"choice": self.choose(intent), "models": {}}
+            for model in self.models:
+                h, o = history[model], online[model]
+                n = h.n + o.n
+                latency_n = h.latency_n + o.latency_n
+                out[intent]["models"][model] = {
+                    "samples": n,
+                    "mean_reward": round((h.mean * h.weight + o.reward_sum) / (h.weight + o.n), 4),
+                    "mean_latency_ms": round((h.latency_sum + o.latency_sum) / latency_n * 1000, 1) if latency_n else None,
+                }
+        return out
@@ -0,0 +1,348 @@
+"""
+===================================================================
+  neo4j_writer.py — Batched, write-behind Neo4j interaction logger
+===================================================================
+
+This module takes Neo4j logging off the request path. Its
+responsibilities include:
+
+1. Queueing interaction records in a bounded asyncio queue; callers
+   wait (backpressure) instead of growing memory when Neo4j lags.
+2. Flushing queued records in batches with a single UNWIND query.
+3. Creating uniqueness constraints and indexes at startup, keyed on a
+   SHA-256 hash of the prompt text rather than the full text.
+4. Backfilling the hashed key on Prompt nodes (and the user's email on
+   Response nodes) written before they existed.
+5. Draining the queue on shutdown (called from the FastAPI lifespan).
+6. Applying late score updates (deferred CoT scoring) to Response
+   nodes, in queue order so they always follow the node's creation.
+7. Keeping the analytics aggregates current: each flushed batch (new
+   responses, score updates, cache hits) is folded into per-day and
+   per-user deltas and applied in the same flush (see analytics.py).
+   A failed roll-up is counted and logged on its own; the batch itself
+   stays written and `analytics.py --rebuild` reconciles the aggregates.
+8. Optionally storing prompt and response text content-addressed and
+   compressed: each batch's distinct bodies are written once as Text
+   nodes and the Prompt/Response nodes keep only the hash (see
+   text_store.py).
+
+===================================================================
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from analytics import DAILY_ROLLUP_QUERY, USER_ROLLUP_QUERY, SCORE_BINS, Rollup
+from metrics import ERRORS, NEO4J_FLUSH_SECONDS
+from text_store import TEXT_WRITE_QUERY, encode_text, text_hash
+
+logger = logging.getLogger(__name__)
+
+# ======================== Schema ========================
+
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT prompt_key IF NOT EXISTS FOR (p:Prompt) REQUIRE p.key IS UNIQUE",
+    "CREATE CONSTRAINT intent_type IF NOT EXISTS FOR (i:Intent) REQUIRE i.type IS UNIQUE",
+    "CREATE CONSTRAINT model_name IF NOT EXISTS FOR (m:Model) REQUIRE m.name IS UNIQUE",
+    "CREATE CONSTRAINT user_email IF NOT EXISTS FOR (u:User) REQUIRE u.email IS UNIQUE",
+    "CREATE CONSTRAINT response_id IF NOT EXISTS FOR (r:Response) REQUIRE r.id IS UNIQUE",
+    "CREATE INDEX response_timestamp IF NOT EXISTS FOR (r:Response) ON (r.timestamp)",
+    "CREATE CONSTRAINT daily_stat_key IF NOT EXISTS FOR (s:DailyStat) REQUIRE s.key IS UNIQUE",
+    "CREATE INDEX daily_stat_day IF NOT EXISTS FOR (s:DailyStat) ON (s.day)",
+    "CREATE CONSTRAINT user_stat_email IF NOT EXISTS FOR (s:UserStat) REQUIRE s.email IS UNIQUE",
+    "CREATE CONSTRAINT text_hash IF NOT EXISTS FOR (t:Text) REQUIRE t.hash IS UNIQUE",
+]
+
+# One round trip writes a whole batch of interactions. With hashed text
+# storage `prompt` and `response` are null, so only the hashes are stored.
+BATCH_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Prompt {key: row.prompt_key})
+  ON CREATE SET p.text = row.prompt
+MERGE (i:Intent {type: row.intent})
+MERGE (m:Model {name: row.model})
+CREATE (r:Response {
+    id: row.id,
+    text: row.response,
+    text_hash: row.response_hash,
+    score: row.score,
+    cot_score: row.cot_score,
+    latency_ms: row.latency_ms,
+    pipeline: row.pipeline,
+    email: row.email,
+    timestamp: datetime(row.timestamp)
+})
+
+// Optional user node if email is provided
+FOREACH (_ IN CASE WHEN row.email IS NOT NULL THEN [1] ELSE [] END |
+    MERGE (u:User {email: row.email})
+    MERGE (u)-[:ASKED]->(p)
+)
+
+MERGE (p)-[:HAS_INTENT]->(i)
+CREATE (p)-[:GOT_RESPONSE]->(r)
+CREATE (i)-[:TRIGGERED]->(r)
+CREATE (m)-[:GENERATED]->(r)
+"""
+
+# Late score updates for Response nodes already queued or written; returns
+# what the analytics roll-up needs to move the response between score bins
+SCORE_QUERY = """
+UNWIND $rows AS row
+MATCH (i:Intent)-[:TRIGGERED]->(r:Response {id: row.id})<-[:GENERATED]-(m:Model)
+WITH row, r, i, m, r.score AS previous
+SET r.score = row.score, r.cot_score = row.cot_score, r.scored_at = datetime()
+RETURN previous, r.score AS score, m.name AS model, i.type AS intent, r.email AS email,
+       toString(date(r.timestamp)) AS day, toString(r.timestamp) AS timestamp
+"""
+
+# ------------------------------------------------------------------------------
+# prompt_key(text) -> str
+# Stable hashed merge key for Prompt nodes.
+# ------------------------------------------------------------------------------
+def prompt_key(text: str) -> str:
+    return text_hash(text)
+
+# ------------------------------------------------------------------------------
+# backfill_prompt_keys(driver, batch_size) -> int
+# Sets `key` on Prompt nodes created before the hashed key existed.
+# Returns the number of nodes updated.
+# ------------------------------------------------------------------------------
+async def backfill_prompt_keys(driver, batch_size: int = 1000) -> int:
+    updated = 0
+    while True:
+        records, _, _ = await driver.execute_query(
+            "MATCH (p:Prompt) WHERE p.key IS NULL AND p.text IS NOT NULL "
+            "RETURN elementId(p) AS id, p.text AS text LIMIT $limit",
+            limit=batch_size,
+        )
+        if not records:
+            return updated
+        rows = [{"id": record["id"], "key": prompt_key(record["text"])} for record in records]
+        await driver.execute_query(
+            "UNWIND $rows AS row MATCH (p:Prompt) WHERE elementId(p) = row.id SET p.key = row.key",
+            rows=rows,
+        )
+        updated += len(rows)
+
+# ------------------------------------------------------------------------------
+# ensure_schema(driver)
+# Backfills hashed prompt keys, then creates constraints and indexes.
+# Safe to run on every startup. (Response emails are backfilled by
+# analytics.py --rebuild, outside the warm-up timeout.)
+# ------------------------------------------------------------------------------
+async def ensure_schema(driver):
+    await backfill_prompt_keys(driver)
+    for statement in SCHEMA_STATEMENTS:
+        await driver.execute_query(statement)
+
+# ======================== Writer ========================
+
+# ------------------------------------------------------------------------------
+# Neo4jWriter
+#
+# Background batch writer.
+#   - batch_size: max records per UNWIND write
+#   - flush_interval: max seconds a record waits for its batch to fill
+#   - max_queue: queue bound; submit() waits when it is full
+#   - rollup: also maintain the analytics aggregates
+#   - hashed_text: store text bodies as compressed Text nodes (zlib at
+#     `compress_level` for bodies of `compress_min_bytes` or more)
+#   - recent_texts: hashes remembered as already stored, so repeated
+#     bodies are not sent again
+# The writer starts lazily on the first submit if the lifespan hook
+# has not started it already.
+# ------------------------------------------------------------------------------
+class Neo4jWriter:
+    def __init__(self, driver, batch_size: int = 100, flush_interval: float = 0.5, max_queue: int = 10000,
+                 rollup: bool = True, hashed_text: bool = False, compress_level: int = 6,
+                 compress_min_bytes: int = 256, recent_texts: int = 10000):
+        self.driver = driver
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup = rollup
+        self.hashed_text = hashed_text
+        self.compress_level = compress_level
+        self.compress_min_bytes = compress_min_bytes
+        self.recent_texts = recent_texts
+        self._stored = OrderedDict()   # recently stored text hashes (LRU)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.rollup_failed = 0
+        self.texts = {"stored": 0, "deduplicated": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    # --------------------------------------------------------------------------
+    # stop()
+    # Flushes everything still queued, then stops the background task.
+    # --------------------------------------------------------------------------
+    async def stop(self):
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # --------------------------------------------------------------------------
+    # submit(prompt, intent, response, score, cot_score, model, email=None,
+    #        latency_ms=None, pipeline=None) -> str
+    # Enqueues one interaction and returns the id its Response node will get.
+    # `latency_ms` is the generation time and `pipeline` the code path that
+    # produced it (e.g. "route", "enhance"). Waits while the queue is full so
+    # memory stays bounded.
+    # --------------------------------------------------------------------------
+    async def submit(self, prompt: str, intent: str, response: str, score: float,
+                     cot_score: float, model: str, email=None,
+                     latency_ms: float | None = None, pipeline: str | None = None) -> str:
+        self.start()
+        response_id = str(uuid.uuid4())
+        await self.queue.put({
+            "id": response_id,
+            "prompt": prompt,
+            "prompt_key": prompt_key(prompt),
+            "intent": intent,
+            "response": response,
+            "response_hash": text_hash(response),
+            "score": score,
+            "cot_score": cot_score,
+            "model": model,
+            "email": email,
+            "latency_ms": latency_ms,
+            "pipeline": pipeline,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        })
+        return response_id
+
+    # --------------------------------------------------------------------------
+    # update_score(response_id, score, cot_score)
+    # Queues a score correction for a Response submitted earlier. Shares the
+    # queue with submit(), so it is flushed in the same or a later batch than
+    # the node it updates.
+    # --------------------------------------------------------------------------
+    async def update_score(self, response_id: str, score: float, cot_score: float):
+        self.start()
+        await self.queue.put({"op": "score", "id": response_id, "score": score, "cot_score": cot_score})
+
+    # --------------------------------------------------------------------------
+    # record_hit(intent, model, email=None)
+    # Queues a request answered from the semantic cache. Only the analytics
+    # aggregates count it; no nodes are written.
+    # --------------------------------------------------------------------------
+    async def record_hit(self, intent: str, model: str, email=None):
+        if not self.rollup:
+            return
+        self.start()
+        await self.queue.put({"op": "hit", "intent": intent, "model": model, "email": email,
+                              "timestamp": datetime.now(timezone.utc).isoformat()})
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        # Give a partial batch up to flush_interval to fill, then drain what is queued
+        if self.queue.qsize() < self.batch_size - 1:
+            await asyncio.sleep(self.flush_interval)
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            rows = [row for row in batch if row.get("op") is None]
+            scores = [row for row in batch if row.get("op") == "score"]
+            hits = [row for row in batch if row.get("op") == "hit"]
+            start = time.perf_counter()
+            written, rescored = [], []
+            try:
+                try:
+                    if rows:
+                        await self.driver.execute_query(BATCH_QUERY, rows=await self._store_texts(rows)
+                                                        if self.hashed_text else rows)
+                        written = rows
+                    if scores:
+                        rescored, _, _ = await self.driver.execute_query(SCORE_QUERY, rows=scores)
+                    self.written += len(batch)
+                    self.batches += 1
+                except Exception:
+                    self.written += len(written)
+                    self.failed += len(batch) - len(written)
+                    ERRORS.inc(component="neo4j.write")
+                    logger.exception("Neo4j logging failed for a batch of %d records", len(batch))
+                # Aggregates follow only what was written; a failure here leaves the
+                # batch in place and is reconciled by analytics.py --rebuild
+                if self.rollup:
+                    try:
+                        await self._roll_up(written, rescored, hits)
+                    except Exception:
+                        self.rollup_failed += len(batch)
+                        ERRORS.inc(component="neo4j.rollup")
+                        logger.exception("Analytics roll-up failed for a batch of %d records; "
+                                         "run analytics.py --rebuild to reconcile", len(batch))
+                NEO4J_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    # --------------------------------------------------------------------------
+    # _store_texts(rows) -> list
+    # Writes the batch's distinct prompt and response bodies not stored
+    # recently as Text nodes, then returns the rows without inline text.
+    # --------------------------------------------------------------------------
+    async def _store_texts(self, rows: list) -> list:
+        bodies = {}
+        for row in rows:
+            bodies[row["prompt_key"]] = row["prompt"]
+            bodies[row["response_hash"]] = row["response"]
+        new = [text for key, text in bodies.items() if key not in self._stored]
+        self.texts["deduplicated"] += 2 * len(rows) - len(new)
+        if new:
+            encoded = await asyncio.to_thread(
+                lambda: [encode_text(text, self.compress_level, self.compress_min_bytes) for text in new])
+            await self.driver.execute_query(TEXT_WRITE_QUERY, rows=encoded)
+            for text in encoded:
+                self.texts["stored"] += 1
+                self.texts["raw_bytes"] += text["size"]
+                self.texts["stored_bytes"] += len(text["body"])
+                self._stored[text["hash"]] = True
+        for key in bodies:
+            self._stored.move_to_end(key)
+        while len(self._stored) > self.recent_texts:
+            self._stored.popitem(last=False)
+        return [{**row, "prompt": None, "response": None} for row in rows]
+
+    async def _roll_up(self, rows: list, rescored: list, hits: list):
+        rollup = Rollup()
+        for row in rows:
+            rollup.add_response(row)
+        for record in rescored:
+            rollup.rescore(record)
+        for hit in hits:
+            rollup.add_hit(hit)
+        if daily := rollup.daily_rows():
+            await self.driver.execute_query(DAILY_ROLLUP_QUERY, rows=daily, bins=SCORE_BINS)
+        if users := rollup.user_rows():
+            await self.driver.execute_query(USER_ROLLUP_QUERY, rows=users, bins=SCORE_BINS)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "rollup_failed": self.rollup_failed,
+            **({f"texts_{name}": value for name, value in self.texts.items()} if self.hashed_text else {}),
+        }
@@ -0,0 +1,129 @@
+"""
+===================================================================
+  pipeline.py — Staged execution and latency tracking for requests
+===================================================================
+
+This module provides the small execution layer used by utils.py to
+run the prompt pipeline. Its responsibilities include:
+
+1. Running a named pipeline stage and recording how long it took.
+2. Fanning out independent stages concurrently (asyncio.gather) so
+   a stage only waits for the stages it actually depends on.
+3. Keeping a rolling window of per-stage and end-to-end latencies
+   so p50/p99 can be reported while the server is running.
+4. Exporting every stage timing, outcome and stage error to the
+   metrics registry, and optionally capturing one request's timings
+   for a debug breakdown in its response.
+
+===================================================================
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+
+from metrics import ERRORS, REQUESTS, STAGE_SECONDS
+
+# ======================== Latency Recorder ========================
+
+# ------------------------------------------------------------------------------
+# LatencyRecorder
+#
+# Keeps the most recent `window` samples per stage and reports
+# percentiles over them. Sample values are in seconds.
+# ------------------------------------------------------------------------------
+class LatencyRecorder:
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples = {}
+
+    def record(self, stage: str, seconds: float):
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentiles(self, stage: str) -> dict:
+        samples = self._samples.get(stage)
+        if not samples:
+            return {"count": 0, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 99])
+        return {"count": len(samples), "p50_ms": round(p50 * 1000, 2), "p99_ms": round(p99 * 1000, 2)}
+
+    def summary(self) -> dict:
+        return {stage: self.percentiles(stage) for stage in sorted(self._samples)}
+
+# Process-wide recorder shared by every request
+STAGE_LATENCY = LatencyRecorder()
+
+# ======================== Timing Capture ========================
+
+# Dict collecting "<pipeline>.<stage>" -> ms for the current request, if enabled
+_TIMING_CAPTURE = ContextVar("timing_capture", default=None)
+
+# ------------------------------------------------------------------------------
+# capture_timings()
+# Context manager yielding a dict that every PipelineRun started inside it
+# (including tasks spawned from it) fills with its stage timings in ms.
+# ------------------------------------------------------------------------------
+@contextmanager
+def capture_timings():
+    timings = {}
+    token = _TIMING_CAPTURE.set(timings)
+    try:
+        yield timings
+    finally:
+        _TIMING_CAPTURE.reset(token)
+
+# ======================== Pipeline Run ========================
+
+# ------------------------------------------------------------------------------
+# PipelineRun
+#
+# Tracks the stages of a single request. Each stage is awaited through
+# `stage` (sequential) or `gather` (independent stages run concurrently);
+# its duration is stored on the run and in the shared recorder under
+# "<pipeline>.<stage>". `mark` records the time since the run started
+# (e.g. time-to-first-token) and `finish` the end-to-end latency.
+# ------------------------------------------------------------------------------
+class PipelineRun:
+    def __init__(self, pipeline: str, recorder: LatencyRecorder = STAGE_LATENCY):
+        self.pipeline = pipeline
+        self.recorder = recorder
+        self.timings = {}
+        self._capture = _TIMING_CAPTURE.get()
+        self._start = time.perf_counter()
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = seconds
+        self.recorder.record(f"{self.pipeline}.{name}", seconds)
+        STAGE_SECONDS.observe(seconds, pipeline=self.pipeline, stage=name)
+        if self._capture is not None:
+            self._capture[f"{self.pipeline}.{name}"] = round(seconds * 1000, 2)
+
+    def mark(self, name: str):
+        # Records the time elapsed since the run started (e.g. time-to-first-token)
+        self.record(name, time.perf_counter() - self._start)
+
+    async def stage(self, name: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            ERRORS.inc(component=f"{self.pipeline}.{name}")
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    async def gather(self, **stages):
+        results = await asyncio.gather(*(self.stage(name, aw) for name, aw in stages.items()))
+        return dict(zip(stages, results))
+
+    def finish(self, outcome: str = "total") -> dict:
+        self.mark(outcome)
+        REQUESTS.inc(pipeline=self.pipeline, outcome=outcome)
+        return self.timings
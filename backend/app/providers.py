@@ -0,0 +1,322 @@
+"""
+===================================================================
+  providers.py — Upstream client factory with offline stand-ins
+===================================================================
+
+This module builds the chat models, embedding client and Neo4j driver
+used by utils.py. With PROVIDERS=live (the default) it returns the real
+OpenAI, Gemini and Neo4j clients; with PROVIDERS=fake it returns local,
+deterministic stand-ins so the whole pipeline runs without credentials
+(CI, load tests, profiling on a dev box). Its responsibilities include:
+
+1. FakeChatModel — a LangChain chat model that answers the pipeline's
+   intent, batch-intent, CoT and batch-CoT prompts in the expected format and
+   generates deterministic text otherwise, with configurable latency
+   per call and per streamed token.
+2. FakeEmbeddings — hashed bag-of-words vectors, so identical and
+   near-identical texts land close together like real embeddings.
+3. NullNeo4jDriver — a write sink for offline runs that keeps the rows
+   it is sent in memory and reads stored texts back by hash; every other
+   query answers with no records. It deliberately models no Cypher: with
+   FAKE_NEO4J=live the fake models are combined with the real driver,
+   so the Neo4j paths run against a real (e.g. containerised) instance.
+4. Building the live clients on demand: the provider SDKs are imported
+   only when a client is first made (they dominate import time), the
+   OpenAI clients share one tuned HTTP connection pool and the Neo4j
+   driver gets an explicitly sized pool.
+
+Config (environment variables):
+    PROVIDERS              "live" or "fake"
+    FAKE_LLM_LATENCY       seconds before a fake model starts answering
+    FAKE_TOKEN_LATENCY     seconds between streamed fake tokens
+    FAKE_EMBED_LATENCY     seconds per fake embedding call
+    FAKE_NEO4J             "null" (write sink) or "live" (real driver at NEO4J_URI)
+    FAKE_NEO4J_LATENCY     seconds per query on the write sink
+    FAKE_RESPONSE_WORDS    length of generated fake answers
+    FAKE_LLM_TAIL_RATE     share of fake calls that stall before answering
+    FAKE_LLM_TAIL_LATENCY  extra seconds a stalled fake call waits
+
+===================================================================
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from typing import Any
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from text_store import TEXT_QUERY, TEXT_WRITE_QUERY
+
+load_dotenv()
+
+PROVIDERS = os.getenv("PROVIDERS", "live").lower()
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+FAKE_TOKEN_LATENCY = float(os.getenv("FAKE_TOKEN_LATENCY", "0.005"))
+FAKE_EMBED_LATENCY = float(os.getenv("FAKE_EMBED_LATENCY", "0.05"))
+FAKE_NEO4J = os.getenv("FAKE_NEO4J", "null").lower()
+FAKE_NEO4J_LATENCY = float(os.getenv("FAKE_NEO4J_LATENCY", "0.01"))
+FAKE_RESPONSE_WORDS = int(os.getenv("FAKE_RESPONSE_WORDS", "120"))
+FAKE_LLM_TAIL_RATE = float(os.getenv("FAKE_LLM_TAIL_RATE", "0"))
+FAKE_LLM_TAIL_LATENCY = float(os.getenv("FAKE_LLM_TAIL_LATENCY", "2.0"))
+
+WORD_RE = re.compile(r"\w+")
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+# ======================== Fake Chat Model ========================
+
+# Keyword hints used by the fake intent classifier before falling back to a hash
+INTENT_HINTS = [
+    ("summar", "summarize"), ("translat", "translate"), ("compare", "compare"), ("review", "review"),
+    ("rephrase", "rephrase"), ("outline", "outline"), ("expand", "expand"), ("analy", "analyze"),
+    ("advice", "advise"), ("advise", "advise"), ("edit", "edit"), ("explain", "explain"),
+    ("why", "reason"), ("code", "code"), ("function", "code"), ("write", "generate"),
+]
+FAKE_INTENTS = ["summarize", "code", "explain", "generate", "reason", "analyze", "advise",
+                "edit", "translate", "compare", "review", "rephrase", "expand", "outline"]
+
+def fake_intent(prompt: str) -> str:
+    lowered = prompt.lower()
+    for hint, intent in INTENT_HINTS:
+        if hint in lowered:
+            return intent
+    return FAKE_INTENTS[_digest(lowered) % len(FAKE_INTENTS)]
+
+# ------------------------------------------------------------------------------
+# fake_reply(text, words) -> str
+# Deterministic answer to one prompt. Recognizes the pipeline's own
+# classification and CoT-judging prompts and answers them in the format
+# utils.py parses; anything else gets generated sentences built from the
+# prompt's words (so lexical and embedding scores behave plausibly).
+# ------------------------------------------------------------------------------
+def fake_reply(text: str, words: int = FAKE_RESPONSE_WORDS) -> str:
+    if "Categorize each numbered prompt" in text:
+        body = text.split("Prompts:\n", 1)[-1]
+        numbered = re.findall(r"^(\d+): (.*)$", body, flags=re.MULTILINE)
+        return "\n".join(f"{n}: {fake_intent(p)}" for n, p in numbered)
+    if "Categorize the user's prompt" in text:
+        return fake_intent(text.split("Prompt:\n", 1)[-1])
+    if "Rate each numbered answer" in text:
+        answers = re.findall(r"^### Answer (\d+)\n(.*?)(?=^### Answer |\Z)", text, flags=re.MULTILINE | re.DOTALL)
+        return "\n".join(f"{n}: {4 + _digest(answer) % 6}" for n, answer in answers)
+    if "Respond with a number from 0 to 10" in text:
+        return str(4 + _digest(text) % 6)
+
+    vocabulary = WORD_RE.findall(text.split("\n\n", 1)[-1].lower()) or ["answer"]
+    seed = _digest(text)
+    out, sentence = [], []
+    for i in range(words):
+        sentence.append(vocabulary[(seed + i * 7919) % len(vocabulary)])
+        if len(sentence) >= 8 + (seed + i) % 7:
+            out.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+    if sentence:
+        out.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(out)
+
+# ------------------------------------------------------------------------------
+# FakeChatModel
+#
+# Offline chat model. Supports invoke/ainvoke/astream and LangChain
+# callbacks (so /metrics sees it like a real client) and reports
+# word-count token usage.
+# ------------------------------------------------------------------------------
+class FakeChatModel(BaseChatModel):
+    model_name: str = "fake"
+    latency: float = FAKE_LLM_LATENCY
+    token_latency: float = FAKE_TOKEN_LATENCY
+    words: int = FAKE_RESPONSE_WORDS
+    tail_rate: float = FAKE_LLM_TAIL_RATE
+    tail_latency: float = FAKE_LLM_TAIL_LATENCY
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages) -> tuple:
+        text = "\n".join(m.content for m in messages if isinstance(m.content, str))
+        reply = fake_reply(text, self.words)
+        usage = {"input_tokens": len(text.split()), "output_tokens": len(reply.split()),
+                 "total_tokens": len(text.split()) + len(reply.split())}
+        return reply, usage
+
+    def _first_token_delay(self) -> float:
+        # Occasional stalls model an upstream's latency tail
+        return self.latency + (self.tail_latency if random.random() < self.tail_rate else 0.0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply, usage = self._reply(messages)
+        time.sleep(self._first_token_delay() + self.token_latency * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply, usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply, usage = self._reply(messages)
+        await asyncio.sleep(self._first_token_delay() + self.token_latency * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply, usage_metadata=usage))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        reply, usage = self._reply(messages)
+        await asyncio.sleep(self._first_token_delay())
+        tokens = reply.split(" ")
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=token if i == 0 else " " + token,
+                usage_metadata=usage if i == len(tokens) - 1 else None,
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+# ======================== Fake Embeddings ========================
+
+# ------------------------------------------------------------------------------
+# FakeEmbeddings
+#
+# Hashing-trick bag-of-words embeddings: each word adds a fixed random
+# direction, so texts sharing most words have a high cosine similarity.
+# Same interface as OpenAIEmbeddings (embed_* and aembed_*).
+# ------------------------------------------------------------------------------
+class FakeEmbeddings:
+    def __init__(self, dim: int = 1536, latency: float = FAKE_EMBED_LATENCY):
+        self.dim = dim
+        self.latency = latency
+        self._directions = {}
+
+    def _direction(self, word: str) -> np.ndarray:
+        vec = self._directions.get(word)
+        if vec is None:
+            vec = np.random.default_rng(_digest(word)).standard_normal(self.dim).astype(np.float32)
+            self._directions[word] = vec
+        return vec
+
+    def _embed(self, text: str) -> list:
+        vec = self._direction("\0bias") * 0.1
+        for word in WORD_RE.findall(text.lower()):
+            vec = vec + self._direction(word)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
+
+# ======================== Fake Neo4j ========================
+
+# ------------------------------------------------------------------------------
+# NullNeo4jDriver
+#
+# Write sink standing in for neo4j.AsyncDriver when PROVIDERS=fake (unless
+# FAKE_NEO4J=live): every query waits FAKE_NEO4J_LATENCY and is counted.
+# The `rows` of every write are kept per query in `written`, and Text
+# bodies are served back by hash, so hashed prompts and responses
+# resolve. It models no other Cypher, so the remaining reads come back
+# empty (the model router keeps its priors, analytics and rescoring see
+# no history); run those paths against a real Neo4j with FAKE_NEO4J=live.
+# ------------------------------------------------------------------------------
+class NullNeo4jDriver:
+    def __init__(self, latency: float = FAKE_NEO4J_LATENCY):
+        self.latency = latency
+        self.queries = 0
+        self.written = {}
+        self._texts = {}
+
+    async def execute_query(self, query: str, parameters_: dict | None = None, **params):
+        await asyncio.sleep(self.latency)
+        self.queries += 1
+        params = {**(parameters_ or {}), **params}
+        if query == TEXT_QUERY:
+            return [self._texts[key] for key in params["hashes"] if key in self._texts], None, []
+        if query == TEXT_WRITE_QUERY:
+            for row in params["rows"]:
+                self._texts.setdefault(row["hash"], row)
+        if "rows" in params:
+            self.written.setdefault(query, []).extend(params["rows"])
+        return [], None, []
+
+    async def verify_connectivity(self):
+        return None
+
+    async def close(self):
+        return None
+
+# ======================== Factories ========================
+
+# Provider SDKs are imported inside the factories: they account for most of
+# the backend's import time and are not needed at all under PROVIDERS=fake.
+
+# ------------------------------------------------------------------------------
+# make_http_client(max_connections, max_keepalive, timeout) -> httpx.AsyncClient
+# Connection pool shared by every OpenAI client (chat and embeddings), so
+# keep-alive connections are reused across models instead of each client
+# opening its own. Returns None under PROVIDERS=fake.
+# ------------------------------------------------------------------------------
+def make_http_client(max_connections: int = 100, max_keepalive: int = 20, timeout: float = 60.0):
+    if PROVIDERS == "fake":
+        return None
+    import httpx
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    )
+
+# ------------------------------------------------------------------------------
+# make_chat(model, http_client=None, **options) -> chat model
+# Real OpenAI/Gemini client for `model`, or a FakeChatModel under
+# PROVIDERS=fake. `callbacks` and other options are passed through;
+# OpenAI models use `http_client` as their async connection pool.
+# ------------------------------------------------------------------------------
+def make_chat(model: str, http_client=None, **options):
+    if PROVIDERS == "fake":
+        return FakeChatModel(model_name=model, callbacks=options.get("callbacks"))
+    if model.startswith("gemini"):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, google_api_key=os.getenv("GOOGLE_API_KEY"), **options)
+    from langchain_openai import ChatOpenAI
+    if http_client is not None:
+        options["http_async_client"] = http_client
+    return ChatOpenAI(model=model, openai_api_key=os.getenv("OPENAI_API_KEY"), stream_usage=True, **options)
+
+def make_embeddings(model: str, http_client=None):
+    if PROVIDERS == "fake":
+        return FakeEmbeddings()
+    from langchain_openai import OpenAIEmbeddings
+    options = {"http_async_client": http_client} if http_client is not None else {}
+    return OpenAIEmbeddings(model=model, openai_api_key=os.getenv("OPENAI_API_KEY"), **options)
+
+# ------------------------------------------------------------------------------
+# make_driver(uri, username, password, pool_size, acquisition_timeout, connection_timeout)
+# Async Neo4j driver with an explicitly sized connection pool. Creating
+# the driver does not connect; the first query (or warm-up) does. Under
+# PROVIDERS=fake this is the write sink unless FAKE_NEO4J=live.
+# ------------------------------------------------------------------------------
+def make_driver(uri: str | None, username: str | None, password: str | None, pool_size: int = 50,
+                acquisition_timeout: float = 10.0, connection_timeout: float = 5.0):
+    if PROVIDERS == "fake" and FAKE_NEO4J != "live":
+        return NullNeo4jDriver()
+    from neo4j import AsyncGraphDatabase
+    return AsyncGraphDatabase.driver(
+        uri,
+        auth=(username, password),
+        max_connection_pool_size=pool_size,
+        connection_acquisition_timeout=acquisition_timeout,
+        connection_timeout=connection_timeout,
+    )
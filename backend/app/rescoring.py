@@ -0,0 +1,248 @@
+"""
+===================================================================
+  rescoring.py — Bulk re-scoring of logged responses
+===================================================================
+
+This module re-applies the response scoring rubric to the interaction
+history stored in Neo4j, e.g. after the rubric changes. Its
+responsibilities include:
+
+1. Scoring many prompt/response pairs in one call: lexical features
+   are extracted per pair with the shared precompiled tokenizers, and
+   the rubric bands are applied to whole NumPy arrays at once.
+2. Embedding all prompts and responses of a batch in a single
+   embedding call (through the memoized embedding client), then
+   computing every cosine similarity as one matrix operation.
+3. Streaming Prompt/Response pairs out of Neo4j in keyset-paginated
+   pages (timestamp, element id), fetching the next page while the
+   current one is scored. Text stored as hashed Text nodes is resolved
+   per page (see text_store.py).
+4. Writing updated scores back with one UNWIND query per page.
+5. Providing an offline command to run a full re-score, or a dry run
+   that only reports how scores would change. A real run rebuilds the
+   analytics aggregates afterwards (see analytics.py).
+
+The stored chain-of-thought score is reused unless --judge is given,
+in which case every response is re-rated by the tiered CoT scorer
+(cot_scoring.py; borderline responses go to the batched LLM judge).
+
+Usage (from backend/app/):
+    python rescoring.py --page-size 500 --dry-run
+    python rescoring.py --page-size 500 --since 2025-01-01T00:00:00Z
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from analytics import rebuild_aggregates
+from evaluation import lexical_features
+from text_store import TextStore
+
+# Keyset pagination over the response timestamp index: the range predicate
+# on its own conjunct lets the planner seek the index, the element id breaks
+# ties between responses logged in the same instant, and the prompt and
+# intent are only expanded for the page that survives ORDER BY ... LIMIT
+PAGE_QUERY = """
+MATCH (r:Response)
+WHERE r.timestamp >= datetime($after_ts)
+  AND (r.timestamp > datetime($after_ts) OR elementId(r) > $after_id)
+WITH r ORDER BY r.timestamp, elementId(r)
+LIMIT $limit
+OPTIONAL MATCH (p:Prompt)-[:GOT_RESPONSE]->(r)
+OPTIONAL MATCH (i:Intent)-[:TRIGGERED]->(r)
+RETURN elementId(r) AS id, toString(r.timestamp) AS timestamp,
+       p.text AS prompt, p.key AS prompt_hash, r.text AS response,
+       r.text_hash AS response_hash, i.type AS intent,
+       r.score AS score, r.cot_score AS cot_score
+ORDER BY r.timestamp, elementId(r)
+"""
+
+UPDATE_QUERY = """
+UNWIND $rows AS row
+MATCH (r:Response) WHERE elementId(r) = row.id
+SET r.score = row.score, r.cot_score = row.cot_score, r.rescored_at = datetime()
+"""
+
+# Start of time for the first page
+EPOCH = "0001-01-01T00:00:00Z"
+
+# ======================== Batch Scoring ========================
+
+def band_points_array(values: np.ndarray, bands: tuple, above: bool = True) -> np.ndarray:
+    # Vectorized utils.band_points: first matching band wins, otherwise 0
+    conditions = [(values > threshold) if above else (values < threshold) for threshold, _ in bands]
+    return np.select(conditions, [points for _, points in bands], default=0)
+
+# ------------------------------------------------------------------------------
+# cosine_rows(a, b) -> np.ndarray
+# Row-wise cosine similarity of two (n, d) matrices. Rows with a zero
+# vector get NaN, which scores 0 like a failed similarity check.
+# ------------------------------------------------------------------------------
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.einsum("ij,ij->i", a, b) / norms
+
+# ------------------------------------------------------------------------------
+# score_pairs(prompts, responses, intents, cot_scores, embed) -> dict
+#
+# Scores n pairs with the same rubric as utils.score_response.
+#   - cot_scores: raw 0-10 chain-of-thought ratings, one per pair
+#   - embed: async list[str] -> list[vector] function (one call per batch)
+# Returns the total scores and each component as integer arrays.
+# ------------------------------------------------------------------------------
+async def score_pairs(prompts: list, responses: list, intents: list, cot_scores: list, embed) -> dict:
+    from utils import (OVERLAP_BANDS, SIMILARITY_BANDS, SENTENCE_BANDS,
+                       SUMMARY_LENGTH_BANDS, LENGTH_BANDS)
+
+    n = len(prompts)
+    if n == 0:
+        return {"score": np.zeros(0, dtype=int)}
+
+    # Lexical features
+    features = [lexical_features(prompt, response) for prompt, response in zip(prompts, responses)]
+    overlap = np.array([len(f.prompt_words & f.response_words) / max(len(f.prompt_words), 1) for f in features])
+    words = np.array([f.word_count for f in features])
+    sentence_length = np.array([f.avg_sentence_length for f in features])
+    intents = np.array(intents, dtype=object)
+    summarize = intents == "summarize"
+
+    # Embeddings: one call for every distinct text in the batch
+    texts = list(dict.fromkeys(prompts + responses))
+    vectors = np.asarray(await embed(texts), dtype=np.float32)
+    index = {text: i for i, text in enumerate(texts)}
+    similarity = cosine_rows(vectors[[index[p] for p in prompts]], vectors[[index[r] for r in responses]])
+
+    components = {
+        "length": np.where(summarize,
+                           band_points_array(words, SUMMARY_LENGTH_BANDS, above=False),
+                           band_points_array(words, LENGTH_BANDS)),
+        "overlap": band_points_array(overlap, OVERLAP_BANDS),
+        "similarity": band_points_array(similarity, SIMILARITY_BANDS),
+        "readability": band_points_array(sentence_length, SENTENCE_BANDS, above=False),
+        "cot": np.array([cot or 0 for cot in cot_scores], dtype=float) * 2,
+    }
+    total = sum(components.values())
+
+    # Round to nearest 10; translation is always full score by design
+    score = (np.round(total / 10.0) * 10).astype(int)
+    score[intents == "translate"] = 100
+    return {"score": score, **{name: values.astype(int) for name, values in components.items()}}
+
+# ======================== History ========================
+
+async def fetch_page(driver, after: tuple, limit: int) -> list:
+    records, _, _ = await driver.execute_query(PAGE_QUERY, after_ts=after[0], after_id=after[1], limit=limit)
+    return records
+
+# ------------------------------------------------------------------------------
+# rescore_history(driver, embed, judge=None, page_size=500, since=None,
+#                 dry_run=False, concurrency=8, on_page=None) -> dict
+#
+# Re-scores every logged response (optionally only those after `since`,
+# an ISO-8601 timestamp) page by page. With `judge`, an async
+# response -> 0-10 function, the CoT score is re-rated with at most
+# `concurrency` calls in flight; otherwise the stored value is reused.
+# `on_page(pages, responses, seconds)` is called after each page.
+# Returns totals: responses seen, scores changed, old/new mean score.
+# ------------------------------------------------------------------------------
+async def rescore_history(driver, embed, judge=None, page_size: int = 500, since: str | None = None,
+                          dry_run: bool = False, concurrency: int = 8, on_page=None) -> dict:
+    totals = {"responses": 0, "changed": 0, "old_sum": 0.0, "new_sum": 0.0, "pages": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    texts = TextStore(driver)
+
+    async def rejudge(response: str) -> float:
+        async with semaphore:
+            return await judge(response)
+
+    start = time.perf_counter()
+    next_page = asyncio.create_task(fetch_page(driver, (since or EPOCH, ""), page_size))
+    while True:
+        records = await next_page
+        if not records:
+            break
+        # Read ahead while this page is scored and written
+        last = records[-1]
+        next_page = asyncio.create_task(fetch_page(driver, (last["timestamp"], last["id"]), page_size))
+
+        records = await texts.fill(records, {"prompt": "prompt_hash", "response": "response_hash"})
+        records = [r for r in records
+                   if r["prompt"] is not None and r["response"] is not None and r["intent"] is not None]
+        responses = [r["response"] for r in records]
+        if judge is not None:
+            cot_scores = await asyncio.gather(*(rejudge(response) for response in responses))
+        else:
+            cot_scores = [r["cot_score"] for r in records]
+        scored = await score_pairs([r["prompt"] for r in records], responses,
+                                   [r["intent"] for r in records], cot_scores, embed)
+
+        rows = [
+            {"id": record["id"], "score": int(score), "cot_score": cot}
+            for record, score, cot in zip(records, scored["score"], cot_scores)
+        ]
+        if rows and not dry_run:
+            await driver.execute_query(UPDATE_QUERY, rows=rows)
+
+        old = [r["score"] or 0 for r in records]
+        totals["responses"] += len(rows)
+        totals["changed"] += sum(1 for before, row in zip(old, rows) if before != row["score"])
+        totals["old_sum"] += sum(old)
+        totals["new_sum"] += sum(row["score"] for row in rows)
+        totals["pages"] += 1
+        if on_page is not None:
+            on_page(totals["pages"], totals["responses"], time.perf_counter() - start)
+
+    n = max(1, totals["responses"])
+    return {
+        "responses": totals["responses"],
+        "changed": totals["changed"],
+        "pages": totals["pages"],
+        "old_mean": round(totals["old_sum"] / n, 2),
+        "new_mean": round(totals["new_sum"] / n, 2),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+# ======================== Command Line ========================
+
+def print_progress(pages: int, responses: int, seconds: float):
+    print(f"page {pages}: {responses} responses, {responses / max(seconds, 1e-9):.0f}/s")
+
+async def run(args):
+    import utils
+    await utils.ensure_clients()
+    try:
+        summary = await rescore_history(
+            utils.driver,
+            utils.embedding_model.aembed_documents,
+            judge=utils.COT_SCORER.score if args.judge else None,
+            page_size=args.page_size,
+            since=args.since,
+            dry_run=args.dry_run,
+            concurrency=args.concurrency,
+            on_page=print_progress,
+        )
+        if not args.dry_run and utils.ANALYTICS_ROLLUP:
+            summary["analytics"] = await rebuild_aggregates(utils.driver)
+    finally:
+        await utils.close_clients()
+    print(summary)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score logged responses with the current rubric.")
+    parser.add_argument("--page-size", type=int, default=500, help="responses per read/write batch")
+    parser.add_argument("--since", default=None, help="only responses logged after this ISO-8601 time")
+    parser.add_argument("--judge", action="store_true", help="re-rate chain-of-thought (tiered scorer)")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM judge calls in flight with --judge")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing them")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
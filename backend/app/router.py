@@ -12,16 +12,68 @@ Key functionalities:
 3. Returns structured JSON responses including model metadata.
 4. Supports an optional email field for user/session tracking.
 5. Separates basic prompt handling (/prompt) from enhancement logic (/enhance).
+6. Reports rolling per-stage pipeline latencies (/stats/pipeline).
+7. Reports external calls made per request (/stats/calls).
+8. Reports the background Neo4j writer's queue and throughput (/stats/neo4j).
+9. Streams model tokens as newline-delimited JSON (/prompt/stream,
+   /enhance/stream) with score and cache metadata in a trailing event.
+10. Answers many prompts in one request with shared embedding and
+    classification calls (/prompt/batch); oversized batches get 413.
+11. Reports embedding memo hit rates and upstream calls (/stats/embeddings).
+12. Adds a per-stage timing breakdown (ms) to /prompt and /enhance
+    responses when called with ?timings=true.
+13. Rejects requests with 503 and Retry-After when a model's admission
+    queue is full, and reports per-model queues (/stats/admission).
+14. Reports the adaptive model router's per-intent choices and reward
+    estimates (/stats/router).
+15. Answers 504 when a generation misses its deadline, and reports how
+    often slow generations were hedged to a second model (/stats/hedging).
+16. Reports speculative background enhancements started, claimed by a
+    later /enhance, skipped over budget or expired (/stats/speculation).
+17. Reports how chain-of-thought scores were settled: locally, by the
+    batched judge or per response (/stats/cot).
+18. Serves dashboard analytics from precomputed aggregates: daily rows
+    per model and intent (/analytics/daily), window totals
+    (/analytics/summary) and per-user totals (/analytics/users/{email}).
 
 ===================================================================
 """
 
-from fastapi import APIRouter
+import json
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from utils import route_prompt, enhance_prompt  
+from utils import route_prompt, route_prompt_batch, BatchTooLarge, enhance_prompt, stream_route_prompt, stream_enhance_prompt, neo4j_writer, embedding_model, ADMISSION, MODEL_ROUTER, HEDGER, SPECULATOR, COT_SCORER
+from utils import analytics_daily, analytics_summary, analytics_user
+from admission import Overloaded
+from hedging import DeadlineExceeded
+from pipeline import STAGE_LATENCY, capture_timings
+from evaluation import CALL_STATS
 
 router = APIRouter()
 
+# ============================================================
+# overloaded(e) -> HTTPException
+# 503 telling the client when the model is likely to have room.
+# ============================================================
+def overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# ============================================================
+# deadline_exceeded(e) -> HTTPException
+# 504 for a generation that did not finish before its deadline.
+# ============================================================
+def deadline_exceeded(e: DeadlineExceeded) -> HTTPException:
+    return HTTPException(status_code=504, detail=str(e))
+
+# ============================================================
+# batch_too_large(e) -> HTTPException
+# 413 for a batch with more prompts than the server accepts.
+# ============================================================
+def batch_too_large(e: BatchTooLarge) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
 # ============================================================
 # Request schema for prompt submission
 # Contains:
@@ -32,35 +84,252 @@ class PromptInput(BaseModel):
     prompt: str
     email: str | None = None
 
+# ============================================================
+# Request schema for batch prompt submission
+# Contains:
+#   - prompts (list[str]): prompts to answer
+#   - email (Optional[str]): optional user email for tracking
+# ============================================================
+class BatchPromptInput(BaseModel):
+    prompts: list[str]
+    email: str | None = None
+
 # ============================================================
 # POST /prompt
 # Accepts a prompt and optional email from the client.
 # Routes the prompt through the classification and response
 # generation pipeline and returns the result.
+# With ?timings=true the response also carries the stage timings.
 # ============================================================
 @router.post("/prompt")
-async def handle_prompt(data: PromptInput):
-    intent, response, score, model_used, served_from_cache = await route_prompt(data.prompt, data.email)
-    return {
+async def handle_prompt(data: PromptInput, timings: bool = False):
+    with capture_timings() as stage_timings:
+        try:
+            intent, response, score, model_used, served_from_cache = await route_prompt(data.prompt, data.email)
+        except Overloaded as e:
+            raise overloaded(e)
+        except DeadlineExceeded as e:
+            raise deadline_exceeded(e)
+    result = {
         "intent": intent,
         "response": response,
         "score": score,
         "model": model_used,
         "served_from_cache": served_from_cache
     }
+    if timings:
+        result["timings"] = stage_timings
+    return result
+
+# ============================================================
+# POST /prompt/batch
+# Accepts several prompts and returns one result per prompt, in
+# order. Prompts are embedded and classified together, near-
+# duplicates are answered once, and generation runs with a
+# bounded concurrency.
+# ============================================================
+@router.post("/prompt/batch")
+async def handle_prompt_batch(data: BatchPromptInput):
+    try:
+        results = await route_prompt_batch(data.prompts, data.email)
+    except BatchTooLarge as e:
+        raise batch_too_large(e)
+    return {
+        "results": [
+            {
+                "intent": intent,
+                "response": response,
+                "score": score,
+                "model": model_used,
+                "served_from_cache": served_from_cache
+            }
+            for intent, response, score, model_used, served_from_cache in results
+        ]
+    }
 
 # ============================================================
 # POST /enhance
 # Accepts a prompt and optional email from the client.
 # Enhances the prompt using a specialized enhancement pipeline
 # and returns the improved result.
+# With ?timings=true the response also carries the stage timings.
 # ============================================================
 @router.post("/enhance")
-async def enhance_route(data: PromptInput):
-    intent, response, score, model_used = await enhance_prompt(data.prompt, data.email)
-    return {
+async def enhance_route(data: PromptInput, timings: bool = False):
+    with capture_timings() as stage_timings:
+        try:
+            intent, response, score, model_used = await enhance_prompt(data.prompt, data.email)
+        except Overloaded as e:
+            raise overloaded(e)
+        except DeadlineExceeded as e:
+            raise deadline_exceeded(e)
+    result = {
         "intent": intent,
         "response": response,
         "score": score,
         "model": model_used
     }
+    if timings:
+        result["timings"] = stage_timings
+    return result
+
+# ============================================================
+# ndjson(events)
+# Serializes pipeline events as newline-delimited JSON. Errors
+# raised after the stream has started are reported as a final
+# "error" event because the status code has already been sent.
+# ============================================================
+async def ndjson(events, first=None):
+    try:
+        if first is not None:
+            yield json.dumps(first) + "\n"
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    except Exception:
+        yield json.dumps({"type": "error", "message": "[ERROR] Streaming failed."}) + "\n"
+
+# ============================================================
+# stream_response(events) -> StreamingResponse
+# Waits for the first event before sending headers, so a request
+# the model's admission queue rejects still gets a 503 and one
+# with no first token by the deadline a 504.
+# ============================================================
+async def stream_response(events):
+    try:
+        first = await anext(events)
+    except Overloaded as e:
+        raise overloaded(e)
+    except DeadlineExceeded as e:
+        raise deadline_exceeded(e)
+    except Exception:
+        first = {"type": "error", "message": "[ERROR] Streaming failed."}
+    return StreamingResponse(ndjson(events, first), media_type="application/x-ndjson")
+
+# ============================================================
+# POST /prompt/stream
+# Streaming version of /prompt. Emits {"type": "token"} events
+# as the model generates, then a {"type": "done"} event with
+# intent, score, model and served_from_cache.
+# ============================================================
+@router.post("/prompt/stream")
+async def stream_prompt(data: PromptInput):
+    return await stream_response(stream_route_prompt(data.prompt, data.email))
+
+# ============================================================
+# POST /enhance/stream
+# Streaming version of /enhance with the same event format.
+# ============================================================
+@router.post("/enhance/stream")
+async def stream_enhance(data: PromptInput):
+    return await stream_response(stream_enhance_prompt(data.prompt, data.email))
+
+# ============================================================
+# GET /stats/pipeline
+# Returns p50/p99 latency (ms) for every pipeline stage and the
+# end-to-end totals over the most recent requests.
+# ============================================================
+@router.get("/stats/pipeline")
+async def pipeline_stats():
+    return STAGE_LATENCY.summary()
+
+# ============================================================
+# GET /stats/calls
+# Returns the average number of external calls (LLM, embedding,
+# Neo4j) made per handled request.
+# ============================================================
+@router.get("/stats/calls")
+async def call_stats():
+    return CALL_STATS.summary()
+
+# ============================================================
+# GET /stats/neo4j
+# Returns the background Neo4j writer's queue depth and the
+# number of interactions written, failed and batches flushed.
+# ============================================================
+@router.get("/stats/neo4j")
+async def neo4j_stats():
+    return neo4j_writer.stats()
+
+# ============================================================
+# GET /stats/embeddings
+# Returns memory/disk hits, misses and the number of upstream
+# embedding calls made by the embedding memo.
+# ============================================================
+@router.get("/stats/embeddings")
+async def embedding_stats():
+    return embedding_model.stats()
+
+# ============================================================
+# GET /stats/admission
+# Returns per-model in-flight generations, queue depth, available
+# token budget and admitted/rejected totals.
+# ============================================================
+@router.get("/stats/admission")
+async def admission_stats():
+    return ADMISSION.stats()
+
+# ============================================================
+# GET /stats/router
+# Returns, per intent, the model the router would choose now and each
+# model's sample count, mean reward and mean generation latency.
+# ============================================================
+@router.get("/stats/router")
+async def router_stats():
+    return MODEL_ROUTER.stats()
+
+# ============================================================
+# GET /stats/hedging
+# Returns hedge and fallback counts, deadline misses, and per-model
+# first-token latency percentiles with the current hedge delay.
+# ============================================================
+@router.get("/stats/hedging")
+async def hedging_stats():
+    return HEDGER.stats()
+
+# ============================================================
+# GET /stats/speculation
+# Returns speculative enhancement counts (started, skipped, claimed,
+# expired, failed), the number stored and the share claimed.
+# ============================================================
+@router.get("/stats/speculation")
+async def speculation_stats():
+    return SPECULATOR.stats()
+
+# ============================================================
+# GET /stats/cot
+# Returns the CoT scoring mode, responses settled per tier, batched
+# judge calls and the mean gap between local and judged scores.
+# ============================================================
+@router.get("/stats/cot")
+async def cot_stats():
+    return COT_SCORER.stats()
+
+# ============================================================
+# GET /analytics/daily
+# Returns one row per day, model and intent over the last `days`
+# days (optionally one model or intent): responses, cache hits and
+# hit rate, mean score, score histogram and mean latency.
+# ============================================================
+@router.get("/analytics/daily")
+async def daily_analytics(days: int = Query(7, ge=1, le=366), model: str | None = None, intent: str | None = None):
+    return {"days": days, "rows": await analytics_daily(days, model, intent)}
+
+# ============================================================
+# GET /analytics/summary
+# Returns the same figures over the last `days` days, in total and
+# per model and per intent.
+# ============================================================
+@router.get("/analytics/summary")
+async def summary_analytics(days: int = Query(7, ge=1, le=366)):
+    return await analytics_summary(days)
+
+# ============================================================
+# GET /analytics/users/{email}
+# Returns one user's all-time totals, first and last activity.
+# ============================================================
+@router.get("/analytics/users/{email}")
+async def user_analytics(email: str):
+    stats = await analytics_user(email)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No activity recorded for this user.")
+    return stats
@@ -0,0 +1,41 @@
+"""
+===================================================================
+  singleflight.py — Coalescing of concurrent identical requests
+===================================================================
+
+When several identical prompts arrive while the first one is still
+being processed, only the first (the leader) runs the pipeline; the
+others await the leader's result instead of starting their own
+upstream calls.
+
+===================================================================
+"""
+
+import asyncio
+
+# ------------------------------------------------------------------------------
+# SingleFlight
+#
+# `do(key, factory)` runs `factory()` once per key at a time and returns
+# (result, shared). `shared` is False for the caller that ran the work and
+# True for callers that joined an in-flight call. The work runs as its own
+# task, so a cancelled caller does not cancel it for the others.
+# ------------------------------------------------------------------------------
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,143 @@
+"""
+===================================================================
+  speculation.py — Speculative background enhancement
+===================================================================
+
+Users usually ask for an enhanced answer right after a low-scoring
+one. This module lets the pipeline start that enhancement in the
+background as soon as the low score is known, so the follow-up
+/enhance can return the stored result. Its responsibilities include:
+
+1. Holding speculative results (or their in-flight tasks) in a bounded,
+   TTL'd store keyed by prompt and user; each result is claimed once.
+2. Capping speculative work with a budget: at most `max_in_flight`
+   runs at a time, at most `per_minute` started per minute, and none
+   while foreground requests are queued for the model (see admission.py).
+3. Reporting how many speculations were started, skipped (over budget),
+   claimed, expired unclaimed or failed.
+
+===================================================================
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+SPECULATIONS = REGISTRY.counter(
+    "promptlink_speculative_enhancements_total", "Speculative enhancements, by outcome.", ("outcome",))
+
+def speculation_key(prompt: str, email: str | None) -> str:
+    return hashlib.sha256(f"{email or ''}\0{prompt.strip()}".encode("utf-8")).hexdigest()
+
+# ------------------------------------------------------------------------------
+# Speculator
+#
+#   - capacity: stored results (oldest are dropped, and cancelled if running)
+#   - ttl: seconds a result stays claimable
+#   - max_in_flight: speculative runs at once
+#   - per_minute: speculative runs started per minute (token bucket)
+#   - busy: callable returning True while foreground work is queued
+# ------------------------------------------------------------------------------
+class Speculator:
+    def __init__(self, capacity: int = 1000, ttl: float = 600.0, max_in_flight: int = 2,
+                 per_minute: float = 30.0, busy=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_in_flight = max_in_flight
+        self.per_minute = per_minute
+        self.busy = busy or (lambda: False)
+
+        self._entries = OrderedDict()   # key -> (expires_at, task)
+        self._in_flight = 0
+        self._tokens = per_minute
+        self._refilled_at = time.monotonic()
+        self.counts = {"started": 0, "skipped": 0, "claimed": 0, "expired": 0, "failed": 0}
+
+    def _count(self, outcome: str):
+        self.counts[outcome] += 1
+        SPECULATIONS.inc(outcome=outcome)
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.per_minute, self._tokens + (now - self._refilled_at) * self.per_minute / 60)
+        self._refilled_at = now
+        if self._in_flight >= self.max_in_flight or self._tokens < 1 or self.busy():
+            return False
+        self._tokens -= 1
+        return True
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, (expires_at, task) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.capacity and expires_at > now:
+                return
+            del self._entries[key]
+            task.cancel()
+            self._count("expired")
+
+    def _done(self, task: asyncio.Task):
+        self._in_flight -= 1
+        if not task.cancelled() and task.exception() is not None:
+            self._count("failed")
+
+    # --------------------------------------------------------------------------
+    # start(prompt, email, factory) -> bool
+    # Starts `factory()` (a coroutine producing the enhancement) in the
+    # background if the budget allows and nothing is stored for the key yet.
+    # --------------------------------------------------------------------------
+    def start(self, prompt: str, email: str | None, factory) -> bool:
+        key = speculation_key(prompt, email)
+        now = time.monotonic()
+        self._evict(now)
+        if key in self._entries:
+            return False
+        if not self._take_budget():
+            self._count("skipped")
+            return False
+        task = asyncio.create_task(factory())
+        self._in_flight += 1
+        task.add_done_callback(self._done)
+        self._entries[key] = (now + self.ttl, task)
+        self._evict(now)
+        self._count("started")
+        return True
+
+    # --------------------------------------------------------------------------
+    # claim(prompt, email) -> result | None
+    # Removes and returns the stored enhancement, waiting for it if it is
+    # still running. Returns None when there is none or it failed.
+    # --------------------------------------------------------------------------
+    async def claim(self, prompt: str, email: str | None):
+        self._evict(time.monotonic())
+        entry = self._entries.pop(speculation_key(prompt, email), None)
+        if entry is None:
+            return None
+        task = entry[1]
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception:
+            return None
+        self._count("claimed")
+        return result
+
+    def cancel_all(self):
+        # Shutdown: drop everything still stored or running
+        for _, task in self._entries.values():
+            task.cancel()
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        started = max(1, self.counts["started"])
+        return {
+            **self.counts,
+            "stored": len(self._entries),
+            "in_flight": self._in_flight,
+            "claim_rate": round(self.counts["claimed"] / started, 4),
+        }
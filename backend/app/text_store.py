@@ -0,0 +1,236 @@
+"""
+===================================================================
+  text_store.py — Content-addressed, compressed prompt/response text
+===================================================================
+
+Prompt and response bodies are the bulk of the interaction graph, and
+repeated or cached answers store the same text again and again. This
+module keeps each distinct text once, compressed, in a (:Text {hash})
+node; Prompt and Response nodes then only hold the hash. Its
+responsibilities include:
+
+1. Hashing (SHA-256, the same key Prompt nodes are merged on) and
+   encoding text bodies: zlib above a size threshold, raw UTF-8 below
+   it or when compression does not help.
+2. Writing the distinct bodies of a writer batch with one UNWIND MERGE
+   (existing hashes are left untouched).
+3. Resolving hashes back to text lazily for readers, in one query per
+   batch of hashes, with a bounded in-memory LRU of decoded texts.
+4. Migrating an existing graph from inline `text` properties to Text
+   nodes, page by page, reporting the bytes saved.
+
+Readers handle both layouts: an inline `text` property wins, otherwise
+the hash is resolved here.
+
+Usage (from backend/app/):
+    python text_store.py --migrate --batch-size 500 --dry-run
+    python text_store.py --migrate --batch-size 500
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import hashlib
+import time
+import zlib
+from collections import OrderedDict
+
+TEXT_WRITE_QUERY = """
+UNWIND $rows AS row
+MERGE (t:Text {hash: row.hash})
+  ON CREATE SET t.codec = row.codec, t.body = row.body, t.size = row.size
+"""
+
+TEXT_QUERY = """
+UNWIND $hashes AS hash
+MATCH (t:Text {hash: hash})
+RETURN t.hash AS hash, t.codec AS codec, t.body AS body
+"""
+
+# Migration: inline texts still to convert, then one write per page that
+# stores the body and drops the inline copy
+MIGRATE_RESPONSES_QUERY = """
+MATCH (r:Response) WHERE r.text IS NOT NULL
+RETURN elementId(r) AS id, r.text AS text
+LIMIT $limit
+"""
+
+MIGRATE_PROMPTS_QUERY = """
+MATCH (p:Prompt) WHERE p.text IS NOT NULL
+RETURN elementId(p) AS id, p.text AS text
+LIMIT $limit
+"""
+
+MIGRATE_RESPONSES_WRITE = """
+UNWIND $rows AS row
+MERGE (t:Text {hash: row.hash})
+  ON CREATE SET t.codec = row.codec, t.body = row.body, t.size = row.size
+WITH row
+MATCH (r:Response) WHERE elementId(r) = row.id
+SET r.text_hash = row.hash
+REMOVE r.text
+"""
+
+MIGRATE_PROMPTS_WRITE = """
+UNWIND $rows AS row
+MERGE (t:Text {hash: row.hash})
+  ON CREATE SET t.codec = row.codec, t.body = row.body, t.size = row.size
+WITH row
+MATCH (p:Prompt) WHERE elementId(p) = row.id
+SET p.key = coalesce(p.key, row.hash)
+REMOVE p.text
+"""
+
+# ======================== Encoding ========================
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# ------------------------------------------------------------------------------
+# encode_text(text, level=6, min_bytes=256) -> dict
+# Text node properties for one body: hash, codec ("zlib" or "raw"), the
+# encoded bytes and the original size in bytes.
+# ------------------------------------------------------------------------------
+def encode_text(text: str, level: int = 6, min_bytes: int = 256) -> dict:
+    raw = text.encode("utf-8")
+    codec, body = "raw", raw
+    if len(raw) >= min_bytes:
+        compressed = zlib.compress(raw, level)
+        if len(compressed) < len(raw):
+            codec, body = "zlib", compressed
+    return {"hash": hashlib.sha256(raw).hexdigest(), "codec": codec, "body": body, "size": len(raw)}
+
+def decode_text(codec: str, body: bytes) -> str:
+    return (zlib.decompress(body) if codec == "zlib" else bytes(body)).decode("utf-8")
+
+# ======================== Reads ========================
+
+# ------------------------------------------------------------------------------
+# TextStore
+# Lazy hash -> text resolution with a bounded LRU of decoded bodies.
+#   - cache_size: decoded texts kept in memory
+# ------------------------------------------------------------------------------
+class TextStore:
+    def __init__(self, driver, cache_size: int = 4096):
+        self.driver = driver
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.fetched = 0
+
+    def _remember(self, key: str, text: str):
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # --------------------------------------------------------------------------
+    # resolve(hashes) -> dict
+    # Texts for the given hashes; unknown hashes are left out. Hashes not
+    # in the LRU are fetched with a single query.
+    # --------------------------------------------------------------------------
+    async def resolve(self, hashes) -> dict:
+        found, missing = {}, []
+        for key in dict.fromkeys(h for h in hashes if h):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                found[key] = self._cache[key]
+                self.hits += 1
+            else:
+                missing.append(key)
+        if missing:
+            records, _, _ = await self.driver.execute_query(TEXT_QUERY, hashes=missing)
+            self.fetched += len(records)
+            for record in records:
+                found[record["hash"]] = text = decode_text(record["codec"], record["body"])
+                self._remember(record["hash"], text)
+        return found
+
+    async def get(self, key: str) -> str | None:
+        return (await self.resolve([key])).get(key)
+
+    # --------------------------------------------------------------------------
+    # fill(records, fields) -> list[dict]
+    # Copies of `records` where each text field that is None is resolved
+    # from its hash field; `fields` maps text field -> hash field.
+    # --------------------------------------------------------------------------
+    async def fill(self, records, fields: dict) -> list:
+        rows = [dict(record) for record in records]
+        texts = await self.resolve(row[hash_field] for row in rows for field, hash_field in fields.items()
+                                   if row[field] is None)
+        for row in rows:
+            for field, hash_field in fields.items():
+                if row[field] is None:
+                    row[field] = texts.get(row[hash_field])
+        return rows
+
+# ======================== Migration ========================
+
+# ------------------------------------------------------------------------------
+# migrate_texts(driver, batch_size=500, level=6, min_bytes=256, dry_run=False,
+#               on_page=None) -> dict
+#
+# Moves inline Response and Prompt text into Text nodes. Each page is
+# converted by one query, so an interrupted run resumes where it
+# stopped. A dry run only reports the first page of each label.
+# `on_page(label, converted)` is called after each written page.
+# Returns node counts, distinct bodies and inline vs stored bytes.
+# ------------------------------------------------------------------------------
+async def migrate_texts(driver, batch_size: int = 500, level: int = 6, min_bytes: int = 256,
+                        dry_run: bool = False, on_page=None) -> dict:
+    totals = {"responses": 0, "prompts": 0, "distinct": 0, "inline_bytes": 0, "stored_bytes": 0}
+    seen = set()
+    start = time.perf_counter()
+    for label, read, write in (("responses", MIGRATE_RESPONSES_QUERY, MIGRATE_RESPONSES_WRITE),
+                               ("prompts", MIGRATE_PROMPTS_QUERY, MIGRATE_PROMPTS_WRITE)):
+        while True:
+            records, _, _ = await driver.execute_query(read, limit=batch_size)
+            if not records:
+                break
+            rows = await asyncio.to_thread(
+                lambda: [{"id": r["id"], **encode_text(r["text"], level, min_bytes)} for r in records])
+            totals[label] += len(rows)
+            for row in rows:
+                totals["inline_bytes"] += row["size"]
+                if row["hash"] not in seen:
+                    seen.add(row["hash"])
+                    totals["stored_bytes"] += len(row["body"])
+            if dry_run:
+                break
+            await driver.execute_query(write, rows=rows)
+            if on_page is not None:
+                on_page(label, totals[label])
+    totals["distinct"] = len(seen)
+    totals["saved_ratio"] = round(1 - totals["stored_bytes"] / totals["inline_bytes"], 4) if totals["inline_bytes"] else None
+    totals["seconds"] = round(time.perf_counter() - start, 2)
+    return totals
+
+# ======================== Command Line ========================
+
+def print_progress(label: str, converted: int):
+    print(f"{label}: {converted} converted")
+
+async def run(args):
+    import utils
+    await utils.ensure_clients()
+    try:
+        summary = await migrate_texts(utils.driver, args.batch_size, utils.TEXT_COMPRESS_LEVEL,
+                                      utils.TEXT_COMPRESS_MIN_BYTES, args.dry_run, print_progress)
+    finally:
+        await utils.close_clients()
+    print(summary)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move inline prompt/response text into compressed Text nodes.")
+    parser.add_argument("--migrate", action="store_true", help="convert inline text properties")
+    parser.add_argument("--batch-size", type=int, default=500, help="nodes converted per write")
+    parser.add_argument("--dry-run", action="store_true", help="report the savings of one page per label")
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.error("nothing to do (use --migrate)")
+
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -9,34 +9,66 @@ to process user prompts. Its responsibilities include:
 1. Loading environment variables and initializing language models.
 2. Defining prompt templates for various intent categories.
 3. Detecting user intent using an LLM-powered classification chain.
-4. Routing prompts to the appropriate model and generating responses.
+4. Routing prompts to the appropriate model (learned per intent from
+   score, latency and cost; see model_router.py) and generating responses.
 5. Enhancing responses using custom instructions when needed.
 6. Scoring response quality using multiple heuristics.
-7. Logging prompt-response metadata to a Neo4j graph database.
-8. Managing an in-memory cache for semantic similarity-based reuse.
+7. Logging prompt-response metadata to a Neo4j graph database
+   (batched in the background by neo4j_writer.py), optionally with the
+   text stored deduplicated and compressed (see text_store.py).
+8. Managing a semantic cache (see cache.py / disk_cache.py) for
+   similarity-based reuse.
+9. Admitting generations per model under concurrency and token-rate
+   limits (see admission.py).
+10. Bounding generations with a deadline and hedging slow first tokens
+    to a model on the other provider (see hedging.py).
+11. Optionally enhancing low-scoring responses in the background so a
+    follow-up /enhance is answered from storage (see speculation.py).
+12. Scoring chain-of-thought locally where the structure is clear and
+    with a batched LLM judge otherwise, optionally after the response
+    has been returned (see cot_scoring.py).
+13. Maintaining per model/intent/day and per-user analytics aggregates
+    as interactions and cache hits are logged (see analytics.py).
 
 ==============================================================================
 """
 # ======================== Imports ========================
 
 # Standard libraries
+import asyncio
+import logging
 import os
-import re
-from datetime import datetime, timezone
-from collections import deque
+import time
+from collections import Counter
 import numpy as np
 from dotenv import load_dotenv
 
 # LangChain imports
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import Runnable
-from langchain_google_genai import ChatGoogleGenerativeAI
 
-# Neo4j
-from neo4j import GraphDatabase
+# Local modules
+import analytics
+from cache import CacheBackend, SemanticCache
+from disk_cache import DiskCache
+from pipeline import PipelineRun
+from evaluation import CALL_STATS, EvaluationContext, LexicalFeatures, lexical_features
+from intent_classifier import NearestCentroidClassifier
+from neo4j_writer import Neo4jWriter, ensure_schema
+from embeddings import CachedEmbeddings
+from providers import make_chat, make_driver, make_embeddings, make_http_client
+from metrics import (REGISTRY, ERRORS, CACHE_LOOKUPS, CACHE_SIMILARITY, SCORE_COMPONENTS,
+                     RESPONSE_SCORES, LLMMetricsHandler)
+from singleflight import SingleFlight
+from admission import AdmissionController, Overloaded, parse_limits
+from model_router import ModelRouter
+from hedging import DeadlineExceeded, Hedger
+from speculation import Speculator
+from cot_scoring import BatchJudge, TieredCoTScorer
+
+logger = logging.getLogger(__name__)
 
 # ======================== Environment Variables ========================
 
@@ -48,24 +80,161 @@ NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
 # ======================== LLM Clients ========================
 
-# Initialize OpenAI and Gemini LLM clients for routing and enhancement
-llm_3 = ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=os.getenv("OPENAI_API_KEY"))
-llm_4o = ChatOpenAI(model="gpt-4o", openai_api_key=os.getenv("OPENAI_API_KEY"))
-llm_gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.7
+# OpenAI and Gemini LLM clients for routing and enhancement (offline stand-ins
+# when PROVIDERS=fake). They are built by init_clients() at startup rather than
+# on import, so importing this module stays cheap; each reports latency, token
+# usage and errors to /metrics.
+llm_3 = None
+llm_4o = None
+llm_gemini = None
+
+# Connection pool shared by the OpenAI chat and embedding clients
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+http_client = None
+
+# Embedding model for vector-based semantic comparison, behind a content-addressed
+# memo so repeated texts (prompt lookups, scoring, batch items) are embedded once.
+# The memo exists from import; its upstream client is attached by init_clients().
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-ada-002")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")                  # optional SQLite file for the disk tier
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW", "0.005"))
+
+embedding_model = CachedEmbeddings(
+    None,
+    model_name=EMBED_MODEL,
+    capacity=EMBED_CACHE_SIZE,
+    disk_path=EMBED_CACHE_PATH,
+    batch_window=EMBED_BATCH_WINDOW,
 )
 
-# Embedding model for vector-based semantic comparison
-embedding_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+# ------------------------------------------------------------------------------
+# init_clients()
+# Builds every upstream client that is not set yet (clients installed
+# beforehand, e.g. by benchmarks, are kept). Synchronous and idempotent;
+# start_clients() runs it off the event loop.
+# ------------------------------------------------------------------------------
+def init_clients():
+    global llm_3, llm_4o, llm_gemini, intent_chain, http_client, driver
+    if http_client is None:
+        http_client = make_http_client(LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_TIMEOUT_SECONDS)
+    if llm_3 is None:
+        llm_3 = make_chat("gpt-3.5-turbo", http_client, callbacks=[LLMMetricsHandler("gpt-3.5-turbo")])
+    if llm_4o is None:
+        llm_4o = make_chat("gpt-4o", http_client, callbacks=[LLMMetricsHandler("gpt-4o")])
+    if llm_gemini is None:
+        llm_gemini = make_chat("gemini-2.0-flash", temperature=0.7,
+                               callbacks=[LLMMetricsHandler("gemini-2.0-flash")])
+    if intent_chain is None:
+        intent_chain = intent_prompt | llm_3 | StrOutputParser()
+    if isinstance(embedding_model, CachedEmbeddings) and embedding_model.base is None:
+        embedding_model.base = make_embeddings(EMBED_MODEL, http_client)
+    if driver is None:
+        driver = make_driver(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, NEO4J_POOL_SIZE,
+                             NEO4J_ACQUIRE_TIMEOUT, NEO4J_CONNECT_TIMEOUT)
+    if neo4j_writer.driver is None:
+        neo4j_writer.driver = driver
+
+_clients_task = None
+
+# ------------------------------------------------------------------------------
+# start_clients() -> asyncio.Task
+# Starts building the clients in a worker thread (the provider SDK imports
+# are slow) and returns the shared task; later calls return the same task
+# unless it failed, in which case the build is retried.
+# ------------------------------------------------------------------------------
+def start_clients() -> asyncio.Task:
+    global _clients_task
+    failed = _clients_task is not None and _clients_task.done() and _clients_task.exception() is not None
+    if _clients_task is None or failed:
+        _clients_task = asyncio.ensure_future(asyncio.to_thread(init_clients))
+    return _clients_task
+
+# Awaited at the top of every request path; returns at once after startup
+async def ensure_clients():
+    await start_clients()
+
+async def close_clients():
+    if driver is not None:
+        await driver.close()
+    if http_client is not None:
+        await http_client.aclose()
+
+# ------------------------------------------------------------------------------
+# warm_up() -> dict
+# Builds the clients, opens a first Neo4j connection and creates the schema.
+# Returns a status per check ("ok" or the error); a failing or slow Neo4j
+# (bounded by NEO4J_WARMUP_TIMEOUT) does not stop the server from answering
+# prompts, since logging is write-behind.
+# ------------------------------------------------------------------------------
+async def warm_up() -> dict:
+    checks = {}
+    await ensure_clients()
+    checks["clients"] = "ok"
+    try:
+        await asyncio.wait_for(ensure_schema(driver), NEO4J_WARMUP_TIMEOUT)
+        checks["neo4j"] = "ok"
+    except asyncio.TimeoutError:
+        ERRORS.inc(component="neo4j.schema")
+        logger.error("Neo4j schema setup timed out after %ss", NEO4J_WARMUP_TIMEOUT)
+        checks["neo4j"] = "error: timed out"
+    except Exception as e:
+        ERRORS.inc(component="neo4j.schema")
+        logger.exception("Neo4j schema setup failed")
+        checks["neo4j"] = f"error: {e}"
+    return checks
 
 # ======================== Cache Config ========================
 
-# LRU cache for storing recent (vector, intent, response, model) tuples
-CACHE = deque(maxlen=100)  
+# Semantic cache of (vector, intent, response, model) entries with LRU/TTL eviction
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()             # "memory" or "disk"
+CACHE_CAPACITY = int(os.getenv("CACHE_CAPACITY", "100"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "0")) or None   # 0 disables expiry
+CACHE_ANN = os.getenv("CACHE_ANN", "false").lower() == "true"            # IVF approximate search
+CACHE_ANN_MIN_SIZE = int(os.getenv("CACHE_ANN_MIN_SIZE", "1024"))
+CACHE_ANN_PROBES = int(os.getenv("CACHE_ANN_PROBES", "4"))
+CACHE_DIR = os.getenv("CACHE_DIR", "cache_data")                         # disk backend, shared by workers
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH")                    # memory backend warm-start file
+
+# ------------------------------------------------------------------------------
+# make_cache() -> CacheBackend
+# Builds the configured cache backend. The disk backend is shared by every
+# worker on the host; the memory backend can warm-start from a snapshot.
+# ------------------------------------------------------------------------------
+def make_cache() -> CacheBackend:
+    options = dict(
+        capacity=CACHE_CAPACITY,
+        ttl=CACHE_TTL_SECONDS,
+        ann=CACHE_ANN,
+        ann_min_size=CACHE_ANN_MIN_SIZE,
+        n_probe=CACHE_ANN_PROBES,
+    )
+    if CACHE_BACKEND == "disk":
+        return DiskCache(CACHE_DIR, **options)
+    return SemanticCache(snapshot_path=CACHE_SNAPSHOT_PATH, **options)
+
+CACHE = make_cache()
 SIMILARITY_THRESHOLD = 0.92
 
+# Embedding-first fast path: look up the cache across all intents before
+# classifying, and skip intent detection entirely on a high-confidence hit
+CACHE_FAST_PATH = os.getenv("CACHE_FAST_PATH", "true").lower() == "true"
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.97"))
+
+# ------------------------------------------------------------------------------
+# lookup_cache(vec, intent, threshold, path) -> CacheEntry | None
+# CACHE.lookup plus hit/miss and hit-similarity metrics; `path` is "fast"
+# for the cross-intent lookup and "intent" for the per-intent one.
+# ------------------------------------------------------------------------------
+def lookup_cache(vec, intent: str | None, threshold: float, path: str):
+    cached = CACHE.lookup(vec, intent, threshold)
+    CACHE_LOOKUPS.inc(path=path, result="miss" if cached is None else "hit")
+    if cached is not None:
+        CACHE_SIMILARITY.observe(float(cached.similarity), path=path)
+    return cached
+
 # ======================== Prompt Templates ========================
 
 # Dictionary of prompt templates mapped by intent
@@ -127,8 +296,15 @@ intent_prompt = ChatPromptTemplate.from_template(
     "Prompt:\n{input}"
 )
 
-# Chain that uses LLM + output parser to return detected intent
-intent_chain: Runnable = intent_prompt | llm_3 | StrOutputParser()
+# Chain that uses LLM + output parser to return detected intent (built by init_clients)
+intent_chain: Runnable | None = None
+
+# Labels the LLM classifier may return
+VALID_INTENTS = {
+    "summarize", "code", "explain", "generate", "reason",
+    "analyze", "advise", "edit", "translate",
+    "compare", "review", "rephrase", "expand", "outline"
+}
 
 # ------------------------------------------------------------------------------
 # detect_intent(prompt: str) -> str
@@ -136,165 +312,637 @@ intent_chain: Runnable = intent_prompt | llm_3 | StrOutputParser()
 # Uses LangChain to classify the user's input into a predefined intent.
 # Falls back to "default" if the result is not recognized.
 # ------------------------------------------------------------------------------
-def detect_intent(prompt: str) -> str:
-    intent = intent_chain.invoke({"input": prompt}).strip().lower()
-    print(f"[DEBUG] LangChain predicted intent: {intent}")
-    valid_intents = {
-        "summarize", "code", "explain", "generate", "reason",
-        "analyze", "advise", "edit", "translate",
-        "compare", "review", "rephrase", "expand", "outline"
-    }
-    return intent if intent in valid_intents else "default"
+async def detect_intent(prompt: str) -> str:
+    intent = (await intent_chain.ainvoke({"input": prompt})).strip().lower()
+    return parse_intent(intent)
+
+# ------------------------------------------------------------------------------
+# parse_intent(raw: str) -> str
+# Normalizes an LLM label; anything unrecognized becomes "default".
+# ------------------------------------------------------------------------------
+def parse_intent(raw: str) -> str:
+    intent = raw.strip().strip(".").lower()
+    return intent if intent in VALID_INTENTS else "default"
+
+# Prompt used to classify several prompts in one LLM call
+batch_intent_prompt = ChatPromptTemplate.from_template(
+    "You are a helpful AI assistant. Categorize each numbered prompt into one of the following intents:\n"
+    "Summarize, Code, Explain, Generate, Reason, Analyze, Advise, Edit, Translate, Compare, Review, Rephrase, Expand, Outline .\n\n"
+    "Return exactly one line per prompt in the form '<number>: <intent>'. Do not explain anything.\n\n"
+    "Prompts:\n{input}"
+)
+
+# ------------------------------------------------------------------------------
+# detect_intents(prompts: list) -> list
+#
+# Classifies several prompts with a single LLM call. If the reply does not
+# contain a label for every prompt, the missing ones are classified
+# individually with detect_intent.
+# ------------------------------------------------------------------------------
+async def detect_intents(prompts: list, ctx: EvaluationContext) -> list:
+    if len(prompts) == 1:
+        return [await ctx.track("llm", detect_intent(prompts[0]))]
+
+    numbered = "\n\n".join(f"{n}: {p}" for n, p in enumerate(prompts, start=1))
+    chain = batch_intent_prompt | llm_3 | StrOutputParser()
+    reply = await ctx.track("llm", chain.ainvoke({"input": numbered}))
+
+    labels = {}
+    for line in reply.splitlines():
+        number, _, label = line.partition(":")
+        if number.strip().isdigit() and label.strip():
+            labels[int(number.strip())] = parse_intent(label)
+
+    intents = [labels.get(n) for n in range(1, len(prompts) + 1)]
+    missing = [i for i, intent in enumerate(intents) if intent is None]
+    if missing:
+        fallback = await asyncio.gather(*(ctx.track("llm", detect_intent(prompts[i])) for i in missing))
+        for i, intent in zip(missing, fallback):
+            intents[i] = intent
+    return intents
+
+# ---- Local classifier ----
+
+# "llm" always asks intent_chain; "local" uses the nearest-centroid model trained
+# by intent_classifier.py and only falls back to the LLM below INTENT_CONFIDENCE
+INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "llm").lower()
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "intent_centroids.npz")
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.6"))
+
+local_classifier = None
+if INTENT_CLASSIFIER == "local" and os.path.exists(INTENT_MODEL_PATH):
+    local_classifier = NearestCentroidClassifier.load(INTENT_MODEL_PATH)
+
+# ------------------------------------------------------------------------------
+# classify_intent(prompt, ctx, vec=None) -> str
+#
+# Predicts the intent from the prompt embedding with the local classifier
+# when it is loaded and confident; otherwise defers to detect_intent.
+# ------------------------------------------------------------------------------
+async def classify_intent(prompt: str, ctx: EvaluationContext, vec=None) -> str:
+    if local_classifier is not None and vec is not None:
+        intent, confidence = local_classifier.predict(vec)
+        if confidence >= INTENT_CONFIDENCE and intent in prompt_templates:
+            return intent
+    return await ctx.track("llm", detect_intent(prompt))
+
+# ------------------------------------------------------------------------------
+# classify_intents(prompts, vectors, ctx) -> list
+# Batch form of classify_intent: local predictions where confident, one
+# batched LLM classification call for the rest.
+# ------------------------------------------------------------------------------
+async def classify_intents(prompts: list, vectors, ctx: EvaluationContext) -> list:
+    intents = [None] * len(prompts)
+    if local_classifier is not None and len(prompts):
+        for i, (intent, confidence) in enumerate(local_classifier.predict_batch(vectors)):
+            if confidence >= INTENT_CONFIDENCE and intent in prompt_templates:
+                intents[i] = intent
+
+    pending = [i for i, intent in enumerate(intents) if intent is None]
+    if pending:
+        for i, intent in zip(pending, await detect_intents([prompts[i] for i in pending], ctx)):
+            intents[i] = intent
+    return intents
 
 # ======================== Main Router ========================
 
 # ------------------------------------------------------------------------------
-# route_prompt(prompt: str, email: str | None = None) -> tuple
+# resolve_prompt(prompt, run, ctx) -> tuple
 #
-# Main logic for handling user prompts.
-# 1. Detects intent from the prompt.
-# 2. Checks cache for similar previous prompts.
-# 3. Selects the best-suited model based on the intent.
-# 4. Generates the response.
-# 5. Scores the response quality and reasoning.
-# 6. Logs the interaction to Neo4j.
-# 7. Returns the response and metadata.
+# Front half of the routing pipeline shared by route_prompt and
+# stream_route_prompt.
+# 1. Embeds the prompt and, if enabled, tries the cross-intent cache
+#    fast path before paying for intent classification.
+# 2. Detects intent and checks cache for similar previous prompts.
+# Returns (intent, incoming_vec, cached) where `cached` is a CacheEntry on a
+# cache hit and None otherwise.
 # ------------------------------------------------------------------------------
+async def resolve_prompt(prompt: str, run: PipelineRun, ctx: EvaluationContext):
+    fast_path = CACHE_FAST_PATH and len(CACHE) > 0
+    if fast_path or local_classifier is not None:
+        # Step 1: Embed first; the vector feeds the cache fast path and the local classifier
+        incoming_vec = await run.stage("embed", ctx.prompt_vector())
+        if fast_path:
+            cached = lookup_cache(incoming_vec, None, FAST_PATH_THRESHOLD, "fast")
+            if cached is not None:
+                return cached.intent, incoming_vec, cached
+
+        # Step 2: Only classify the intent on a fast-path miss
+        intent = await run.stage("intent", classify_intent(prompt, ctx, incoming_vec))
+    else:
+        # Steps 1-2: Classify the intent and embed the prompt concurrently (independent stages)
+        stages = await run.gather(
+            intent=classify_intent(prompt, ctx),
+            embed=ctx.prompt_vector(),
+        )
+        intent, incoming_vec = stages["intent"], stages["embed"]
 
-async def route_prompt(prompt: str, email: str | None = None):
-    # Step 1: Classify the user's intent from the prompt
-    intent = detect_intent(prompt)
+    # Step 3: Query the semantic cache for a reusable result
+    return intent, incoming_vec, lookup_cache(incoming_vec, intent, SIMILARITY_THRESHOLD, "intent")
 
-    # Step 2: Fetch the corresponding prompt template
-    template = prompt_templates[intent]
+# ---- Model routing ----
 
-    # Step 3: Generate an embedding vector for the prompt
-    incoming_vec = embedding_model.embed_query(prompt)
+# Original intent -> model table; the adaptive router starts from it
+STATIC_ROUTES = {
+    **{intent: "gemini-2.0-flash" for intent in ("analyze", "compare", "review", "expand")},
+    **{intent: "gpt-3.5-turbo" for intent in ("summarize", "generate", "advise", "edit", "translate",
+                                              "rephrase", "outline", "explain", "reason")},
+    "default": "gpt-4o",
+}
 
-    # Step 4: Loop through cache to check for reusable results
-    for cached_vec, cached_intent, cached_response, cached_model in CACHE:
-        cosine_sim = np.dot(incoming_vec, cached_vec) / (np.linalg.norm(incoming_vec) * np.linalg.norm(cached_vec))
-        if cosine_sim > SIMILARITY_THRESHOLD and cached_intent == intent:
-            # print("[CACHE HIT] Reusing previous response")
-            return intent, cached_response, 100, cached_model, True
+# "static" keeps the table above; "adaptive" learns per-intent choices from
+# score, latency and cost (see model_router.py)
+ROUTER_MODE = os.getenv("ROUTER_MODE", "adaptive").lower()
+ROUTER_LATENCY_WEIGHT = float(os.getenv("ROUTER_LATENCY_WEIGHT", "0.02"))   # score/100 lost per second
+ROUTER_COST_WEIGHT = float(os.getenv("ROUTER_COST_WEIGHT", "0"))            # score/100 lost per cost unit
+ROUTER_MODEL_COSTS = os.getenv("ROUTER_MODEL_COSTS", "gpt-4o=5,gpt-3.5-turbo=0.5,gemini-2.0-flash=0.1")
+ROUTER_EXPLORATION = float(os.getenv("ROUTER_EXPLORATION", "0.1"))
+ROUTER_REFRESH_SECONDS = float(os.getenv("ROUTER_REFRESH_SECONDS", "300"))
+ROUTER_HISTORY_DAYS = int(os.getenv("ROUTER_HISTORY_DAYS", "30"))
+
+MODEL_ROUTER = ModelRouter(
+    ["gpt-3.5-turbo", "gpt-4o", "gemini-2.0-flash"],
+    STATIC_ROUTES,
+    costs={model: float(cost) for model, _, cost in
+           (item.partition("=") for item in ROUTER_MODEL_COSTS.split(",") if item)},
+    latency_weight=ROUTER_LATENCY_WEIGHT,
+    cost_weight=ROUTER_COST_WEIGHT,
+    exploration=ROUTER_EXPLORATION,
+)
 
-    # Step 5: Choose the appropriate LLM based on detected intent
-    if intent in {"analyze", "compare", "review", "expand"}:
-        llm_model = llm_gemini
-        model_used = "gemini-2.0-flash"
-    elif intent in {"summarize", "generate", "advise", "edit", "translate", "rephrase", "outline", "explain", "reason"}:
-        llm_model = llm_3
-        model_used = "gpt-3.5-turbo"
+# Pipelines whose results train the router (enhancement forces gpt-4o)
+ROUTED_PIPELINES = {"route", "route_stream", "batch"}
+
+def model_clients() -> dict:
+    return {"gpt-3.5-turbo": llm_3, "gpt-4o": llm_4o, "gemini-2.0-flash": llm_gemini}
+
+# ------------------------------------------------------------------------------
+# select_model(intent) -> tuple
+# Chooses the LLM client and its name for the intent: the adaptive router's
+# choice, or the static table when ROUTER_MODE=static.
+# ------------------------------------------------------------------------------
+def select_model(intent: str):
+    if ROUTER_MODE == "adaptive":
+        model = MODEL_ROUTER.choose(intent)
     else:
-        llm_model = llm_4o
-        model_used = "gpt-4o"
+        model = STATIC_ROUTES.get(intent, STATIC_ROUTES["default"])
+    return model_clients()[model], model
+
+async def refresh_model_router():
+    await ensure_clients()
+    await MODEL_ROUTER.refresh_forever(lambda: driver, ROUTER_REFRESH_SECONDS, ROUTER_HISTORY_DAYS)
+
+# ---- Admission control ----
+
+# Per-model generation limits as "model=concurrency:tokens_per_minute,..." (the
+# token budget is optional), the queue bound per model and per user, and the
+# output size assumed when estimating a request's tokens before the call
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "gpt-4o=16,gpt-3.5-turbo=32,gemini-2.0-flash=32")
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_USER_QUEUE_SIZE = int(os.getenv("ADMISSION_USER_QUEUE_SIZE", "16"))
+ADMISSION_OUTPUT_TOKENS = int(os.getenv("ADMISSION_OUTPUT_TOKENS", "500"))
+
+ADMISSION = AdmissionController(parse_limits(ADMISSION_LIMITS), ADMISSION_QUEUE_SIZE, ADMISSION_OUTPUT_TOKENS,
+                                ADMISSION_USER_QUEUE_SIZE)
+
+# ---- Deadlines and hedging ----
+
+# Model each primary hedges to (the other provider, so one provider's slowdown
+# or outage is covered), the first-token latency percentile used as the hedge
+# delay and its bounds, and the per-request generation deadline in seconds.
+# Only routed generations are hedged; enhancements keep their forced model
+# and get the deadline alone.
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_SECONDARIES = os.getenv(
+    "HEDGE_SECONDARIES", "gpt-4o=gemini-2.0-flash,gpt-3.5-turbo=gemini-2.0-flash,gemini-2.0-flash=gpt-3.5-turbo")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "10"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2"))
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE", "60"))
+
+HEDGER = Hedger(
+    {primary: secondary for primary, _, secondary in
+     (item.partition("=") for item in HEDGE_SECONDARIES.split(",") if item)},
+    percentile=HEDGE_PERCENTILE,
+    min_delay=HEDGE_MIN_DELAY,
+    max_delay=HEDGE_MAX_DELAY,
+    default_delay=HEDGE_DEFAULT_DELAY,
+    deadline=GENERATION_DEADLINE,
+    enabled=HEDGE_ENABLED,
+)
+
+# ------------------------------------------------------------------------------
+# model_chunks(template, inputs, model, email, ctx) -> async iterator
+# One generation attempt on `model`: streams message chunks under the model's
+# admission slot (queued fairly per email; raises Overloaded when the queue
+# is full) and settles the token charge against the reported usage.
+# ------------------------------------------------------------------------------
+async def model_chunks(template, inputs: dict, model: str, email: str | None, ctx: EvaluationContext):
+    chain = template | model_clients()[model]
+    async with ADMISSION.slot(model, email, inputs["input"]) as ticket:
+        ctx.count("llm")
+        usage = None
+        async for chunk in chain.astream(inputs):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk
+        if ticket is not None and usage:
+            ticket.settle(usage.get("total_tokens"))
+
+# ------------------------------------------------------------------------------
+# generate_response(template, inputs, model_used, email, run, ctx, hedge=True) -> tuple
+# Runs one generation under the request deadline, hedged to the secondary
+# model when the primary is slow to start or fails. Returns the winning
+# (message, model name). With hedge=False (enhancements, which promise a
+# specific model) only the deadline applies.
+# ------------------------------------------------------------------------------
+async def generate_response(template, inputs: dict, model_used: str, email: str | None,
+                            run: PipelineRun, ctx: EvaluationContext, hedge: bool = True):
+    model, attempt = await run.stage("generate", HEDGER.run(
+        model_used, lambda model: model_chunks(template, inputs, model, email, ctx), hedge=hedge))
+    return attempt.message, model
+
+# ------------------------------------------------------------------------------
+# stream_tokens(template, inputs, model_used, email, run, ctx, hedge=True) -> tuple
+# Streaming form of generate_response: waits (under the deadline) until one
+# attempt produces its first token, then returns the winning model name and
+# an async iterator of its text chunks. Records time-to-first-token and total
+# generation time on the pipeline run.
+# ------------------------------------------------------------------------------
+async def stream_tokens(template, inputs: dict, model_used: str, email: str | None,
+                        run: PipelineRun, ctx: EvaluationContext, hedge: bool = True):
+    start = time.perf_counter()
+    model, attempt = await HEDGER.run(
+        model_used, lambda model: model_chunks(template, inputs, model, email, ctx), until="first_token",
+        hedge=hedge)
+    run.mark("first_token")
+
+    async def texts():
+        try:
+            async for chunk in attempt.chunks():
+                if isinstance(chunk.content, str) and chunk.content:
+                    yield chunk.content
+            run.record("generate", time.perf_counter() - start)
+        finally:
+            attempt.cancel()
+
+    return model, texts()
+
+# ------------------------------------------------------------------------------
+# evaluate_response(prompt, intent, response, run, ctx) -> (score, cot_score)
+# Scores the response; the CoT score is shared with scoring.
+# ------------------------------------------------------------------------------
+async def evaluate_response(prompt: str, intent: str, response: str, run: PipelineRun, ctx: EvaluationContext):
+    ctx.set_response(response)
+    stages = await run.gather(
+        score=score_response(prompt, response, intent, run, ctx),
+        cot=ctx.cot_score(),
+    )
+    RESPONSE_SCORES.observe(stages["score"], intent=intent)
+    return stages["score"], stages["cot"]
+
+# ------------------------------------------------------------------------------
+# publish_response(prompt, intent, response, model_used, incoming_vec, email,
+#                  score, cot_score, latency, pipeline, ctx)
+# Logs a scored response to Neo4j and adds it to the cache. Under deferred
+# CoT scoring a borderline response also gets ctx.deferred, which settles
+# the final score.
+# ------------------------------------------------------------------------------
+async def publish_response(prompt: str, intent: str, response: str, model_used: str, incoming_vec,
+                           email: str | None, score: int, cot_score: float, latency: float | None,
+                           pipeline: str, ctx: EvaluationContext):
+    # Log interaction metadata to the Neo4j database
+    latency_ms = round(latency * 1000, 1) if latency is not None else None
+    response_id = await ctx.track("neo4j", log_to_neo4j(
+        prompt, intent, response, score, cot_score, model_used, email, latency_ms, pipeline))
+
+    # Borderline CoT under deferred scoring: judge it after returning
+    if COT_DEFERRED and COT_SCORER.borderline(cot_score):
+        ctx.deferred = defer_score(prompt, intent, response, cot_score, response_id)
+
+    # Cache the new result for future similarity checks
+    CACHE.add(incoming_vec, intent, response, model_used)
+
+# ------------------------------------------------------------------------------
+# finalize_response(prompt, intent, response, model_used, incoming_vec, email, run, ctx) -> int
+# Back half of the pipeline: scores the response, logs it to Neo4j and adds
+# it to the cache. Returns the score. With deferred CoT scoring this is the
+# provisional score and ctx.deferred (if set) settles the final one.
+# ------------------------------------------------------------------------------
+async def finalize_response(prompt: str, intent: str, response: str, model_used: str, incoming_vec,
+                            email: str | None, run: PipelineRun, ctx: EvaluationContext) -> int:
+    score, cot_score = await evaluate_response(prompt, intent, response, run, ctx)
 
-    # print(f"[DEBUG] Intent: {intent} | Using model: {model_used}")
+    # Feed the outcome back to the adaptive model router
+    latency = run.timings.get("generate")
+    if run.pipeline in ROUTED_PIPELINES:
+        MODEL_ROUTER.observe(intent, model_used, score, latency)
 
-    # Step 6: Construct LangChain and generate response
-    chain = template | llm_model
-    response = await chain.ainvoke({"input": prompt})
+    await run.stage("log", publish_response(prompt, intent, response, model_used, incoming_vec, email,
+                                            score, cot_score, latency, run.pipeline, ctx))
+    run.finish()
+    ctx.finish()
+    return score
+
+# Concurrent identical /prompt requests, from any user, are coalesced into one
+# upstream run
+PROMPT_FLIGHTS = SingleFlight()
+
+# ------------------------------------------------------------------------------
+# route_prompt(prompt: str, email: str | None = None) -> tuple
+#
+# Main logic for handling user prompts.
+# 0. Joins an identical in-flight request (from any user) instead of
+#    starting a new one.
+# 1. Resolves intent, embedding and cache hits (resolve_prompt).
+# 2. Selects the best-suited model based on the intent.
+# 3. Generates the response.
+# 4. Scores, logs and caches the response (finalize_response).
+# 5. Returns the response and metadata.
+# ------------------------------------------------------------------------------
 
-    # Step 7: Evaluate the generated response for quality and coherence
-    score = await score_response(prompt, response.content, intent)
-    cot_score = await validate_chain_of_thought(response.content)
+async def route_prompt(prompt: str, email: str | None = None):
+    # Identical prompts already in flight share one pipeline run, across users;
+    # callers that joined another request's run are reported as served from
+    # cache and logged under their own email as a cache hit
+    result, shared = await PROMPT_FLIGHTS.do(prompt.strip(), lambda: _route_prompt(prompt, email))
+    if shared:
+        CALL_STATS.record(Counter())
+        intent, response, score, model_used, _ = result
+        await log_cache_hit(intent, model_used, email)
+        return intent, response, score, model_used, True
+    return result
+
+async def _route_prompt(prompt: str, email: str | None = None):
+    await ensure_clients()
+    run = PipelineRun("route")
+    ctx = new_context(prompt)
+
+    # Steps 1-4: Resolve intent and serve cache hits directly
+    intent, incoming_vec, cached = await resolve_prompt(prompt, run, ctx)
+    if cached is not None:
+        run.finish("cache_hit")
+        ctx.finish()
+        await log_cache_hit(intent, cached.model, email)
+        return intent, cached.response, 100, cached.model, True
 
-    # Step 8: Log interaction metadata to the Neo4j database
-    log_to_neo4j(prompt, intent, response.content, score, cot_score, model_used, email)
+    # Step 5: Choose the appropriate LLM based on detected intent
+    _, model_used = select_model(intent)
 
-    # print(f"[DEBUG] CoT Score: {cot_score * 2}/20")
+    # Step 6: Generate the response (hedged to a secondary model if slow)
+    response, model_used = await generate_response(prompt_templates[intent], {"input": prompt},
+                                                   model_used, email, run, ctx)
 
-    # Step 9: Cache the new result for future similarity checks
-    CACHE.append((incoming_vec, intent, response.content, model_used))
+    # Steps 7-9: Score, log and cache the response
+    score = await finalize_response(prompt, intent, response.content, model_used, incoming_vec, email, run, ctx)
+    maybe_speculate(prompt, email, intent, incoming_vec, score)
 
     # Step 10: Return all relevant output fields
     return intent, response.content, score, model_used, False
 
+# ------------------------------------------------------------------------------
+# stream_route_prompt(prompt: str, email: str | None = None) -> async iterator
+#
+# Streaming variant of route_prompt. Yields events:
+#   {"type": "token", "content": ...}   as the model produces text
+#   {"type": "done", intent, score, model, served_from_cache}
+#   {"type": "score", score}            final score, if CoT scoring was deferred
+# The "done" event is sent once scoring has finished. Cache hits
+# stream the stored response as a single token event.
+# ------------------------------------------------------------------------------
+
+async def stream_route_prompt(prompt: str, email: str | None = None):
+    await ensure_clients()
+    run = PipelineRun("route_stream")
+    ctx = new_context(prompt)
+
+    intent, incoming_vec, cached = await resolve_prompt(prompt, run, ctx)
+    if cached is not None:
+        run.mark("first_token")
+        yield {"type": "token", "content": cached.response}
+        run.finish("cache_hit")
+        ctx.finish()
+        await log_cache_hit(intent, cached.model, email)
+        yield {"type": "done", "intent": intent, "score": 100, "model": cached.model, "served_from_cache": True}
+        return
+
+    _, model_used = select_model(intent)
+    model_used, texts = await stream_tokens(prompt_templates[intent], {"input": prompt}, model_used, email, run, ctx)
+
+    parts = []
+    async for text in texts:
+        parts.append(text)
+        yield {"type": "token", "content": text}
+
+    score = await finalize_response(prompt, intent, "".join(parts), model_used, incoming_vec, email, run, ctx)
+    maybe_speculate(prompt, email, intent, incoming_vec, score)
+    yield {"type": "done", "intent": intent, "score": score, "model": model_used, "served_from_cache": False}
+    if ctx.deferred is not None:
+        yield {"type": "score", "score": await ctx.deferred}
+
+
+# ======================== Batch Router ========================
+
+# Max prompts per batch, max concurrent generations per batch and similarity
+# above which two prompts in the same batch are answered once
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_DEDUPE_THRESHOLD = float(os.getenv("BATCH_DEDUPE_THRESHOLD", str(FAST_PATH_THRESHOLD)))
+
+# ------------------------------------------------------------------------------
+# dedupe_vectors(vectors, threshold) -> list
+# Greedy near-duplicate grouping: returns, for every row, the index of the
+# first earlier row whose cosine similarity exceeds the threshold (or itself).
+# ------------------------------------------------------------------------------
+def dedupe_vectors(vectors: np.ndarray, threshold: float) -> list:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    sims = unit @ unit.T
+    leader_of = list(range(len(vectors)))
+    for i in range(len(vectors)):
+        if leader_of[i] != i:
+            continue
+        for j in np.flatnonzero(sims[i, i + 1:] > threshold) + i + 1:
+            if leader_of[j] == j:
+                leader_of[j] = i
+    return leader_of
+
+# Raised for a batch with more than BATCH_MAX_PROMPTS prompts
+class BatchTooLarge(Exception):
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"batch of {size} prompts exceeds the limit of {limit}")
+        self.size = size
+        self.limit = limit
+
+# ------------------------------------------------------------------------------
+# route_prompt_batch(prompts: list, email: str | None = None) -> list
+#
+# Batch form of route_prompt used by POST /prompt/batch. Raises BatchTooLarge
+# above BATCH_MAX_PROMPTS prompts.
+# 1. Embeds every prompt with one embed_documents call.
+# 2. Groups identical and near-identical prompts; only group leaders go on.
+# 3. Serves leaders from the cache (cross-intent fast path) where possible.
+# 4. Classifies the remaining leaders together and checks the per-intent cache.
+# 5. Generates, scores, logs and caches the rest with at most
+#    BATCH_CONCURRENCY generations in flight.
+# Returns one (intent, response, score, model, served_from_cache) per prompt;
+# duplicates reuse their leader's result and are marked served_from_cache.
+# ------------------------------------------------------------------------------
+async def route_prompt_batch(prompts: list, email: str | None = None) -> list:
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise BatchTooLarge(len(prompts), BATCH_MAX_PROMPTS)
+    await ensure_clients()
+    if not prompts:
+        return []
+    batch_ctx = new_context("")
+    results = [None] * len(prompts)
+
+    # Steps 1-2: One embedding call, then near-duplicate grouping
+    vectors = np.asarray(await batch_ctx.track("embed", embedding_model.aembed_documents(prompts)), dtype=np.float32)
+    leader_of = dedupe_vectors(vectors, BATCH_DEDUPE_THRESHOLD)
+    leaders = [i for i in range(len(prompts)) if leader_of[i] == i]
+
+    # Step 3: Cross-intent cache fast path for the leaders
+    pending = []
+    for i in leaders:
+        cached = lookup_cache(vectors[i], None, FAST_PATH_THRESHOLD, "fast") if CACHE_FAST_PATH else None
+        if cached is not None:
+            results[i] = (cached.intent, cached.response, 100, cached.model, True)
+        else:
+            pending.append(i)
+
+    # Step 4: Classify the remaining leaders together, then the per-intent cache
+    intents = await classify_intents([prompts[i] for i in pending], vectors[pending], batch_ctx)
+    to_generate = []
+    for i, intent in zip(pending, intents):
+        cached = lookup_cache(vectors[i], intent, SIMILARITY_THRESHOLD, "intent")
+        if cached is not None:
+            results[i] = (intent, cached.response, 100, cached.model, True)
+        else:
+            to_generate.append((i, intent))
+
+    # Step 5: Bounded fan-out of generation + scoring/logging/caching
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def generate(i: int, intent: str):
+        async with semaphore:
+            run = PipelineRun("batch")
+            ctx = new_context(prompts[i])
+            ctx.set_prompt_vector(vectors[i])
+            _, model_used = select_model(intent)
+            try:
+                response, model_used = await generate_response(prompt_templates[intent], {"input": prompts[i]},
+                                                               model_used, email, run, ctx)
+                score = await finalize_response(prompts[i], intent, response.content, model_used, vectors[i], email, run, ctx)
+                return intent, response.content, score, model_used, False
+            except Overloaded:
+                run.finish("rejected")
+                ctx.finish()
+                return intent, "[ERROR] Model overloaded, retry later.", 0, model_used, False
+            except DeadlineExceeded:
+                run.finish("deadline")
+                ctx.finish()
+                return intent, "[ERROR] Model did not answer in time.", 0, model_used, False
+            except Exception:
+                ERRORS.inc(component="batch.generate")
+                run.finish("error")
+                ctx.finish()
+                return intent, "[ERROR] Generation failed.", 0, model_used, False
+
+    generated = await asyncio.gather(*(generate(i, intent) for i, intent in to_generate))
+    for (i, _), result in zip(to_generate, generated):
+        results[i] = result
+
+    # Duplicates reuse their leader's answer
+    for i, leader in enumerate(leader_of):
+        if leader != i:
+            intent, response, score, model_used, _ = results[leader]
+            results[i] = (intent, response, score, model_used, True)
+
+    # Shared calls are spread over the prompts that did not record their own
+    batch_ctx.finish(requests=len(prompts) - len(to_generate))
+    for intent, _, _, model_used, served_from_cache in results:
+        if served_from_cache:
+            await log_cache_hit(intent, model_used, email)
+    return results
+
 
 # ======================== Scoring and Evaluation ========================
 
+# ------------------------------------------------------------------------------
+# new_context(prompt, response=None) -> EvaluationContext
+# Creates the per-request evaluation context bound to the embedding model
+# and the chain-of-thought judge, so each artifact is computed only once.
+# ------------------------------------------------------------------------------
+def new_context(prompt: str, response: str | None = None) -> EvaluationContext:
+    judge = COT_SCORER.provisional if COT_DEFERRED else COT_SCORER.score
+    ctx = EvaluationContext(prompt, embed=embedding_model.aembed_query, judge=judge)
+    if response is not None:
+        ctx.set_response(response)
+    return ctx
+
 # ---- Modular scoring functions ----
 
+# Scoring rubric shared with the bulk rescorer (rescoring.py). Each band is
+# (threshold, points); the first band the value passes wins, otherwise 0.
+OVERLAP_BANDS = ((0.5, 20), (0.3, 15), (0.2, 10), (0.1, 5))           # overlap ratio above
+SIMILARITY_BANDS = ((0.95, 20), (0.9, 15), (0.85, 10), (0.8, 5))       # cosine similarity above
+SENTENCE_BANDS = ((20, 20), (25, 15), (30, 10), (35, 5))               # avg sentence length below
+SUMMARY_LENGTH_BANDS = ((40, 20), (60, 15), (80, 10), (100, 5))        # summary word count below
+LENGTH_BANDS = ((150, 20), (100, 15), (50, 10), (25, 5))               # other word counts above
+
+def band_points(value: float, bands: tuple, above: bool = True) -> int:
+    for threshold, points in bands:
+        if (value > threshold) if above else (value < threshold):
+            return points
+    return 0
+
 # ------------------------------------------------------------------------------
-# score_overlap(prompt, response) -> int
+# score_overlap(prompt, response, features=None) -> int
 # Measures lexical overlap between prompt and response.
 # Gives a higher score if the response reuses more words from the prompt.
 # ------------------------------------------------------------------------------
-def score_overlap(prompt: str, response: str) -> int:
-    prompt_words = set(re.findall(r'\w+', prompt.lower()))
-    response_words = set(re.findall(r'\w+', response.lower()))
-    overlap = prompt_words & response_words
-    overlap_ratio = len(overlap) / max(len(prompt_words), 1)
-
-    if overlap_ratio > 0.5:
-        return 20
-    elif overlap_ratio > 0.3:
-        return 15
-    elif overlap_ratio > 0.2:
-        return 10
-    elif overlap_ratio > 0.1:
-        return 5
-    return 0
+def score_overlap(prompt: str, response: str, features: LexicalFeatures | None = None) -> int:
+    features = features or lexical_features(prompt, response)
+    overlap = features.prompt_words & features.response_words
+    overlap_ratio = len(overlap) / max(len(features.prompt_words), 1)
+    return band_points(overlap_ratio, OVERLAP_BANDS)
 
 # ------------------------------------------------------------------------------
-# score_cosine_similarity(prompt, response) -> int
+# score_cosine_similarity(prompt, response, ctx=None) -> int
 # Calculates semantic similarity between the prompt and response
 # using cosine similarity on embedding vectors. Higher is better.
+# Reuses the vectors already held by the request's evaluation context.
 # ------------------------------------------------------------------------------
-def score_cosine_similarity(prompt: str, response: str) -> int:
+async def score_cosine_similarity(prompt: str, response: str, ctx: EvaluationContext | None = None) -> int:
+    ctx = ctx or new_context(prompt, response)
     try:
-        vec_prompt = embedding_model.embed_query(prompt)
-        vec_response = embedding_model.embed_query(response)
+        vec_prompt, vec_response = await asyncio.gather(ctx.prompt_vector(), ctx.response_vector())
         cosine_sim = np.dot(vec_prompt, vec_response) / (np.linalg.norm(vec_prompt) * np.linalg.norm(vec_response))
-        if cosine_sim > 0.95:
-            return 20
-        elif cosine_sim > 0.9:
-            return 15
-        elif cosine_sim > 0.85:
-            return 10
-        elif cosine_sim > 0.8:
-            return 5
+        return band_points(cosine_sim, SIMILARITY_BANDS)
     except Exception:
-        pass
+        ERRORS.inc(component="score.similarity")
     return 0
 
 # ------------------------------------------------------------------------------
-# score_avg_sentence_length(response) -> int
+# score_avg_sentence_length(response, features=None) -> int
 # Evaluates readability by computing the average sentence length.
 # Shorter, clearer sentences get higher scores.
 # ------------------------------------------------------------------------------
-def score_avg_sentence_length(response: str) -> int:
-    sentences = re.split(r'[.!?]', response)
-    avg_len = sum(len(s.split()) for s in sentences if s.strip()) / max(1, len(re.findall(r'[.!?]', response)))
-    if avg_len < 20:
-        return 20
-    elif avg_len < 25:
-        return 15
-    elif avg_len < 30:
-        return 10
-    elif avg_len < 35:
-        return 5
-    return 0
+def score_avg_sentence_length(response: str, features: LexicalFeatures | None = None) -> int:
+    avg_len = (features or lexical_features("", response)).avg_sentence_length
+    return band_points(avg_len, SENTENCE_BANDS, above=False)
 
 # ------------------------------------------------------------------------------
-# score_length(response, intent) -> int
+# score_length(response, intent, features=None) -> int
 # Scores the response based on its word count.
 # Criteria vary depending on the prompt's intent.
 # ------------------------------------------------------------------------------
-def score_length(response: str, intent: str) -> int:
-    word_count = len(response.split())
+def score_length(response: str, intent: str, features: LexicalFeatures | None = None) -> int:
+    word_count = features.word_count if features else len(response.split())
     if intent == "summarize":
-        if word_count < 40: return 20
-        elif word_count < 60: return 15
-        elif word_count < 80: return 10
-        elif word_count < 100: return 5
-        else: return 0
-    else:
-        if word_count > 150: return 20
-        elif word_count > 100: return 15
-        elif word_count > 50: return 10
-        elif word_count > 25: return 5
-        else: return 0
+        return band_points(word_count, SUMMARY_LENGTH_BANDS, above=False)
+    return band_points(word_count, LENGTH_BANDS)
 
 # ------------------------------------------------------------------------------
 # validate_chain_of_thought(response) -> float
@@ -308,35 +956,133 @@ Answer:
 {response}
 
 Respond with a number from 0 to 10 only, no explanation."""
-    # print("[DEBUG] Sending CoT validation prompt to LLM:")
-    # print(eval_prompt)
     try:
         evaluation = await llm_3.ainvoke([HumanMessage(content=eval_prompt)])
-        # print("[DEBUG] Raw LLM CoT score response:", evaluation.content)
         raw_score = int("".join(filter(str.isdigit, evaluation.content)))
         return min(max(raw_score, 0), 10)
-    except Exception as e:
-        # print("[ERROR] Failed to extract CoT score:", str(e))
+    except Exception:
+        ERRORS.inc(component="score.cot")
         return 0
 
+# ---- Tiered chain-of-thought scoring ----
+
+# "tiered" settles clear cases with the local structural score and sends
+# borderline ones (strictly between COT_LOCAL_LOW and COT_LOCAL_HIGH) to the
+# batched judge; "llm" judges every response; "local" never calls the LLM.
+# With COT_DEFERRED the response path uses the local score and borderline
+# responses are judged afterwards, the final score being written to Neo4j.
+COT_SCORING = os.getenv("COT_SCORING", "tiered").lower()
+COT_LOCAL_LOW = int(os.getenv("COT_LOCAL_LOW", "3"))
+COT_LOCAL_HIGH = int(os.getenv("COT_LOCAL_HIGH", "7"))
+COT_BATCH_SIZE = int(os.getenv("COT_BATCH_SIZE", "8"))
+COT_BATCH_WINDOW = float(os.getenv("COT_BATCH_WINDOW", "0.02"))
+COT_DEFERRED = os.getenv("COT_DEFERRED", "false").lower() == "true"
+
+batch_cot_prompt = ChatPromptTemplate.from_template(
+    "You are a reasoning evaluator. For each numbered answer below, rate how logically sound, "
+    "step-by-step, and coherent its reasoning is.\n\n"
+    "Rate each numbered answer on its own line in the form '<number>: <score from 0 to 10>'. "
+    "Do not explain anything.\n\n"
+    "{input}"
+)
+
+# ------------------------------------------------------------------------------
+# judge_chain_of_thought_batch(responses) -> list
+# Rates several responses with one LLM call. Answers missing from the reply
+# are rated individually with validate_chain_of_thought.
+# ------------------------------------------------------------------------------
+async def judge_chain_of_thought_batch(responses: list) -> list:
+    if len(responses) == 1:
+        return [await validate_chain_of_thought(responses[0])]
+
+    numbered = "\n\n".join(f"### Answer {n}\n{r}" for n, r in enumerate(responses, start=1))
+    chain = batch_cot_prompt | llm_3 | StrOutputParser()
+    reply = await chain.ainvoke({"input": numbered})
+
+    scores = {}
+    for line in reply.splitlines():
+        number, _, value = line.partition(":")
+        digits = "".join(filter(str.isdigit, value))
+        if number.strip().isdigit() and digits:
+            scores[int(number.strip())] = min(max(int(digits), 0), 10)
+
+    rated = [scores.get(n) for n in range(1, len(responses) + 1)]
+    missing = [i for i, score in enumerate(rated) if score is None]
+    if missing:
+        fallback = await asyncio.gather(*(validate_chain_of_thought(responses[i]) for i in missing))
+        for i, score in zip(missing, fallback):
+            rated[i] = score
+    return rated
+
+COT_SCORER = TieredCoTScorer(
+    validate_chain_of_thought,
+    BatchJudge(judge_chain_of_thought_batch, COT_BATCH_SIZE, COT_BATCH_WINDOW),
+    low=COT_LOCAL_LOW,
+    high=COT_LOCAL_HIGH,
+    mode=COT_SCORING,
+)
+
+# Deferred scoring tasks still running (awaited on shutdown)
+DEFERRED_SCORES = set()
+
+# ------------------------------------------------------------------------------
+# settle_deferred_score(prompt, intent, response, provisional_cot, response_id) -> int
+# Judges a borderline response after it has been returned, recomputes its
+# score with the judged CoT and queues the correction for its Response node.
+# ------------------------------------------------------------------------------
+async def settle_deferred_score(prompt: str, intent: str, response: str, provisional_cot: float,
+                                response_id: str) -> int:
+    cot_score = await COT_SCORER.escalate(response, provisional_cot)
+    ctx = new_context(prompt, response)
+    ctx.set_cot_score(cot_score)
+    score = await score_response(prompt, response, intent, PipelineRun("score_deferred"), ctx)
+    await neo4j_writer.update_score(response_id, score, cot_score)
+    return score
+
+def defer_score(prompt: str, intent: str, response: str, provisional_cot: float, response_id: str):
+    task = asyncio.create_task(settle_deferred_score(prompt, intent, response, provisional_cot, response_id))
+    DEFERRED_SCORES.add(task)
+    task.add_done_callback(DEFERRED_SCORES.discard)
+    return task
+
+async def drain_deferred_scores(timeout: float = 30.0):
+    if DEFERRED_SCORES:
+        await asyncio.wait(set(DEFERRED_SCORES), timeout=timeout)
+
 # ---- Main scoring function ----
 
 # ------------------------------------------------------------------------------
-# score_response(prompt, response, intent) -> int
+# score_response(prompt, response, intent, run=None, ctx=None) -> int
 # Master function that calculates the overall score for a given prompt/response pair.
 # Combines structural, semantic, lexical, and reasoning-based evaluations.
+# The embedding-based and LLM-based components run concurrently; when a
+# PipelineRun is given, their timings are recorded as scoring sub-stages.
+# Passing the request's EvaluationContext shares vectors and the CoT score.
 # ------------------------------------------------------------------------------
-async def score_response(prompt: str, response: str, intent: str) -> int:
+async def score_response(prompt: str, response: str, intent: str,
+                         run: PipelineRun | None = None, ctx: EvaluationContext | None = None) -> int:
     # Translation is always full score by design
     if intent == "translate":
         return 100
 
-    score = 0
-    score += score_length(response, intent)                       # Length appropriateness
-    score += score_overlap(prompt, response)                     # Word reuse from prompt
-    score += score_cosine_similarity(prompt, response)           # Semantic alignment
-    score += score_avg_sentence_length(response)                 # Readability
-    score += await validate_chain_of_thought(response) * 2       # Logical reasoning (weighted)
+    run = run or PipelineRun("score")
+    ctx = ctx or new_context(prompt, response)
+    features = ctx.lexical()
+    stages = await run.gather(
+        score_similarity=score_cosine_similarity(prompt, response, ctx),
+        score_cot=ctx.cot_score(),
+    )
+
+    components = {
+        "length": score_length(response, intent, features),             # Length appropriateness
+        "overlap": score_overlap(prompt, response, features),           # Word reuse from prompt
+        "similarity": stages["score_similarity"],                       # Semantic alignment
+        "readability": score_avg_sentence_length(response, features),   # Readability
+        "cot": stages["score_cot"] * 2,                                 # Logical reasoning (weighted)
+    }
+    for component, points in components.items():
+        SCORE_COMPONENTS.observe(points, component=component)
+    score = sum(components.values())
 
     # Round to nearest 10
     return int(round(score / 10.0) * 10)
@@ -344,22 +1090,29 @@ async def score_response(prompt: str, response: str, intent: str) -> int:
 # ======================== Fallback Handler ========================
 
 # ------------------------------------------------------------------------------
-# enhance_prompt(prompt: str) -> tuple
+# prepare_enhancement(prompt, run, ctx, intent=None, incoming_vec=None) -> tuple
 #
-# Used when the user explicitly requests an improved version of the output.
-# 1. Detects intent.
+# Shared setup for enhance_prompt, stream_enhance_prompt and speculative runs.
+# 1. Detects intent and embeds the prompt (skipped when both are known).
 # 2. Prepends the prompt with custom enhancement instructions.
 # 3. Forces the use of GPT-4o for higher quality generation.
-# 4. Scores the enhanced output and logs it to Neo4j.
-# 5. Appends it to the cache and returns.
+# Returns (intent, incoming_vec, template, modified_prompt, model_used).
 # ------------------------------------------------------------------------------
-
-async def enhance_prompt(prompt: str, email: str | None = None):
-    # Step 1: Detect the intent for routing and scoring
-    intent = detect_intent(prompt)
-
-    # Step 2: Generate the embedding for cache and similarity checks
-    incoming_vec = embedding_model.embed_query(prompt)
+async def prepare_enhancement(prompt: str, run: PipelineRun, ctx: EvaluationContext,
+                              intent: str | None = None, incoming_vec=None):
+    # Steps 1-2: Detect the intent and embed the prompt (concurrently unless
+    # the local classifier needs the vector first)
+    if intent is not None and incoming_vec is not None:
+        ctx.set_prompt_vector(incoming_vec)
+    elif local_classifier is not None:
+        incoming_vec = await run.stage("embed", ctx.prompt_vector())
+        intent = await run.stage("intent", classify_intent(prompt, ctx, incoming_vec))
+    else:
+        stages = await run.gather(
+            intent=classify_intent(prompt, ctx),
+            embed=ctx.prompt_vector(),
+        )
+        intent, incoming_vec = stages["intent"], stages["embed"]
 
     # Step 3: Craft a special instruction based on intent type
     if intent == "summarize":
@@ -380,79 +1133,285 @@ async def enhance_prompt(prompt: str, email: str | None = None):
 
     # Step 5: Select the correct template and force GPT-4o as model
     template = prompt_templates.get(intent, prompt_templates["default"])
-    chain = template | llm_4o
-    model_used = "gpt-4o"
+    return intent, incoming_vec, template, modified_prompt, "gpt-4o"
 
-    try:
-        # print(f"[DEBUG] Enhancing response with GPT-4o override (intent={intent})")
+# ------------------------------------------------------------------------------
+# enhance_prompt(prompt: str) -> tuple
+#
+# Used when the user explicitly requests an improved version of the output.
+# 1. Prepares the enhanced GPT-4o prompt (prepare_enhancement).
+# 2. Generates the enhanced response.
+# 3. Scores the enhanced output, logs it to Neo4j and appends it to the cache.
+# 4. Returns the response and metadata.
+# A stored speculative enhancement for the same prompt and user is returned
+# instead (awaited if it is still running), and logged at that point.
+# ------------------------------------------------------------------------------
 
-        # Step 6: Generate enhanced response
-        response = await chain.ainvoke({"input": modified_prompt})
+async def enhance_prompt(prompt: str, email: str | None = None):
+    await ensure_clients()
+    run = PipelineRun("enhance")
 
-        # Step 7: Evaluate and score the output
-        score = await score_response(prompt, response.content, intent)
-        cot_score = await validate_chain_of_thought(response.content)
+    speculative = await SPECULATOR.claim(prompt, email)
+    if speculative is not None:
+        result, publish = speculative
+        await publish()
+        run.finish("speculative_hit")
+        CALL_STATS.record(Counter())
+        return result
 
-        # Step 8: Log the enhanced result
-        log_to_neo4j(prompt, intent, response.content, score, cot_score, model_used, email)
+    ctx = new_context(prompt)
 
-        # Step 9: Add to cache for reuse
-        CACHE.append((incoming_vec, intent, response.content, model_used))
+    # Steps 1-5: Detect intent and build the GPT-4o enhancement prompt
+    intent, incoming_vec, template, modified_prompt, model_used = await prepare_enhancement(prompt, run, ctx)
+
+    try:
+        # Step 6: Generate enhanced response
+        response, model_used = await generate_response(template, {"input": modified_prompt}, model_used, email, run, ctx,
+                                                       hedge=False)
+
+        # Steps 7-9: Score, log and cache the enhanced result
+        score = await finalize_response(prompt, intent, response.content, model_used, incoming_vec, email, run, ctx)
 
         # Step 10: Return enhanced response with metadata
         return intent, response.content, score, model_used
 
-    except Exception as e:
-        # print("[ERROR] Failed in enhance_prompt:", e)
+    except Overloaded:
+        run.finish("rejected")
+        ctx.finish()
+        raise
+
+    except DeadlineExceeded:
+        run.finish("deadline")
+        ctx.finish()
+        raise
+
+    except Exception:
+        ERRORS.inc(component="enhance")
+        run.finish("error")
+        ctx.finish()
         return intent, "[ERROR] GPT-4o override failed.", 0, model_used
 
+# ------------------------------------------------------------------------------
+# stream_enhance_prompt(prompt: str, email: str | None = None) -> async iterator
+#
+# Streaming variant of enhance_prompt. Yields "token" events while GPT-4o
+# generates and a trailing {"type": "done", intent, score, model} event
+# (followed by {"type": "score", score} if CoT scoring was deferred).
+# On failure an {"type": "error", "message": ...} event precedes "done".
+# A stored speculative enhancement is streamed as a single token event.
+# ------------------------------------------------------------------------------
+
+async def stream_enhance_prompt(prompt: str, email: str | None = None):
+    await ensure_clients()
+    run = PipelineRun("enhance_stream")
+
+    speculative = await SPECULATOR.claim(prompt, email)
+    if speculative is not None:
+        (intent, response, score, model_used), publish = speculative
+        deferred = await publish()
+        run.mark("first_token")
+        yield {"type": "token", "content": response}
+        run.finish("speculative_hit")
+        CALL_STATS.record(Counter())
+        yield {"type": "done", "intent": intent, "score": score, "model": model_used}
+        if deferred is not None:
+            yield {"type": "score", "score": await deferred}
+        return
+
+    ctx = new_context(prompt)
+
+    intent, incoming_vec, template, modified_prompt, model_used = await prepare_enhancement(prompt, run, ctx)
+
+    try:
+        model_used, texts = await stream_tokens(template, {"input": modified_prompt}, model_used, email, run, ctx,
+                                                hedge=False)
+        parts = []
+        async for text in texts:
+            parts.append(text)
+            yield {"type": "token", "content": text}
+
+        score = await finalize_response(prompt, intent, "".join(parts), model_used, incoming_vec, email, run, ctx)
+        yield {"type": "done", "intent": intent, "score": score, "model": model_used}
+        if ctx.deferred is not None:
+            yield {"type": "score", "score": await ctx.deferred}
+
+    except (Overloaded, DeadlineExceeded) as e:
+        run.finish("rejected" if isinstance(e, Overloaded) else "deadline")
+        ctx.finish()
+        raise
+
+    except Exception as e:
+        ERRORS.inc(component="enhance_stream")
+        run.finish("error")
+        ctx.finish()
+        yield {"type": "error", "message": "[ERROR] GPT-4o override failed."}
+        yield {"type": "done", "intent": intent, "score": 0, "model": model_used}
+
+
+# ======================== Speculative Enhancement ========================
+
+# Responses scoring below SPECULATIVE_THRESHOLD are enhanced in the background
+# when SPECULATIVE_ENHANCE is on. Stored results live for SPECULATIVE_TTL
+# seconds; the budget allows SPECULATIVE_MAX_IN_FLIGHT runs at once and
+# SPECULATIVE_PER_MINUTE starts per minute, and none while foreground
+# requests are queued for the enhancement model.
+SPECULATIVE_ENHANCE = os.getenv("SPECULATIVE_ENHANCE", "false").lower() == "true"
+SPECULATIVE_THRESHOLD = int(os.getenv("SPECULATIVE_THRESHOLD", "70"))
+SPECULATIVE_CAPACITY = int(os.getenv("SPECULATIVE_CAPACITY", "1000"))
+SPECULATIVE_TTL = float(os.getenv("SPECULATIVE_TTL", "600"))
+SPECULATIVE_MAX_IN_FLIGHT = int(os.getenv("SPECULATIVE_MAX_IN_FLIGHT", "2"))
+SPECULATIVE_PER_MINUTE = float(os.getenv("SPECULATIVE_PER_MINUTE", "30"))
+
+SPECULATOR = Speculator(
+    SPECULATIVE_CAPACITY,
+    SPECULATIVE_TTL,
+    SPECULATIVE_MAX_IN_FLIGHT,
+    SPECULATIVE_PER_MINUTE,
+    busy=lambda: ADMISSION.stats().get("gpt-4o", {}).get("queued", 0) > 0,
+)
+
+def maybe_speculate(prompt: str, email: str | None, intent: str, incoming_vec, score: int):
+    if SPECULATIVE_ENHANCE and score < SPECULATIVE_THRESHOLD:
+        SPECULATOR.start(prompt, email, lambda: speculative_enhance(prompt, email, intent, incoming_vec))
+
+# ------------------------------------------------------------------------------
+# speculative_enhance(prompt, email, intent, incoming_vec) -> (tuple, publish)
+# Background form of enhance_prompt. Reuses the intent and vector from the
+# routed request and scores the result, but nothing is logged or cached
+# until a later /enhance claims it: `publish()` then logs and caches it
+# under the "enhance_speculative" pipeline and returns the deferred CoT
+# score task, if any. Unclaimed results leave no trace in Neo4j or the
+# analytics. Raises on failure so the stored result is discarded and
+# /enhance runs normally.
+# ------------------------------------------------------------------------------
+async def speculative_enhance(prompt: str, email: str | None, intent: str, incoming_vec):
+    run = PipelineRun("enhance_speculative")
+    ctx = new_context(prompt)
+    try:
+        intent, incoming_vec, template, modified_prompt, model_used = await prepare_enhancement(
+            prompt, run, ctx, intent, incoming_vec)
+        response, model_used = await generate_response(template, {"input": modified_prompt}, model_used, email, run, ctx,
+                                                       hedge=False)
+        score, cot_score = await evaluate_response(prompt, intent, response.content, run, ctx)
+    except Exception:
+        ERRORS.inc(component="enhance_speculative")
+        run.finish("error")
+        ctx.finish()
+        raise
+    latency = run.timings.get("generate")
+    run.finish()
+    ctx.finish()
+
+    async def publish():
+        await publish_response(prompt, intent, response.content, model_used, incoming_vec, email,
+                               score, cot_score, latency, run.pipeline, ctx)
+        return ctx.deferred
+
+    return (intent, response.content, score, model_used), publish
+
 
 # ======================== Neo4j Logging ========================
 
 # ------------------------------------------------------------------------------
-# log_to_neo4j(prompt, intent, response, score, cot_score, model, email=None)
+# log_to_neo4j(prompt, intent, response, score, cot_score, model, email=None,
+#              latency_ms=None, pipeline=None)
 #
-# Writes the interaction metadata into a Neo4j database for logging, analysis,
-# and graph visualization. It creates nodes for User, Prompt, Intent, Response,
-# and Model, and links them with meaningful relationships.
-# ------------------------------------------------------------------------------
-
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-
-def log_to_neo4j(prompt: str, intent: str, response: str, score: float, cot_score: float, model: str, email=None):
-    try: 
-      with driver.session() as session:
-          session.run(
-              """
-              MERGE (p:Prompt {text: $prompt})
-              MERGE (i:Intent {type: $intent})
-              CREATE (r:Response {
-                  text: $response,
-                  score: $score,
-                  cot_score: $cot_score,
-                  timestamp: datetime()
-              })
-              MERGE (m:Model {name: $model})
-              
-              // Optional user node if email is provided
-              FOREACH (_ IN CASE WHEN $email IS NOT NULL THEN [1] ELSE [] END |
-                  MERGE (u:User {email: $email})
-                  MERGE (u)-[:ASKED]->(p)
-              )
-              
-              MERGE (p)-[:HAS_INTENT]->(i)
-              MERGE (p)-[:GOT_RESPONSE]->(r)
-              MERGE (i)-[:TRIGGERED]->(r)
-              MERGE (m)-[:GENERATED]->(r)
-              """,
-              prompt=prompt,
-              intent=intent,
-              response=response,
-              score=score,
-              cot_score=cot_score,
-              model=model,
-              email=email,
-          )
-
-    except:
-      print(f"Neo4j logging error")
+# Queues the interaction metadata for the background Neo4j writer, which
+# batches records into UNWIND writes creating User, Prompt, Intent, Response,
+# and Model nodes and their relationships. Returns the Response node id.
+# ------------------------------------------------------------------------------
+
+NEO4J_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "100"))
+NEO4J_FLUSH_INTERVAL = float(os.getenv("NEO4J_FLUSH_INTERVAL", "0.5"))
+NEO4J_QUEUE_SIZE = int(os.getenv("NEO4J_QUEUE_SIZE", "10000"))
+ANALYTICS_ROLLUP = os.getenv("ANALYTICS_ROLLUP", "true").lower() == "true"   # maintain analytics aggregates
+
+# Text storage: "inline" keeps text on Prompt/Response nodes, "hashed" stores
+# each distinct body once as a compressed Text node (migrate with text_store.py)
+TEXT_STORAGE = os.getenv("TEXT_STORAGE", "inline").lower()
+TEXT_COMPRESS_LEVEL = int(os.getenv("TEXT_COMPRESS_LEVEL", "6"))
+TEXT_COMPRESS_MIN_BYTES = int(os.getenv("TEXT_COMPRESS_MIN_BYTES", "256"))   # smaller bodies are stored raw
+TEXT_RECENT_HASHES = int(os.getenv("TEXT_RECENT_HASHES", "10000"))           # stored hashes remembered per worker
+
+# Connection pool of the async Neo4j driver
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "10"))
+NEO4J_CONNECT_TIMEOUT = float(os.getenv("NEO4J_CONNECT_TIMEOUT", "5"))
+NEO4J_WARMUP_TIMEOUT = float(os.getenv("NEO4J_WARMUP_TIMEOUT", "15"))   # max wait for schema setup at startup
+
+# Async driver so logging never blocks the event loop (in-memory stand-in when
+# PROVIDERS=fake); created by init_clients, which also hands it to the writer
+driver = None
+neo4j_writer = Neo4jWriter(
+    driver,
+    batch_size=NEO4J_BATCH_SIZE,
+    flush_interval=NEO4J_FLUSH_INTERVAL,
+    max_queue=NEO4J_QUEUE_SIZE,
+    rollup=ANALYTICS_ROLLUP,
+    hashed_text=TEXT_STORAGE == "hashed",
+    compress_level=TEXT_COMPRESS_LEVEL,
+    compress_min_bytes=TEXT_COMPRESS_MIN_BYTES,
+    recent_texts=TEXT_RECENT_HASHES,
+)
+
+async def log_to_neo4j(prompt: str, intent: str, response: str, score: float, cot_score: float, model: str, email=None,
+                       latency_ms: float | None = None, pipeline: str | None = None):
+    return await neo4j_writer.submit(prompt, intent, response, score, cot_score, model, email, latency_ms, pipeline)
+
+# Requests answered without a generation (cache hits, coalesced and batch
+# duplicates) only count towards the analytics cache-hit rates
+async def log_cache_hit(intent: str, model: str, email=None):
+    await neo4j_writer.record_hit(intent, model, email)
+
+# ======================== Analytics ========================
+
+# ------------------------------------------------------------------------------
+# analytics_daily(days, model=None, intent=None) / analytics_summary(days) /
+# analytics_user(email)
+# Reads of the precomputed aggregates backing the /analytics routes.
+# ------------------------------------------------------------------------------
+async def analytics_daily(days: int = 7, model: str | None = None, intent: str | None = None) -> list:
+    await ensure_clients()
+    return await analytics.daily_stats(driver, days, model, intent)
+
+async def analytics_summary(days: int = 7) -> dict:
+    await ensure_clients()
+    return await analytics.summary(driver, days)
+
+async def analytics_user(email: str) -> dict | None:
+    await ensure_clients()
+    return await analytics.user_stats(driver, email)
+
+# ======================== Metrics Export ========================
+
+# Statistics kept elsewhere in the process, read when /metrics is scraped
+REGISTRY.callback(
+    "promptlink_upstream_calls_total", "External calls made while handling requests, by kind.",
+    lambda: {(kind,): n for kind, n in CALL_STATS.totals.items()}, ("kind",), kind="counter")
+REGISTRY.callback(
+    "promptlink_cache_entries", "Entries held by the semantic cache.", lambda: {(): len(CACHE)})
+REGISTRY.callback(
+    "promptlink_coalesced_requests_total", "Requests that joined an identical in-flight request.",
+    lambda: {(): PROMPT_FLIGHTS.coalesced}, kind="counter")
+REGISTRY.callback(
+    "promptlink_embedding_memo", "Embedding memo hits, misses and upstream calls.",
+    lambda: {(name,): value for name, value in embedding_model.stats().items() if name != "hit_rate"},
+    ("stat",))
+REGISTRY.callback(
+    "promptlink_neo4j_writer", "Background Neo4j writer queue depth and totals.",
+    lambda: {(name,): value for name, value in neo4j_writer.stats().items()}, ("stat",))
+REGISTRY.callback(
+    "promptlink_admission_queue_depth", "Generation requests waiting for admission, by model.",
+    lambda: {(model,): stats["queued"] for model, stats in ADMISSION.stats().items()}, ("model",))
+REGISTRY.callback(
+    "promptlink_admission_in_flight", "Admitted generations in flight, by model.",
+    lambda: {(model,): stats["in_flight"] for model, stats in ADMISSION.stats().items()}, ("model",))
+REGISTRY.callback(
+    "promptlink_hedge_delay_seconds", "Current first-token delay before a generation is hedged, by model.",
+    lambda: {(model,): HEDGER.delay(model) for model in HEDGER.secondaries}, ("model",))
+REGISTRY.callback(
+    "promptlink_speculative_enhancements_stored", "Speculative enhancements stored or running.",
+    lambda: {(): SPECULATOR.stats()["stored"]})
+REGISTRY.callback(
+    "promptlink_deferred_scores_pending", "Deferred chain-of-thought scores not yet settled.",
+    lambda: {(): len(DEFERRED_SCORES)})
@@ -0,0 +1,177 @@
+"""
+===================================================================
+  bench_concurrency.py — Event-loop concurrency benchmark
+===================================================================
+
+Measures how many concurrent /prompt requests a single FastAPI worker
+can serve when every upstream call (intent classification, embedding,
+generation, CoT scoring and Neo4j logging) takes a fixed amount of
+network time.
+
+The real clients in utils.py are replaced with latency stand-ins so the
+benchmark runs without credentials. Two modes are compared:
+
+1. async    — stand-ins await asyncio.sleep, like the native async
+              clients the pipeline now uses.
+2. blocking — stand-ins call time.sleep on the event loop, reproducing
+              the old synchronous invoke/embed_query/session.run calls.
+
+Usage (from backend/):
+    python bench/bench_concurrency.py --latency 0.05 --slo 1.0
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+os.environ.setdefault("NEO4J_URI", "bolt://localhost:7687")
+
+import httpx
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+import utils
+from main import app
+
+# ======================== Latency Stand-ins ========================
+
+# ------------------------------------------------------------------------------
+# make_wait(latency, blocking) -> coroutine function
+# Returns an awaitable that simulates one upstream round trip, either
+# cooperatively (asyncio.sleep) or by blocking the event loop (time.sleep).
+# ------------------------------------------------------------------------------
+def make_wait(latency: float, blocking: bool):
+    async def wait():
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+    return wait
+
+# ------------------------------------------------------------------------------
+# make_chat(wait, content) -> Runnable
+# Chat model stand-in usable in `template | llm` chains and with ainvoke.
+# ------------------------------------------------------------------------------
+def make_chat(wait, content: str):
+    async def respond(_):
+        await wait()
+        return AIMessage(content=content)
+    return RunnableLambda(lambda _: AIMessage(content=content), afunc=respond)
+
+class StubEmbeddings:
+    def __init__(self, wait, dim: int = 1536):
+        self.wait = wait
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    async def aembed_query(self, text: str):
+        await self.wait()
+        return self.rng.normal(size=self.dim).tolist()
+
+class StubResult:
+    async def consume(self):
+        return None
+
+class StubSession:
+    def __init__(self, wait):
+        self.wait = wait
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, **params):
+        await self.wait()
+        return StubResult()
+
+class StubDriver:
+    def __init__(self, wait):
+        self.wait = wait
+
+    def session(self):
+        return StubSession(self.wait)
+
+    async def execute_query(self, query, **params):
+        await self.wait()
+        return [], None, []
+
+# ------------------------------------------------------------------------------
+# install_stubs(latency, blocking)
+# Swaps every upstream client in utils.py for a latency stand-in.
+# ------------------------------------------------------------------------------
+def install_stubs(latency: float, blocking: bool):
+    wait = make_wait(latency, blocking)
+    answer = "Step one. Step two. " * 40
+    utils.llm_3 = make_chat(wait, "7")
+    utils.llm_4o = make_chat(wait, answer)
+    utils.llm_gemini = make_chat(wait, answer)
+    utils.intent_chain = make_chat(wait, "explain") | StrOutputParser()
+    utils.embedding_model = StubEmbeddings(wait)
+    utils.driver = StubDriver(wait)
+    utils.neo4j_writer.driver = utils.driver
+    utils.CACHE.clear()
+
+# ======================== Load Driver ========================
+
+# ------------------------------------------------------------------------------
+# run_level(concurrency, requests) -> dict
+# Sends `requests` prompts with at most `concurrency` in flight and
+# returns throughput and latency percentiles.
+# ------------------------------------------------------------------------------
+async def run_level(concurrency: int, requests: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post("/prompt", json={"prompt": f"benchmark prompt {i}"})
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "throughput": requests / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--slo", type=float, default=1.0, help="p99 latency budget in seconds")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--rounds", type=int, default=3, help="requests per level = level * rounds")
+    args = parser.parse_args()
+
+    for mode in ("blocking", "async"):
+        install_stubs(args.latency, blocking=(mode == "blocking"))
+        max_within_slo = 0
+        print(f"\n== {mode} ==")
+        print(f"{'conc':>6} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for level in args.levels:
+            stats = await run_level(level, level * args.rounds)
+            print(f"{level:>6} {stats['throughput']:>10.1f} {stats['p50'] * 1000:>10.1f} {stats['p99'] * 1000:>10.1f}")
+            if stats["p99"] <= args.slo:
+                max_within_slo = level
+        print(f"max concurrency within {args.slo:.2f}s p99: {max_within_slo}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+"""
+===================================================================
+  bench_load.py — Trace replay load test for /prompt and /enhance
+===================================================================
+
+Replays a JSON-lines prompt trace against the FastAPI app in-process
+(httpx ASGITransport, lifespan included) at one or more concurrency
+levels and reports, per level:
+
+1. Throughput and p50/p95/p99 latency, overall and per endpoint.
+2. Semantic cache hit rate (/prompt responses served from cache).
+3. Upstream calls per request (LLM, embedding, Neo4j) and the
+   embedding memo hit rate.
+4. How often generations were hedged to a second model. With
+   --hedging both, each level runs with hedging off and on and the p99
+   change is printed; --tail-rate makes a share of fake calls stall so
+   there is a latency tail to cut.
+
+By default the upstream clients are the offline stand-ins from
+providers.py (PROVIDERS=fake), so the run needs no credentials and is
+deterministic; pass --live to use whatever PROVIDERS the environment
+selects.
+
+Trace lines are JSON objects. The prompt is taken from "prompt", or
+from "title" and "body" joined (so the backlog's requests.jsonl works
+as-is). An optional "endpoint" ("prompt" or "enhance") and "email" are
+honoured; lines without an endpoint go to /enhance at --enhance-ratio.
+
+Usage (from backend/):
+    python bench/bench_load.py --trace ../requests.jsonl --levels 1 8 32 --repeat 2
+    python bench/bench_load.py --levels 8 --tail-rate 0.05 --tail-latency 3 --hedging both
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+# ======================== Trace ========================
+
+# ------------------------------------------------------------------------------
+# load_trace(path, enhance_ratio, limit) -> list[tuple[str, dict]]
+# Reads (endpoint, request body) pairs from a JSON-lines trace.
+# ------------------------------------------------------------------------------
+def load_trace(path: str, enhance_ratio: float, limit: int | None = None) -> list:
+    trace = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompt = record.get("prompt") or "\n\n".join(filter(None, [record.get("title"), record.get("body")]))
+            if not prompt:
+                continue
+            endpoint = record.get("endpoint")
+            if endpoint is None:
+                # Spread enhance requests evenly through the trace
+                n = len(trace)
+                endpoint = "enhance" if int((n + 1) * enhance_ratio) > int(n * enhance_ratio) else "prompt"
+            trace.append((endpoint, {"prompt": prompt, "email": record.get("email")}))
+            if limit and len(trace) >= limit:
+                break
+    return trace
+
+# ======================== Load Driver ========================
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}"
+
+# ------------------------------------------------------------------------------
+# run_level(app, trace, concurrency) -> dict
+# Sends every trace entry with at most `concurrency` requests in flight.
+# ------------------------------------------------------------------------------
+async def run_level(app, trace: list, concurrency: int) -> dict:
+    latencies = {"prompt": [], "enhance": []}
+    cache_hits, errors = 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(endpoint: str, body: dict):
+            nonlocal cache_hits, errors
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post(f"/{endpoint}", json=body)
+                latencies[endpoint].append(time.perf_counter() - start)
+                if resp.status_code != 200:
+                    errors += 1
+                elif resp.json().get("served_from_cache"):
+                    cache_hits += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(endpoint, body) for endpoint, body in trace))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "cache_hits": cache_hits,
+        "errors": errors,
+    }
+
+# ------------------------------------------------------------------------------
+# report(level, stats, calls, requests, embed_before, embed_after)
+# Prints one level's results.
+# ------------------------------------------------------------------------------
+def report(level: int, stats: dict, calls: Counter, requests: int, embed_before: dict, embed_after: dict,
+           hedges: dict, label: str = ""):
+    latencies = stats["latencies"]
+    total = len(latencies["prompt"]) + len(latencies["enhance"])
+    lookups = sum(embed_after[k] - embed_before[k] for k in ("memory_hits", "disk_hits", "misses"))
+    memo_hits = sum(embed_after[k] - embed_before[k] for k in ("memory_hits", "disk_hits"))
+    per_request = ", ".join(f"{kind} {n / max(1, requests):.2f}" for kind, n in sorted(calls.items()))
+
+    print(f"\n== concurrency {level}{label} ==")
+    print(f"requests {total}  errors {stats['errors']}  throughput {total / stats['elapsed']:.1f} req/s")
+    print(f"{'endpoint':>10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print(f"{'all':>10} {total:>6} {percentiles(latencies['prompt'] + latencies['enhance'])}")
+    for endpoint in ("prompt", "enhance"):
+        print(f"{endpoint:>10} {len(latencies[endpoint]):>6} {percentiles(latencies[endpoint])}")
+    print(f"cache hit rate (/prompt): {stats['cache_hits'] / max(1, len(latencies['prompt'])):.1%}")
+    print(f"embedding memo hit rate:  {memo_hits / max(1, lookups):.1%}")
+    print(f"upstream calls/request:   {per_request or '-'} (total {sum(calls.values()) / max(1, requests):.2f})")
+    print(f"hedged generations:       {hedges['hedged']}/{hedges['requests']} "
+          f"(secondary won {hedges['secondary_wins']}, fallbacks {hedges['fallbacks']}, "
+          f"deadline misses {hedges['deadline_exceeded']})")
+
+def p99(stats: dict) -> float:
+    samples = stats["latencies"]["prompt"] + stats["latencies"]["enhance"]
+    return float(np.percentile(samples, 99)) * 1000 if samples else 0.0
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", default=os.path.join(os.path.dirname(__file__), "..", "..", "requests.jsonl"))
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32], help="concurrency levels")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the trace this many times per level")
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N trace entries")
+    parser.add_argument("--enhance-ratio", type=float, default=0.2, help="share of unlabelled entries sent to /enhance")
+    parser.add_argument("--llm-latency", type=float, default=None, help="fake LLM seconds per call")
+    parser.add_argument("--embed-latency", type=float, default=None, help="fake embedding seconds per call")
+    parser.add_argument("--tail-rate", type=float, default=None, help="share of fake LLM calls that stall")
+    parser.add_argument("--tail-latency", type=float, default=None, help="seconds a stalled fake call waits")
+    parser.add_argument("--hedging", choices=["on", "off", "both"], default="on")
+    parser.add_argument("--live", action="store_true", help="do not force the offline stand-ins")
+    args = parser.parse_args()
+
+    # Configure the stand-ins before utils.py builds its clients
+    if not args.live:
+        os.environ["PROVIDERS"] = "fake"
+    if args.llm_latency is not None:
+        os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    if args.embed_latency is not None:
+        os.environ["FAKE_EMBED_LATENCY"] = str(args.embed_latency)
+    if args.tail_rate is not None:
+        os.environ["FAKE_LLM_TAIL_RATE"] = str(args.tail_rate)
+    if args.tail_latency is not None:
+        os.environ["FAKE_LLM_TAIL_LATENCY"] = str(args.tail_latency)
+
+    import utils
+    from evaluation import CALL_STATS
+    from main import app
+
+    trace = load_trace(args.trace, args.enhance_ratio, args.limit) * args.repeat
+    print(f"trace: {len(trace)} requests from {args.trace} (providers: {os.getenv('PROVIDERS', 'live')})")
+
+    modes = {"on": [True], "off": [False], "both": [False, True]}[args.hedging]
+
+    async with app.router.lifespan_context(app):
+        for level in args.levels:
+            tails = {}
+            for hedging in modes:
+                utils.CACHE.clear()
+                utils.HEDGER.enabled = hedging
+                calls_before, requests_before = Counter(CALL_STATS.totals), CALL_STATS.requests
+                embed_before = utils.embedding_model.stats()
+                hedges_before = dict(utils.HEDGER.counts)
+
+                stats = await run_level(app, trace, level)
+
+                calls = Counter(CALL_STATS.totals)
+                calls.subtract(calls_before)
+                hedges = {name: n - hedges_before[name] for name, n in utils.HEDGER.counts.items()}
+                report(level, stats, +calls, CALL_STATS.requests - requests_before,
+                       embed_before, utils.embedding_model.stats(), hedges,
+                       f" (hedging {'on' if hedging else 'off'})" if len(modes) > 1 else "")
+                tails[hedging] = p99(stats)
+            if len(modes) > 1:
+                print(f"\np99 with hedging: {tails[True]:.1f} ms vs {tails[False]:.1f} ms without "
+                      f"({(tails[False] - tails[True]) / max(tails[False], 1e-9):+.1%} improvement)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
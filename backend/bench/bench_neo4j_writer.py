@@ -0,0 +1,114 @@
+"""
+===================================================================
+  bench_neo4j_writer.py — Neo4j logging write-throughput benchmark
+===================================================================
+
+Compares the old per-interaction logging (one session and one MERGE
+query per request) with the batched UNWIND writer in neo4j_writer.py
+against a real Neo4j instance.
+
+Start a disposable local container first, for example:
+    docker run --rm -p 7687:7687 -e NEO4J_AUTH=neo4j/benchpass neo4j:5
+
+Usage (from backend/):
+    NEO4J_URI=bolt://localhost:7687 NEO4J_USERNAME=neo4j NEO4J_PASSWORD=benchpass \\
+        python bench/bench_neo4j_writer.py --records 5000
+
+Every node written is labelled with a unique run tag in the prompt text
+and removed at the end of the run.
+
+===================================================================
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from neo4j import AsyncGraphDatabase
+
+from neo4j_writer import Neo4jWriter, ensure_schema
+
+# Logging query as it ran inline on the request path before batching
+INLINE_QUERY = """
+MERGE (p:Prompt {text: $prompt})
+MERGE (i:Intent {type: $intent})
+CREATE (r:Response {text: $response, score: $score, cot_score: $cot_score, timestamp: datetime()})
+MERGE (m:Model {name: $model})
+FOREACH (_ IN CASE WHEN $email IS NOT NULL THEN [1] ELSE [] END |
+    MERGE (u:User {email: $email})
+    MERGE (u)-[:ASKED]->(p)
+)
+MERGE (p)-[:HAS_INTENT]->(i)
+MERGE (p)-[:GOT_RESPONSE]->(r)
+MERGE (i)-[:TRIGGERED]->(r)
+MERGE (m)-[:GENERATED]->(r)
+"""
+
+def make_records(tag: str, count: int) -> list:
+    return [
+        (f"{tag} prompt {i}", "explain", f"response {i}", 70, 7, "gpt-3.5-turbo", f"user{i % 50}@{tag}.bench")
+        for i in range(count)
+    ]
+
+async def bench_inline(driver, records: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(record):
+        prompt, intent, response, score, cot_score, model, email = record
+        async with semaphore:
+            async with driver.session() as session:
+                result = await session.run(INLINE_QUERY, prompt=prompt, intent=intent, response=response,
+                                           score=score, cot_score=cot_score, model=model, email=email)
+                await result.consume()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(record) for record in records))
+    return len(records) / (time.perf_counter() - start)
+
+async def bench_batched(driver, records: list, batch_size: int) -> float:
+    writer = Neo4jWriter(driver, batch_size=batch_size, flush_interval=0.05)
+    start = time.perf_counter()
+    for record in records:
+        await writer.submit(*record)
+    await writer.stop()
+    return len(records) / (time.perf_counter() - start)
+
+async def cleanup(driver, tag: str):
+    await driver.execute_query(
+        "MATCH (p:Prompt) WHERE p.text STARTS WITH $tag "
+        "OPTIONAL MATCH (p)-[:GOT_RESPONSE]->(r:Response) DETACH DELETE p, r",
+        tag=tag,
+    )
+    await driver.execute_query("MATCH (u:User) WHERE u.email ENDS WITH $suffix DETACH DELETE u",
+                               suffix=f"@{tag}.bench")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight inline writes")
+    args = parser.parse_args()
+
+    driver = AsyncGraphDatabase.driver(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "benchpass")),
+    )
+    await ensure_schema(driver)
+    tag = f"bench-{uuid.uuid4().hex[:8]}"
+    try:
+        inline = await bench_inline(driver, make_records(f"{tag}-inline", args.records), args.concurrency)
+        batched = await bench_batched(driver, make_records(f"{tag}-batched", args.records), args.batch_size)
+        print(f"inline  (one query per interaction): {inline:>10.1f} writes/s")
+        print(f"batched (UNWIND x{args.batch_size}):          {batched:>10.1f} writes/s")
+        print(f"speedup: {batched / inline:.1f}x")
+    finally:
+        await cleanup(driver, tag)
+        await driver.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+===================================================================
+  bench_startup.py — Worker cold-start benchmark
+===================================================================
+
+Starts the backend in fresh Python processes and measures, per run:
+
+1. import    — time to import main (what a worker pays before it can
+               even start the event loop).
+2. serving   — time until the lifespan startup has finished, i.e. when
+               uvicorn would begin accepting connections.
+3. ready     — time until GET /ready would report 200 (clients built,
+               Neo4j schema prepared or failed).
+4. first     — time until the first /prompt request has been answered.
+
+Each phase is measured from process start-up, so they add up. Runs
+use fresh interpreters, so module caches and imports are cold.
+
+Usage (from backend/):
+    python bench/bench_startup.py --runs 5                 # offline stand-ins
+    python bench/bench_startup.py --runs 5 --providers live --neo4j-uri bolt://10.255.255.1:7687
+
+With --providers live and dummy credentials, "first" fails quickly and
+is reported as n/a; point --neo4j-uri at an unreachable host to check
+that a dead Neo4j no longer delays "serving".
+
+===================================================================
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Runs inside the child process; prints one JSON line with the timings
+CHILD = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+timings = {"import": time.perf_counter() - start}
+
+async def run():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        timings["serving"] = time.perf_counter() - start
+        while not main.READINESS["ready"] and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.005)
+        timings["ready"] = time.perf_counter() - start if main.READINESS["ready"] else None
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            try:
+                resp = await client.post("/prompt", json={"prompt": "Explain what a cold start is."})
+                timings["first"] = time.perf_counter() - start if resp.status_code == 200 else None
+            except Exception:
+                timings["first"] = None
+
+asyncio.run(run())
+print(json.dumps(timings))
+"""
+
+def run_once(env: dict) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD, APP_DIR], env=env, capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(lines[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--providers", choices=["fake", "live"], default="fake")
+    parser.add_argument("--neo4j-uri", default=None, help="Neo4j URI for live runs")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PROVIDERS=args.providers)
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env.setdefault("GOOGLE_API_KEY", "bench")
+    env.setdefault("NEO4J_URI", "bolt://localhost:7687")
+    if args.neo4j_uri:
+        env["NEO4J_URI"] = args.neo4j_uri
+
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    print(f"providers={args.providers} runs={args.runs} (seconds since process start)")
+    print(f"{'phase':>8} {'median':>8} {'min':>8} {'max':>8}")
+    for phase in ("import", "serving", "ready", "first"):
+        values = [run[phase] for run in runs if run.get(phase) is not None]
+        if not values:
+            print(f"{phase:>8} {'n/a':>8}")
+            continue
+        print(f"{phase:>8} {statistics.median(values):>8.3f} {min(values):>8.3f} {max(values):>8.3f}")
+
+if __name__ == "__main__":
+    main()
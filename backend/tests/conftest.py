@@ -0,0 +1,20 @@
+"""
+===================================================================
+  conftest.py — Shared setup for the backend unit tests
+===================================================================
+
+Puts backend/app/ on the import path (the app modules import each
+other by bare name) and selects the offline provider stand-ins, so the
+suite runs without credentials, network or a Neo4j server.
+
+Usage (from backend/):
+    python -m pytest -q
+
+===================================================================
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("PROVIDERS", "fake")
@@ -0,0 +1,119 @@
+"""
+Tests for admission.py: round-robin fairness, queue caps, shedding and
+the token budget.
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, ModelScheduler, Overloaded, parse_limits
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def test_parse_limits():
+    assert parse_limits("gpt-4o=8:30000, gemini=16") == {"gpt-4o": (8, 30000), "gemini": (16, None)}
+
+def test_waiters_are_served_round_robin_across_users():
+    async def main():
+        scheduler = ModelScheduler("m", max_concurrency=1)
+        holder = await scheduler.acquire("x", 1)
+        order = []
+
+        async def request(user: str, n: int):
+            ticket = await scheduler.acquire(user, 1)
+            order.append(f"{user}{n}")
+            scheduler.release(ticket, 0.0)
+
+        tasks = [asyncio.create_task(request("heavy", n)) for n in range(3)]
+        await settle()
+        tasks += [asyncio.create_task(request("light", n)) for n in range(2)]
+        await settle()
+        scheduler.release(holder, 0.0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["heavy0", "light0", "heavy1", "light1", "heavy2"]
+
+def test_per_user_queue_cap_rejects_only_that_user():
+    async def main():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=10, max_user_queue=2)
+        await scheduler.acquire("x", 1)
+        waiters = [asyncio.create_task(scheduler.acquire("heavy", 1)) for _ in range(2)]
+        await settle()
+        with pytest.raises(Overloaded) as info:
+            await scheduler.acquire("heavy", 1)
+        other = asyncio.create_task(scheduler.acquire("light", 1))
+        await settle()
+        assert info.value.retry_after >= 1
+        assert scheduler.stats()["queued"] == 3 and scheduler.rejected == 1
+        for task in waiters + [other]:
+            task.cancel()
+
+    asyncio.run(main())
+
+def test_full_queue_sheds_the_longest_user_queue():
+    async def main():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=3, max_user_queue=3)
+        await scheduler.acquire("x", 1)
+        heavy = [asyncio.create_task(scheduler.acquire("heavy", 1)) for _ in range(3)]
+        await settle()
+
+        light = asyncio.create_task(scheduler.acquire("light", 1))
+        await settle()
+        # The newest heavy waiter made room for the light user
+        assert isinstance(heavy[2].exception(), Overloaded)
+        assert not heavy[0].done() and not heavy[1].done() and not light.done()
+        assert scheduler.stats()["shed"] == 1
+
+        # Queues now as long as the caller's would be: the caller is rejected
+        light2 = asyncio.create_task(scheduler.acquire("light", 1))
+        await settle()
+        assert isinstance(light2.exception(), Overloaded)
+        assert scheduler.stats()["queued"] == 3
+        for task in heavy[:2] + [light]:
+            task.cancel()
+
+    asyncio.run(main())
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = ModelScheduler("m", max_concurrency=1)
+        holder = await scheduler.acquire("x", 1)
+        waiter = asyncio.create_task(scheduler.acquire("a", 1))
+        await settle()
+        waiter.cancel()
+        await settle()
+        assert scheduler.stats()["queued"] == 0 and scheduler.stats()["queued_users"] == 0
+        scheduler.release(holder, 0.0)
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+def test_token_budget_defers_until_refund():
+    async def main():
+        scheduler = ModelScheduler("m", max_concurrency=4, tokens_per_minute=100)
+        first = await scheduler.acquire("a", 80)
+        second = asyncio.create_task(scheduler.acquire("b", 50))
+        await settle()
+        assert not second.done()
+
+        first.settle(10)   # the call used far fewer tokens than estimated
+        await settle()
+        assert second.done()
+
+    asyncio.run(main())
+
+def test_unlimited_models_pass_through():
+    async def main():
+        controller = AdmissionController({"gpt-4o": (1, None)})
+        async with controller.slot("other-model", "a", "prompt") as ticket:
+            assert ticket is None
+        async with controller.slot("gpt-4o", "a", "prompt") as ticket:
+            assert ticket is not None
+            assert controller.stats()["gpt-4o"]["in_flight"] == 1
+        assert controller.stats()["gpt-4o"]["in_flight"] == 0
+
+    asyncio.run(main())
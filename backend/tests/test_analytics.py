@@ -0,0 +1,204 @@
+"""
+Tests for analytics.py roll-up deltas, the email backfill and the
+writer's roll-up step in neo4j_writer.py (against stub drivers, no
+Neo4j needed).
+"""
+
+import asyncio
+
+from analytics import (BACKFILL_EMAIL_QUERY, DAILY_ROLLUP_QUERY, MIGRATION_CURSOR_QUERY, MIGRATION_MARK_QUERY,
+                       MIGRATION_STATE_QUERY, SCORE_BINS, USER_ROLLUP_QUERY, Rollup, backfill_response_emails,
+                       empty_totals, fold_bins, merge_totals, score_bin, summarize)
+from neo4j_writer import BATCH_QUERY, SCHEMA_STATEMENTS, Neo4jWriter, ensure_schema
+
+def response(score, model="gpt-4o", intent="code", email="a@b.c", timestamp="2026-10-01T12:00:00+00:00",
+             latency_ms=100.0) -> dict:
+    return {"score": score, "model": model, "intent": intent, "email": email, "timestamp": timestamp,
+            "latency_ms": latency_ms}
+
+# ======================== Roll-up deltas ========================
+
+def test_score_bin_rounds_half_up_and_clamps():
+    assert [score_bin(s) for s in (None, 0, 4.9, 5, 94, 95, 100, 130, -5)] == [0, 0, 0, 1, 9, 10, 10, 10, 0]
+
+def test_responses_are_summed_per_day_model_intent_and_user():
+    rollup = Rollup()
+    rollup.add_response(response(80))
+    rollup.add_response(response(61, latency_ms=None))
+    rollup.add_response(response(90, model="gemini", email=None, timestamp="2026-10-02T08:00:00+00:00"))
+
+    daily = {row["key"]: row for row in rollup.daily_rows()}
+    assert set(daily) == {"2026-10-01|gpt-4o|code", "2026-10-02|gemini|code"}
+    day = daily["2026-10-01|gpt-4o|code"]
+    assert (day["responses"], day["score_sum"], day["latency_sum"], day["latency_n"]) == (2, 141, 100.0, 1)
+    assert day["score_hist"][8] == 1 and day["score_hist"][6] == 1 and sum(day["score_hist"]) == 2
+
+    [user] = rollup.user_rows()
+    assert user["email"] == "a@b.c" and user["responses"] == 2
+    assert user["first_seen"] == user["last_seen"] == "2026-10-01T12:00:00+00:00"
+
+def test_user_seen_range_spans_the_batch():
+    rollup = Rollup()
+    rollup.add_response(response(50, timestamp="2026-10-03T00:00:00+00:00"))
+    rollup.add_response(response(50, timestamp="2026-10-01T00:00:00+00:00"))
+    [user] = rollup.user_rows()
+    assert (user["first_seen"], user["last_seen"]) == ("2026-10-01T00:00:00+00:00", "2026-10-03T00:00:00+00:00")
+
+def test_rescore_moves_the_response_between_bins():
+    rollup = Rollup()
+    record = {"day": "2026-10-01", "model": "gpt-4o", "intent": "code", "email": "a@b.c",
+              "timestamp": "2026-10-01T12:00:00+00:00", "previous": 72, "score": 55}
+    rollup.rescore(record)
+    rollup.rescore({**record, "previous": 40, "score": 40})   # unchanged scores are ignored
+
+    [day] = rollup.daily_rows()
+    assert day["responses"] == 0 and day["score_sum"] == -17
+    assert day["score_hist"][7] == -1 and day["score_hist"][6] == 1 and sum(day["score_hist"]) == 0
+    assert rollup.user_rows()[0]["score_sum"] == -17
+
+def test_cache_hits_only_count_hits():
+    rollup = Rollup()
+    rollup.add_hit({"model": "gpt-4o", "intent": "code", "email": None, "timestamp": "2026-10-01T12:00:00+00:00"})
+    [day] = rollup.daily_rows()
+    assert day["cache_hits"] == 1 and day["responses"] == 0
+    assert rollup.user_rows() == []
+
+def test_summarize_and_merge():
+    totals = merge_totals(empty_totals(), {"responses": 2, "score_sum": 150.0, "latency_sum": 300.0, "latency_n": 2,
+                                           "cache_hits": 2, "score_hist": [0] * 7 + [1, 1, 0, 0]})
+    summary = summarize(totals)
+    assert summary["mean_score"] == 75.0 and summary["mean_latency_ms"] == 150.0
+    assert summary["cache_hit_rate"] == 0.5
+    assert summary["score_histogram"]["70"] == 1 and len(summary["score_histogram"]) == SCORE_BINS
+    assert summarize(empty_totals())["mean_score"] is None
+
+def test_fold_bins_merges_rebuild_rows_per_key():
+    records = [
+        {"email": "a", "bin": 8, "responses": 2, "score_sum": 160, "latency_sum": 10, "latency_n": 2,
+         "first_seen": "2026-10-02", "last_seen": "2026-10-03"},
+        {"email": "a", "bin": 5, "responses": 1, "score_sum": 50, "latency_sum": None, "latency_n": 0,
+         "first_seen": "2026-10-01", "last_seen": "2026-10-01"},
+    ]
+    [totals] = fold_bins(records, ("email",)).values()
+    assert totals["responses"] == 3 and totals["score_sum"] == 210 and totals["latency_sum"] == 10
+    assert totals["score_hist"][8] == 2 and totals["score_hist"][5] == 1
+    assert (totals["first_seen"], totals["last_seen"]) == ("2026-10-01", "2026-10-03")
+
+# ======================== Writer roll-up ========================
+
+# ------------------------------------------------------------------------------
+# RecordingDriver
+# Records every query; queries listed in `fail` raise instead.
+# ------------------------------------------------------------------------------
+class RecordingDriver:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.queries = []
+
+    async def execute_query(self, query, **params):
+        if query in self.fail:
+            raise RuntimeError("neo4j down")
+        self.queries.append((query, params))
+        return [], None, []
+
+    def rows(self, query) -> list:
+        return [row for q, params in self.queries if q == query for row in params["rows"]]
+
+def flush(driver) -> Neo4jWriter:
+    async def main():
+        writer = Neo4jWriter(driver, flush_interval=0)
+        await writer.submit("prompt", "code", "answer", 80, 8.0, "gpt-4o", "a@b.c", 120.0, "route")
+        await writer.record_hit("code", "gpt-4o", "a@b.c")
+        await writer.stop()
+        return writer
+
+    return asyncio.run(main())
+
+def test_writer_rolls_up_written_responses_and_hits():
+    driver = RecordingDriver()
+    writer = flush(driver)
+    [day] = driver.rows(DAILY_ROLLUP_QUERY)
+    assert (day["responses"], day["cache_hits"], day["score_sum"]) == (1, 1, 80)
+    assert driver.rows(USER_ROLLUP_QUERY)[0]["email"] == "a@b.c"
+    assert writer.stats()["written"] == 2 and writer.stats()["rollup_failed"] == 0
+
+def test_failed_write_is_not_rolled_up():
+    driver = RecordingDriver(fail={BATCH_QUERY})
+    writer = flush(driver)
+    [day] = driver.rows(DAILY_ROLLUP_QUERY)
+    assert (day["responses"], day["cache_hits"]) == (0, 1)
+    assert writer.stats()["failed"] == 2 and writer.stats()["written"] == 0
+
+def test_failed_roll_up_keeps_the_written_batch():
+    driver = RecordingDriver(fail={DAILY_ROLLUP_QUERY})
+    writer = flush(driver)
+    assert len(driver.rows(BATCH_QUERY)) == 1
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"], stats["rollup_failed"]) == (2, 0, 2)
+
+def test_null_driver_keeps_written_rows_and_texts():
+    from providers import NullNeo4jDriver
+    from text_store import TextStore
+
+    async def main():
+        driver = NullNeo4jDriver(latency=0)
+        writer = Neo4jWriter(driver, flush_interval=0, hashed_text=True)
+        await writer.submit("prompt", "code", "answer", 80, 8.0, "gpt-4o", "a@b.c", 120.0, "route")
+        await writer.stop()
+        [row] = driver.written[BATCH_QUERY]
+        texts = await TextStore(driver).resolve([row["prompt_key"], row["response_hash"], "unknown"])
+        return driver, row, texts
+
+    driver, row, texts = asyncio.run(main())
+    assert texts == {row["prompt_key"]: "prompt", row["response_hash"]: "answer"}
+    assert len(driver.written[DAILY_ROLLUP_QUERY]) == 1
+
+# ======================== Email backfill ========================
+
+# ------------------------------------------------------------------------------
+# BackfillDriver
+# Scripted answers for the backfill queries: `pages` is the sequence of
+# (last key, updated) pages; a page after the cursor is served in order.
+# ------------------------------------------------------------------------------
+class BackfillDriver(RecordingDriver):
+    def __init__(self, pages: list, state=None):
+        super().__init__()
+        self.pages = pages
+        self.state = state
+
+    async def execute_query(self, query, **params):
+        await super().execute_query(query, **params)
+        if query == MIGRATION_STATE_QUERY:
+            return ([self.state] if self.state else []), None, []
+        if query == BACKFILL_EMAIL_QUERY:
+            remaining = [page for page in self.pages if page[0] > params["after"]]
+            last, updated = remaining[0] if remaining else (None, 0)
+            return [{"last": last, "updated": updated}], None, []
+        return [], None, []
+
+def backfill(driver) -> int:
+    return asyncio.run(backfill_response_emails(driver, batch_size=2))
+
+def test_backfill_pages_to_the_end_and_marks_completion():
+    driver = BackfillDriver([("b", 3), ("d", 1)])
+    assert backfill(driver) == 4
+    assert [params["after"] for q, params in driver.queries if q == BACKFILL_EMAIL_QUERY] == ["", "b", "d"]
+    assert [params["cursor"] for q, params in driver.queries if q == MIGRATION_CURSOR_QUERY] == ["b", "d"]
+    assert driver.queries[-1][0] == MIGRATION_MARK_QUERY
+
+def test_backfill_resumes_from_the_saved_cursor():
+    driver = BackfillDriver([("b", 3), ("d", 1)], state={"done": False, "cursor": "b"})
+    assert backfill(driver) == 1
+    assert [params["after"] for q, params in driver.queries if q == BACKFILL_EMAIL_QUERY] == ["b", "d"]
+
+def test_finished_backfill_does_nothing():
+    driver = BackfillDriver([("b", 3)], state={"done": True, "cursor": "b"})
+    assert backfill(driver) == 0
+    assert [q for q, _ in driver.queries] == [MIGRATION_STATE_QUERY]
+
+def test_schema_setup_does_not_backfill():
+    driver = RecordingDriver()
+    asyncio.run(ensure_schema(driver))
+    queries = [q for q, _ in driver.queries]
+    assert queries[-len(SCHEMA_STATEMENTS):] == SCHEMA_STATEMENTS
+    assert MIGRATION_STATE_QUERY not in queries and BACKFILL_EMAIL_QUERY not in queries
@@ -0,0 +1,98 @@
+"""
+Tests for cache.py: lookups, LRU and TTL eviction, and snapshot replay.
+"""
+
+import time
+
+import numpy as np
+
+from cache import SemanticCache
+
+def unit(i: int, dim: int = 8) -> np.ndarray:
+    vec = np.zeros(dim, dtype=np.float32)
+    vec[i] = 1.0
+    return vec
+
+# ======================== Lookup ========================
+
+def test_lookup_returns_best_match_above_threshold():
+    cache = SemanticCache(capacity=10)
+    cache.add(unit(0), "code", "a", "gpt-4o")
+    cache.add(unit(1), "code", "b", "gpt-4o")
+
+    query = unit(0) + 0.1 * unit(1)
+    hit = cache.lookup(query, "code", 0.9)
+    assert hit is not None and hit.response == "a"
+    assert cache.lookup(unit(2), "code", 0.9) is None
+
+def test_lookup_is_partitioned_by_intent():
+    cache = SemanticCache(capacity=10)
+    cache.add(unit(0), "code", "a", "gpt-4o")
+
+    assert cache.lookup(unit(0), "math", 0.9) is None
+    hit = cache.lookup(unit(0), None, 0.9)
+    assert hit is not None and hit.intent == "code"
+
+# ======================== Eviction ========================
+
+def test_capacity_evicts_least_recently_used():
+    cache = SemanticCache(capacity=2)
+    cache.add(unit(0), "code", "a", "m")
+    cache.add(unit(1), "code", "b", "m")
+    assert cache.lookup(unit(0), "code", 0.9) is not None   # "a" is now most recent
+
+    cache.add(unit(2), "code", "c", "m")
+    assert len(cache) == 2
+    assert cache.lookup(unit(1), "code", 0.9) is None
+    assert cache.lookup(unit(0), "code", 0.9).response == "a"
+    assert cache.lookup(unit(2), "code", 0.9).response == "c"
+
+def test_evicted_slots_are_reused():
+    cache = SemanticCache(capacity=1)
+    for i in range(5):
+        cache.add(unit(i), "code", str(i), "m")
+    partition = cache._partitions["code"]
+    assert partition.size == 1 and partition.high_water == 1
+    assert cache.lookup(unit(4), "code", 0.9).response == "4"
+
+def test_ttl_expires_entries():
+    cache = SemanticCache(capacity=10, ttl=60)
+    cache.add(unit(0), "code", "old", "m", created_at=time.time() - 120)
+    cache.add(unit(1), "code", "new", "m")
+
+    assert cache.lookup(unit(0), "code", 0.9) is None
+    assert cache.lookup(unit(1), "code", 0.9).response == "new"
+    assert len(cache) == 1
+
+def test_ann_partition_finds_exact_match():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(64, 16)).astype(np.float32)
+    cache = SemanticCache(capacity=100, ann=True, ann_min_size=32, n_probe=8)
+    for i, vec in enumerate(vectors):
+        cache.add(vec, "code", str(i), "m")
+
+    assert cache._partitions["code"].centroids is not None
+    assert cache.lookup(vectors[40], "code", 0.99).response == "40"
+
+# ======================== Snapshot ========================
+
+def test_snapshot_replays_entries_in_order(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(capacity=3, snapshot_path=path)
+    for i in range(4):
+        cache.add(unit(i), "code", str(i), "m")
+    cache.snapshot()
+
+    warm = SemanticCache(capacity=3, snapshot_path=path)
+    assert len(warm) == 3
+    assert warm.lookup(unit(0), "code", 0.9) is None
+    assert [warm.lookup(unit(i), "code", 0.9).response for i in (1, 2, 3)] == ["1", "2", "3"]
+
+def test_snapshot_drops_expired_entries(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(capacity=10, ttl=60)
+    cache.add(unit(0), "code", "a", "m", created_at=time.time() - 30)
+    cache.save(path)
+
+    warm = SemanticCache(capacity=10, ttl=20, snapshot_path=path)
+    assert len(warm) == 0
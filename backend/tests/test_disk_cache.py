@@ -0,0 +1,78 @@
+"""
+Tests for disk_cache.py: ring eviction, replay across instances and
+log compaction.
+"""
+
+import numpy as np
+import pytest
+
+import disk_cache
+from disk_cache import DiskCache
+
+def unit(i: int, dim: int = 8) -> np.ndarray:
+    vec = np.zeros(dim, dtype=np.float32)
+    vec[i] = 1.0
+    return vec
+
+def test_entries_replay_into_a_new_instance(tmp_path):
+    writer = DiskCache(str(tmp_path), capacity=4)
+    writer.add(unit(0), "code", "a", "gpt-4o")
+    writer.add(unit(1), "math", "b", "gpt-3.5-turbo")
+
+    reader = DiskCache(str(tmp_path), capacity=4)
+    assert len(reader) == 2
+    hit = reader.lookup(unit(1), "math", 0.9)
+    assert hit.response == "b" and hit.model == "gpt-3.5-turbo"
+
+def test_lookup_sees_entries_added_by_another_instance(tmp_path):
+    first = DiskCache(str(tmp_path), capacity=4)
+    second = DiskCache(str(tmp_path), capacity=4)
+    assert second.lookup(unit(0), "code", 0.9) is None
+
+    first.add(unit(0), "code", "a", "m")
+    assert second.lookup(unit(0), "code", 0.9).response == "a"
+
+def test_ring_overwrites_oldest_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), capacity=3)
+    for i in range(5):
+        cache.add(unit(i), "code", str(i), "m")
+    assert len(cache) == 3
+
+    # A fresh replay skips the lines whose ring slot has been reused
+    warm = DiskCache(str(tmp_path), capacity=3)
+    assert len(warm) == 3
+    assert warm.lookup(unit(0), "code", 0.9) is None
+    assert warm.lookup(unit(1), "code", 0.9) is None
+    assert [warm.lookup(unit(i), "code", 0.9).response for i in (2, 3, 4)] == ["2", "3", "4"]
+
+def test_log_is_compacted_to_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, "COMPACT_FACTOR", 2)
+    cache = DiskCache(str(tmp_path), capacity=2)
+    for i in range(5):
+        cache.add(unit(i), "code", str(i), "m")
+
+    with open(tmp_path / "entries.jsonl") as f:
+        assert len(f.readlines()) <= 2 * 2
+    warm = DiskCache(str(tmp_path), capacity=2)
+    assert [warm.lookup(unit(i), "code", 0.9).response for i in (3, 4)] == ["3", "4"]
+
+def test_reader_follows_compaction_by_another_instance(tmp_path):
+    first = DiskCache(str(tmp_path), capacity=2)
+    second = DiskCache(str(tmp_path), capacity=2)
+    first.add(unit(0), "code", "a", "m")
+    first.snapshot()
+    first.add(unit(1), "code", "b", "m")
+
+    assert second.lookup(unit(1), "code", 0.9).response == "b"
+
+def test_capacity_mismatch_is_rejected(tmp_path):
+    DiskCache(str(tmp_path), capacity=4).add(unit(0), "code", "a", "m")
+    with pytest.raises(ValueError):
+        DiskCache(str(tmp_path), capacity=8)
+
+def test_clear_removes_files_and_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), capacity=4)
+    cache.add(unit(0), "code", "a", "m")
+    cache.clear()
+    assert len(cache) == 0
+    assert len(DiskCache(str(tmp_path), capacity=4)) == 0
@@ -0,0 +1,130 @@
+"""
+Tests for embeddings.py: memory and SQLite tiers, miss batching and
+cancellation of callers sharing a miss.
+"""
+
+import asyncio
+
+from embeddings import CachedEmbeddings
+
+# ------------------------------------------------------------------------------
+# StubEmbeddings
+# Returns [len(text), 1.0] per text after `delay` seconds and records the
+# texts of every upstream call. `short` drops that many vectors per call.
+# ------------------------------------------------------------------------------
+class StubEmbeddings:
+    def __init__(self, delay: float = 0.0, short: int = 0):
+        self.delay = delay
+        self.short = short
+        self.calls = []
+
+    def _vectors(self, texts: list) -> list:
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts][:len(texts) - self.short]
+
+    async def aembed_documents(self, texts: list) -> list:
+        await asyncio.sleep(self.delay)
+        return self._vectors(texts)
+
+    def embed_documents(self, texts: list) -> list:
+        return self._vectors(texts)
+
+def test_memory_tier_serves_repeats():
+    base = StubEmbeddings()
+    memo = CachedEmbeddings(base, "m")
+
+    async def main():
+        first = await memo.aembed_documents(["a", "bb", "a"])
+        return first, await memo.aembed_query("bb")
+
+    first, again = asyncio.run(main())
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]] and again == [2.0, 1.0]
+    assert base.calls == [["a", "bb"]]
+    assert memo.stats()["memory_hits"] == 1 and memo.stats()["misses"] == 2
+
+def test_model_name_is_part_of_the_key():
+    assert CachedEmbeddings(None, "m1").key("a") != CachedEmbeddings(None, "m2").key("a")
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+
+    async def main():
+        await CachedEmbeddings(StubEmbeddings(), "m", disk_path=path).aembed_documents(["a", "bb"])
+        await asyncio.sleep(0.05)   # let the write-behind finish
+        base = StubEmbeddings()
+        memo = CachedEmbeddings(base, "m", disk_path=path)
+        return base, memo, await memo.aembed_documents(["a", "bb", "ccc"])
+
+    base, memo, vectors = asyncio.run(main())
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert base.calls == [["ccc"]]
+    assert memo.stats()["disk_hits"] == 2 and memo.stats()["disk_errors"] == 0
+
+def test_sync_path_shares_the_tiers(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    base = StubEmbeddings()
+    CachedEmbeddings(base, "m", disk_path=path).embed_documents(["a"])
+    memo = CachedEmbeddings(base, "m", disk_path=path)
+    assert memo.embed_query("a") == [1.0, 1.0] and memo.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert base.calls == [["a"]]
+    assert (memo.stats()["disk_hits"], memo.stats()["memory_hits"]) == (1, 1)
+
+def test_concurrent_misses_share_one_upstream_call():
+    base = StubEmbeddings(delay=0.01)
+    memo = CachedEmbeddings(base, "m", batch_window=0.01)
+
+    async def main():
+        return await asyncio.gather(memo.aembed_query("a"), memo.aembed_query("bb"), memo.aembed_query("a"))
+
+    assert asyncio.run(main()) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert base.calls == [["a", "bb"]]
+    assert memo.stats()["upstream_calls"] == 1
+
+def test_max_batch_flushes_early():
+    base = StubEmbeddings()
+    memo = CachedEmbeddings(base, "m", batch_window=10, max_batch=2)
+
+    async def main():
+        return await asyncio.wait_for(memo.aembed_documents(["a", "bb"]), 1)
+
+    assert asyncio.run(main()) == [[1.0, 1.0], [2.0, 1.0]]
+
+def test_cancelled_caller_does_not_fail_the_others():
+    base = StubEmbeddings(delay=0.02)
+    memo = CachedEmbeddings(base, "m", batch_window=0.005)
+
+    async def main():
+        cancelled = asyncio.create_task(memo.aembed_query("alpha"))
+        shared = asyncio.create_task(memo.aembed_query("alpha"))
+        other = asyncio.create_task(memo.aembed_query("beta"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        return cancelled, await shared, await other
+
+    cancelled, shared, other = asyncio.run(main())
+    assert cancelled.cancelled()
+    assert shared == [5.0, 1.0] and other == [4.0, 1.0]
+
+def test_upstream_errors_reach_every_waiter_and_release_the_key():
+    class Failing(StubEmbeddings):
+        async def aembed_documents(self, texts):
+            raise RuntimeError("quota")
+
+    memo = CachedEmbeddings(Failing(), "m")
+
+    async def main():
+        results = await asyncio.gather(memo.aembed_query("a"), memo.aembed_query("a"), return_exceptions=True)
+        return results, len(memo._inflight)
+
+    results, inflight = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results) and inflight == 0
+
+def test_short_upstream_response_fails_the_missing_texts():
+    memo = CachedEmbeddings(StubEmbeddings(short=1), "m")
+
+    async def main():
+        return await asyncio.gather(memo.aembed_query("a"), memo.aembed_query("bb"), return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert first == [1.0, 1.0]
+    assert isinstance(second, RuntimeError) and not memo._inflight
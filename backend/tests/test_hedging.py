@@ -0,0 +1,123 @@
+"""
+Tests for hedging.py: hedge winners, loser cancellation, fallbacks,
+deadlines and the first-token latency window.
+"""
+
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from hedging import DeadlineExceeded, Hedger
+
+# ------------------------------------------------------------------------------
+# Stub models: `delays` maps model -> seconds before its first chunk, or an
+# exception to raise. Started and cancelled attempts are recorded.
+# ------------------------------------------------------------------------------
+class Models:
+    def __init__(self, delays: dict):
+        self.delays = delays
+        self.started = []
+        self.cancelled = []
+
+    def start(self, model: str):
+        self.started.append(model)
+        return self._chunks(model)
+
+    async def _chunks(self, model: str):
+        try:
+            delay = self.delays[model]
+            if isinstance(delay, Exception):
+                raise delay
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content=f"{model} ")
+            yield AIMessageChunk(content="done")
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+
+def hedger(**kwargs) -> Hedger:
+    options = {"default_delay": 0.02, "min_delay": 0.0, "deadline": 1.0}
+    options.update(kwargs)
+    return Hedger({"primary": "secondary"}, **options)
+
+def run(h: Hedger, models: Models, **kwargs):
+    async def main():
+        model, attempt = await h.run("primary", models.start, **kwargs)
+        await asyncio.sleep(0)   # let cancelled losers unwind
+        return model, attempt
+
+    return asyncio.run(main())
+
+def test_fast_primary_is_not_hedged():
+    h, models = hedger(), Models({"primary": 0.0, "secondary": 0.0})
+    model, attempt = run(h, models)
+    assert model == "primary" and attempt.message.content == "primary done"
+    assert models.started == ["primary"]
+    assert h.counts["hedged"] == 0
+
+def test_slow_primary_is_hedged_and_cancelled_when_secondary_wins():
+    h, models = hedger(), Models({"primary": 0.5, "secondary": 0.0})
+    model, attempt = run(h, models)
+    assert model == "secondary" and attempt.message.content == "secondary done"
+    assert models.started == ["primary", "secondary"]
+    assert models.cancelled == ["primary"]
+    assert h.counts["hedged"] == 1 and h.counts["secondary_wins"] == 1
+
+def test_primary_can_still_win_after_the_hedge():
+    h, models = hedger(), Models({"primary": 0.05, "secondary": 0.5})
+    model, _ = run(h, models)
+    assert model == "primary"
+    assert models.cancelled == ["secondary"]
+    assert h.counts["hedged"] == 1 and h.counts["secondary_wins"] == 0
+
+def test_first_token_mode_commits_to_the_first_stream():
+    h, models = hedger(), Models({"primary": 0.5, "secondary": 0.0})
+    model, attempt = run(h, models, until="first_token")
+    assert model == "secondary" and attempt.ttft is not None
+
+def test_failed_primary_falls_back_to_secondary():
+    h, models = hedger(default_delay=1.0), Models({"primary": RuntimeError("down"), "secondary": 0.0})
+    model, _ = run(h, models)
+    assert model == "secondary"
+    assert h.counts["fallbacks"] == 1 and h.counts["hedged"] == 0
+
+def test_error_is_raised_when_every_attempt_fails():
+    h = hedger(default_delay=1.0)
+    models = Models({"primary": RuntimeError("primary down"), "secondary": RuntimeError("secondary down")})
+    with pytest.raises(RuntimeError, match="primary down"):
+        run(h, models)
+
+def test_hedge_false_runs_the_primary_alone():
+    h, models = hedger(), Models({"primary": 0.1, "secondary": 0.0})
+    model, _ = run(h, models, hedge=False)
+    assert model == "primary" and models.started == ["primary"]
+
+def test_deadline_cancels_attempts_and_records_censored_samples():
+    h, models = hedger(deadline=0.1, default_delay=0.06), Models({"primary": 1.0, "secondary": 1.0})
+    with pytest.raises(DeadlineExceeded):
+        run(h, models)
+    assert sorted(models.cancelled) == ["primary", "secondary"]
+    assert h.counts["deadline_exceeded"] == 1
+    # The primary waited past its hedge delay; the secondary only ~0.04s
+    assert h.counts["censored_samples"] == 1
+    assert h._ttft["primary"][0] >= 0.06 and "secondary" not in h._ttft
+
+def test_late_secondary_loser_adds_no_sample():
+    h, models = hedger(default_delay=0.1), Models({"primary": 0.13, "secondary": 1.0})
+    for _ in range(3):
+        model, _ = run(h, models)
+        assert model == "primary"
+    assert models.cancelled == ["secondary"] * 3
+    assert len(h._ttft["primary"]) == 3 and "secondary" not in h._ttft
+    assert h.counts["censored_samples"] == 0
+
+def test_hedge_delay_follows_the_latency_percentile():
+    h = hedger(min_samples=10, percentile=90, min_delay=0.1, max_delay=2.0)
+    assert h.delay("primary") == 0.02   # default until enough samples
+    for i in range(1, 11):
+        h.record("primary", i / 10)
+    assert h.delay("primary") == pytest.approx(0.91)
+    for _ in range(100):
+        h.record("primary", 10.0)
+    assert h.delay("primary") == 2.0
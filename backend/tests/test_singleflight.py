@@ -0,0 +1,109 @@
+"""
+Tests for singleflight.py, prompt coalescing and the batch router limits
+in utils.py.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_run():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        return flights, results
+
+    flights, results = asyncio.run(main())
+    assert calls == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == "result" for result, _ in results)
+    assert flights.coalesced == 4 and len(flights) == 0
+
+def test_distinct_keys_run_separately():
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(flights.do(("a", "p"), lambda: asyncio.sleep(0, "a")),
+                                    flights.do(("b", "p"), lambda: asyncio.sleep(0, "b")))
+
+    assert asyncio.run(main()) == [("a", False), ("b", False)]
+
+def test_errors_reach_every_caller_and_release_the_key():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(flights.do("key", fail), flights.do("key", fail), return_exceptions=True)
+        assert len(flights) == 0
+        return results, await flights.do("key", lambda: asyncio.sleep(0, "again"))
+
+    results, retry = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == ("again", False)
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        flights = SingleFlight()
+        leader = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("done", True)
+
+# ======================== Batch router ========================
+
+def test_dedupe_vectors_groups_near_duplicates():
+    import utils
+
+    vectors = np.array([[1, 0], [0.99, 0.01], [0, 1], [0.01, 0.99], [1, 1]], dtype=np.float32)
+    assert utils.dedupe_vectors(vectors, 0.98) == [0, 0, 2, 2, 4]
+
+def test_batch_over_the_limit_is_rejected(monkeypatch):
+    import utils
+
+    monkeypatch.setattr(utils, "BATCH_MAX_PROMPTS", 2)
+    with pytest.raises(utils.BatchTooLarge):
+        asyncio.run(utils.route_prompt_batch(["a", "b", "c"]))
+
+def test_identical_prompts_from_different_users_share_one_generation(monkeypatch):
+    import utils
+
+    runs, hits = [], []
+
+    async def route(prompt, email):
+        runs.append(email)
+        await asyncio.sleep(0.01)
+        return "code", "answer", 90, "gpt-4o", False
+
+    async def log_cache_hit(intent, model, email=None):
+        hits.append(email)
+
+    monkeypatch.setattr(utils, "_route_prompt", route)
+    monkeypatch.setattr(utils, "log_cache_hit", log_cache_hit)
+
+    async def main():
+        return await asyncio.gather(utils.route_prompt("sort a list", "a@b.c"),
+                                    utils.route_prompt(" sort a list ", "x@y.z"))
+
+    first, second = asyncio.run(main())
+    assert runs == ["a@b.c"] and hits == ["x@y.z"]
+    assert first[-1] is False and second[-1] is True and first[:4] == second[:4]
@@ -0,0 +1,135 @@
+"""
+Tests for speculation.py: claiming, TTL and capacity eviction, the
+budget, and deferred logging of speculative enhancements in utils.py.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import speculation
+from speculation import Speculator
+
+async def result(value, delay: float = 0.0):
+    await asyncio.sleep(delay)
+    return value
+
+async def failure():
+    raise RuntimeError("boom")
+
+def test_result_is_claimed_once():
+    async def main():
+        speculator = Speculator()
+        assert speculator.start("prompt", "a@b.c", lambda: result("enhanced"))
+        assert not speculator.start("prompt", "a@b.c", lambda: result("again"))   # already stored
+        first = await speculator.claim("prompt ", "a@b.c")
+        second = await speculator.claim("prompt", "a@b.c")
+        other_user = await speculator.claim("prompt", "x@y.z")
+        return speculator, first, second, other_user
+
+    speculator, first, second, other_user = asyncio.run(main())
+    assert (first, second, other_user) == ("enhanced", None, None)
+    assert speculator.counts["claimed"] == 1 and speculator.counts["started"] == 1
+
+def test_claim_waits_for_a_running_enhancement():
+    async def main():
+        speculator = Speculator()
+        speculator.start("prompt", None, lambda: result("slow", 0.02))
+        return await speculator.claim("prompt", None)
+
+    assert asyncio.run(main()) == "slow"
+
+def test_failed_enhancement_claims_as_none():
+    async def main():
+        speculator = Speculator()
+        speculator.start("prompt", None, failure)
+        await asyncio.sleep(0.01)
+        return speculator, await speculator.claim("prompt", None)
+
+    speculator, claimed = asyncio.run(main())
+    assert claimed is None and speculator.counts["failed"] == 1
+
+def test_ttl_expires_and_cancels_unclaimed_results(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(speculation, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def main():
+        speculator = Speculator(ttl=10)
+        speculator.start("prompt", None, lambda: result("late", 60))
+        task = speculator._entries[next(iter(speculator._entries))][1]
+        now[0] += 11
+        claimed = await speculator.claim("prompt", None)
+        await asyncio.sleep(0)
+        return speculator, claimed, task
+
+    speculator, claimed, task = asyncio.run(main())
+    assert claimed is None and task.cancelled()
+    assert speculator.counts["expired"] == 1 and speculator.stats()["in_flight"] == 0
+
+def test_capacity_drops_the_oldest_result():
+    async def main():
+        speculator = Speculator(capacity=2, per_minute=100, max_in_flight=10)
+        for prompt in ("a", "b", "c"):
+            speculator.start(prompt, None, lambda p=prompt: result(p))
+        return speculator, [await speculator.claim(p, None) for p in ("a", "b", "c")]
+
+    speculator, claimed = asyncio.run(main())
+    assert claimed == [None, "b", "c"] and speculator.counts["expired"] == 1
+
+def test_budget_limits_in_flight_runs_and_rate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(speculation, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def main():
+        speculator = Speculator(max_in_flight=1, per_minute=2)
+        assert speculator.start("a", None, lambda: result("a", 0.01))
+        assert not speculator.start("b", None, lambda: result("b"))   # one already running
+        await speculator.claim("a", None)
+        assert speculator.start("c", None, lambda: result("c"))
+        await speculator.claim("c", None)
+        assert not speculator.start("d", None, lambda: result("d"))   # per-minute budget spent
+        now[0] += 30                                                   # refills one start
+        assert speculator.start("e", None, lambda: result("e"))
+        await speculator.claim("e", None)
+        return speculator
+
+    assert asyncio.run(main()).counts["skipped"] == 2
+
+def test_busy_foreground_skips_speculation():
+    async def main():
+        speculator = Speculator(busy=lambda: True)
+        return speculator.start("prompt", None, lambda: result("x"))
+
+    assert asyncio.run(main()) is False
+
+# ======================== Pipeline ========================
+
+def test_speculative_enhancement_is_logged_only_when_claimed(monkeypatch):
+    import utils
+
+    logged = []
+
+    async def log_to_neo4j(*args):
+        logged.append(args)
+        return "response-id"
+
+    monkeypatch.setattr(utils, "log_to_neo4j", log_to_neo4j)
+    monkeypatch.setattr(utils, "COT_DEFERRED", False)
+
+    async def main():
+        await utils.ensure_clients()
+        try:
+            vec = await utils.embedding_model.aembed_query("explain recursion")
+            cached = len(utils.CACHE)
+            result, publish = await utils.speculative_enhance("explain recursion", "a@b.c", "explain", vec)
+            assert logged == [] and len(utils.CACHE) == cached
+
+            await publish()
+            assert len(utils.CACHE) == cached + 1
+            return result
+        finally:
+            await utils.close_clients()
+
+    intent, response, score, model = asyncio.run(main())
+    assert len(logged) == 1
+    assert logged[0][:3] == ("explain recursion", intent, response)
+    assert logged[0][-1] == "enhance_speculative"